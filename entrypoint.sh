@@ -14,12 +14,18 @@ shutdown() {
 # Trap SIGTERM and SIGINT
 trap shutdown SIGTERM SIGINT
 
-echo "Starting Flask API..."
-python api.py &
+echo "Starting web API..."
+gunicorn --config gunicorn.conf.py api:app &
 API_PID=$!
 
-echo "Starting Discord Bot..."
-python bot.py &
+# CLUSTER_PROCESSES > 1 splits the shards across several bot processes
+if [ "${CLUSTER_PROCESSES:-1}" -gt 1 ]; then
+    echo "Starting Discord Bot cluster with ${CLUSTER_PROCESSES} processes..."
+    python cluster.py &
+else
+    echo "Starting Discord Bot..."
+    python bot.py &
+fi
 BOT_PID=$!
 
 echo "Both services started. API PID: $API_PID, Bot PID: $BOT_PID"
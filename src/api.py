@@ -1,8 +1,59 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, render_template_string
+from flask import Flask, jsonify, make_response, render_template_string, request, url_for
+import functools
+import gzip
+import os
 import sqlite3
+import threading
+from datetime import datetime, timezone
+from database import LRUCache
+from export import (
+    EXPORT_FORMATS,
+    QUESTION_COLUMNS,
+    VOTE_COLUMNS,
+    connect_readonly,
+    encode_rows,
+    parse_since,
+    question_chunks,
+    vote_chunks,
+)
 
 app = Flask(__name__)
+app.config["DATABASE"] = os.getenv("WYR_DB_PATH", "wyr_bot.db")
+
+# Applied once to every read connection. The API never writes, so under WAL
+# its reads never wait on the bot's writers or hold them up.
+READ_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",  # 16 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB memory-mapped I/O
+)
+
+# Each worker thread keeps its own read-only connection per database path
+_local = threading.local()
+
+# Rendered responses, gzipped, keyed by URL and database revision. Entries for
+# older revisions are never looked up again and age out of the LRU.
+response_cache = LRUCache(256)
+response_cache_lock = threading.Lock()
+
+# Questions per page, when not given and at most
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# One page of questions with their tallies, keyset paginated on id so every page costs the same.
+# The category filter is spliced in rather than OR'd with NULL so SQLite can use idx_questions_category.
+QUESTIONS_PAGE = """
+    SELECT q.id, q.question, q.option_a, q.option_b, q.category,
+           COALESCE(s.a_votes, 0) AS a_votes, COALESCE(s.b_votes, 0) AS b_votes
+    FROM questions q
+    LEFT JOIN question_stats s ON s.question_id = q.id
+    WHERE q.id > :after {category_filter}
+    ORDER BY q.id
+    LIMIT :limit
+"""
+CATEGORY_FILTER = "AND q.category = :category"
 
 # HTML template for displaying questions
 HTML_TEMPLATE = """
@@ -163,6 +214,22 @@ HTML_TEMPLATE = """
             font-size: 0.85em;
         }
 
+        .pagination {
+            display: flex;
+            justify-content: center;
+            gap: 15px;
+            margin-bottom: 30px;
+        }
+
+        .pagination a {
+            background: white;
+            color: #667eea;
+            padding: 10px 20px;
+            border-radius: 20px;
+            font-weight: bold;
+            text-decoration: none;
+        }
+
         @media (max-width: 768px) {
             .questions-grid {
                 grid-template-columns: 1fr;
@@ -180,6 +247,7 @@ HTML_TEMPLATE = """
         <p class="subtitle">Browse all questions in the database</p>
 
         <div class="stats">
+            {% if category %}Category: <strong>{{ category }}</strong> | {% endif %}
             =� Total Questions: <strong>{{ total_questions }}</strong> |
             =� Total Votes: <strong>{{ total_votes }}</strong>
         </div>
@@ -213,6 +281,11 @@ HTML_TEMPLATE = """
             </div>
             {% endfor %}
         </div>
+
+        <div class="pagination">
+            {% if after %}<a href="{{ first_url }}">First page</a>{% endif %}
+            {% if next_url %}<a href="{{ next_url }}">Next page</a>{% endif %}
+        </div>
     </div>
 </body>
 </html>
@@ -220,59 +293,185 @@ HTML_TEMPLATE = """
 
 
 def get_db_connection():
-    """Create a database connection"""
-    conn = sqlite3.connect("wyr_bot.db")
-    conn.row_factory = sqlite3.Row
+    """This thread's read-only connection to the database, opened on first use and kept open"""
+    path = app.config["DATABASE"]
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = connect_readonly(path)
+        conn.row_factory = sqlite3.Row
+        for pragma in READ_PRAGMAS:
+            conn.execute(pragma)
+        connections[path] = conn
     return conn
 
 
+def close_db_connections():
+    """Close this thread's read connections"""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+def get_revision(conn):
+    """The database revision and when it last changed, bumped by triggers on every question or tally change"""
+    revision, changed_at = conn.execute("SELECT revision, changed_at FROM db_revision WHERE id = 1").fetchone()
+    return revision, datetime.strptime(changed_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+def cached_by_revision(view):
+    """Serve a view from the response cache until the database changes
+
+    Responses carry an ETag and Last-Modified for the current revision, and
+    clients revalidating with either get a 304 without the view running.
+    Bodies are cached gzipped and only decompressed for clients that don't
+    accept gzip.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        revision, changed_at = get_revision(get_db_connection())
+        etag = str(revision)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = request.if_modified_since is not None and request.if_modified_since >= changed_at
+        if not_modified:
+            return revalidated(app.response_class(status=304), etag, changed_at)
+
+        key = (app.config["DATABASE"], request.full_path, revision)
+        with response_cache_lock:
+            entry = response_cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = (gzip.compress(response.get_data(), compresslevel=6), response.mimetype)
+            with response_cache_lock:
+                response_cache.put(key, entry)
+
+        body, mimetype = entry
+        if "gzip" in request.accept_encodings:
+            response = app.response_class(body, mimetype=mimetype)
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = app.response_class(gzip.decompress(body), mimetype=mimetype)
+        response.vary.add("Accept-Encoding")
+        return revalidated(response, etag, changed_at)
+
+    return wrapper
+
+
+def revalidated(response, etag, changed_at):
+    """Add the validators for the current revision, and make clients check them before reusing a copy"""
+    response.set_etag(etag, weak=True)
+    response.last_modified = changed_at
+    response.cache_control.no_cache = True
+    return response
+
+
+def page_args():
+    """Read the after cursor, page size and category filter from the query string"""
+    after = max(request.args.get("after", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    category = request.args.get("category") or None
+    return after, limit, category
+
+
+def get_questions_page(conn, after, limit, category=None):
+    """Get up to limit questions after an id with their tallies, and the cursor for the next page
+
+    The cursor is None on the last page.
+    """
+    # Fetch one extra row to know whether there is another page
+    query = QUESTIONS_PAGE.format(category_filter=CATEGORY_FILTER if category else "")
+    rows = conn.execute(query, {"after": after, "limit": limit + 1, "category": category}).fetchall()
+    questions = [dict(row) for row in rows[:limit]]
+    next_after = questions[-1]["id"] if len(rows) > limit else None
+    return questions, next_after
+
+
 @app.route("/")
+@cached_by_revision
 def index():
-    """Display all questions from the database"""
+    """Display a page of questions from the database"""
+    after, limit, category = page_args()
     conn = get_db_connection()
+    questions, next_after = get_questions_page(conn, after, limit, category)
+    if category:
+        total_questions = conn.execute("SELECT COUNT(*) FROM questions WHERE category = ?", (category,)).fetchone()[0]
+    else:
+        total_questions = conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+    total_votes = conn.execute("SELECT COALESCE(SUM(a_votes + b_votes), 0) FROM question_stats").fetchone()[0]
 
-    # Get all questions
-    questions = conn.execute("SELECT id, question, option_a, option_b, category FROM questions ORDER BY id").fetchall()
-
-    # Get vote counts for each question
-    questions_with_votes = []
-    total_votes = 0
-
-    for q in questions:
-        # Get vote counts for this question
-        votes = conn.execute(
-            "SELECT choice, COUNT(*) as count FROM votes WHERE question_id = ? GROUP BY choice", (q["id"],)
-        ).fetchall()
-
-        a_votes = 0
-        b_votes = 0
-
-        for vote in votes:
-            if vote["choice"] == "a":
-                a_votes = vote["count"]
-            elif vote["choice"] == "b":
-                b_votes = vote["count"]
-
-        total_votes += a_votes + b_votes
-
-        questions_with_votes.append(
-            {
-                "id": q["id"],
-                "question": q["question"],
-                "option_a": q["option_a"],
-                "option_b": q["option_b"],
-                "category": q["category"],
-                "a_votes": a_votes,
-                "b_votes": b_votes,
-            }
-        )
+    return render_template_string(
+        HTML_TEMPLATE,
+        questions=questions,
+        total_questions=total_questions,
+        total_votes=total_votes,
+        category=category,
+        after=after,
+        first_url=url_for("index", limit=limit, category=category),
+        next_url=next_after and url_for("index", after=next_after, limit=limit, category=category),
+    )
 
-    conn.close()
 
-    return render_template_string(
-        HTML_TEMPLATE, questions=questions_with_votes, total_questions=len(questions_with_votes), total_votes=total_votes
+@app.route("/api/questions")
+@cached_by_revision
+def api_questions():
+    """A page of questions with their tallies as JSON, continue with ?after=<next_after>"""
+    after, limit, category = page_args()
+    questions, next_after = get_questions_page(get_db_connection(), after, limit, category)
+
+    return jsonify(questions=questions, next_after=next_after, limit=limit)
+
+
+def export_args():
+    """Read the export format (csv or ndjson, default ndjson) and since timestamp, ValueError if either is bad"""
+    file_format = request.args.get("format", "ndjson")
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError("format must be csv or ndjson")
+    try:
+        since = parse_since(request.args.get("since"))
+    except ValueError:
+        raise ValueError("since must be an ISO date or timestamp, e.g. 2026-03-01T18:30:00")
+    return file_format, since
+
+
+def export_response(name, file_format, chunks, columns):
+    """Stream an export chunk by chunk as a download, without ever holding it all in memory"""
+    return app.response_class(
+        encode_rows(chunks, columns, file_format),
+        mimetype=EXPORT_FORMATS[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{file_format}"'},
     )
 
 
+@app.route("/api/export/votes")
+def export_votes():
+    """Every vote, oldest first, or only those cast at or after ?since= for incremental exports"""
+    try:
+        file_format, since = export_args()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return export_response("votes", file_format, vote_chunks(get_db_connection(), since), VOTE_COLUMNS)
+
+
+@app.route("/api/export/questions")
+def export_questions():
+    """Every question with its tallies in id order, or only those after ?after=<id>"""
+    try:
+        file_format, _ = export_args()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    after = max(request.args.get("after", 0, type=int), 0)
+    return export_response("questions", file_format, question_chunks(get_db_connection(), after), QUESTION_COLUMNS)
+
+
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Development server only, production runs under gunicorn with gunicorn.conf.py
+    app.run(host="0.0.0.0", port=5000)
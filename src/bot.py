@@ -1,67 +1,148 @@
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ui import Button, View
 import os
 from dotenv import load_dotenv
 import asyncio
-from datetime import time as dt_time
-from database import Database
+import io
+import time
+from typing import Optional
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from database import Database, question_file_format
+from cluster import owns_guild, parse_shard_ids
+from coalescer import EditCoalescer
+from commandsync import sync_command_tree
+from fanout import fan_out, summarize
+from responder import Responder
+from scheduler import DailyScheduler, parse_daily_time
+from stream import ChangeFeed, start_stream_server
+from usernames import UsernameResolver
 
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
+# SQLite database shared with the web API
+DB_PATH = os.getenv("WYR_DB_PATH", "wyr_bot.db")
+
+# Optional write-behind vote buffer: votes are acknowledged from memory and group-committed
+BUFFERED_VOTES = os.getenv("WYR_BUFFERED_VOTES", "0") == "1"
+VOTE_FLUSH_MS = int(os.getenv("WYR_VOTE_FLUSH_MS", "50"))
+VOTE_FLUSH_BATCH = int(os.getenv("WYR_VOTE_FLUSH_BATCH", "500"))
+
+# Daily post fan-out: parallel sends, kept under Discord's global limit of 50 requests/second
+DAILY_POST_CONCURRENCY = int(os.getenv("WYR_DAILY_CONCURRENCY", "10"))
+DAILY_POST_RATE = 40
+
+# Live results edits: at most one edit per message per interval, always with the latest tally
+RESULTS_EDIT_MS = int(os.getenv("WYR_RESULTS_EDIT_MS", "1500"))
+
+# Handlers defer before doing their work once it typically takes longer than this
+ACK_BUDGET_MS = int(os.getenv("WYR_ACK_BUDGET_MS", "1000"))
+
+# Sync slash commands on startup even if the stored hashes say they're up to date
+FORCE_COMMAND_SYNC = os.getenv("WYR_FORCE_COMMAND_SYNC", "0") == "1"
+
+# Sharding: SHARD_COUNT=auto (or a number) runs auto-sharded, SHARD_IDS limits this process to some of them.
+# cluster.py starts one process per shard range with both set.
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS"))
+
+# Re-read questions and balances written by other processes this often (seconds, 0 to never)
+REFRESH_SECONDS = float(os.getenv("WYR_REFRESH_SECONDS", "30" if SHARD_IDS else "0"))
+
+# Live tally streams (Server-Sent Events) served from the bot process, 0 to disable.
+# A cluster process only sees its own shards' votes, so they are off in cluster mode.
+STREAM_PORT = int(os.getenv("WYR_STREAM_PORT", "0" if SHARD_IDS else "5001"))
+
 # Bot setup with intents
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        help_command=None,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        shard_ids=SHARD_IDS,
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
 
 # Initialize database
 db = None
+usernames = None
+edits = EditCoalescer(RESULTS_EDIT_MS / 1000)
+responder = Responder(budget=ACK_BUDGET_MS / 1000)
+feed = ChangeFeed()
+stream_runner = None
+
+# Per-guild daily post times; the wakeup event interrupts the sleep when a schedule changes
+scheduler = DailyScheduler()
+schedule_changed = asyncio.Event()
+scheduler_task = None
+
+
+async def render_live_results(question_row):
+    """Build the public question embed with the current vote tally"""
+    question_id, question, option_a, option_b, category = question_row
+    results = await db.get_question_results(question_id)
+    total_votes = results["a_votes"] + results["b_votes"]
+    a_percent = (results["a_votes"] / total_votes) * 100 if total_votes > 0 else 0
+    b_percent = (results["b_votes"] / total_votes) * 100 if total_votes > 0 else 0
 
+    embed = discord.Embed(title="Would You Rather?", description=question, color=discord.Color.blue())
 
-# Button view for voting
-class VoteView(View):
-    def __init__(self, question_id: int):
-        super().__init__(timeout=None)
+    if category:
+        embed.set_footer(text=f"Category: {category} | Total Votes: {total_votes}")
+
+    embed.add_field(name="👈 Option A", value=option_a, inline=False)
+    embed.add_field(name="👉 Option B", value=option_b, inline=False)
+    embed.add_field(
+        name="Live Results",
+        value=f"👈 {a_percent:.1f}% ({results['a_votes']} votes)\n" f"👉 {b_percent:.1f}% ({results['b_votes']} votes)",
+        inline=False,
+    )
+    return {"embed": embed}
+
+
+# Vote buttons carry their question in the custom_id, so one registered handler serves every
+# message ever posted, nothing is kept per message and old buttons keep working after a restart
+class VoteButton(discord.ui.DynamicItem[Button], template=r"wyr:vote:(?P<question_id>\d+):(?P<choice>[ab])"):
+    def __init__(self, question_id: int, choice: str):
         self.question_id = question_id
+        self.choice = choice
+        super().__init__(
+            Button(
+                label="Option A" if choice == "a" else "Option B",
+                style=discord.ButtonStyle.primary,
+                emoji="👈" if choice == "a" else "👉",
+                custom_id=f"wyr:vote:{question_id}:{choice}",
+            )
+        )
 
-    @discord.ui.button(label="Option A", style=discord.ButtonStyle.primary, emoji="👈")
-    async def vote_a(self, interaction: discord.Interaction, button: Button):
-        await self.process_vote(interaction, "a")
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match):
+        return cls(int(match["question_id"]), match["choice"])
 
-    @discord.ui.button(label="Option B", style=discord.ButtonStyle.primary, emoji="👉")
-    async def vote_b(self, interaction: discord.Interaction, button: Button):
-        await self.process_vote(interaction, "b")
+    async def callback(self, interaction: discord.Interaction):
+        await responder.run("vote", interaction, self.process_vote(interaction, self.choice), ephemeral=True)
 
     async def process_vote(self, interaction: discord.Interaction, choice: str):
-        # Check if user already voted on this question
         print(f"User: {interaction.user.id} is voting")
-        has_voted = await db.has_user_voted(interaction.user.id, self.question_id)
 
-        if has_voted:
-            await interaction.response.send_message("You've already voted on this question! 🗳️", ephemeral=True)
-            return
-
-        # Record the vote
-        await db.record_vote(interaction.user.id, self.question_id, choice)
-
-        # Award coins for voting
-        await db.award_coins(interaction.user.id, 10)
+        # Record the vote, award coins and update the streak in one go
+        outcome = await db.cast_vote(interaction.user.id, self.question_id, choice)
 
-        # Update streak
-        await db.update_streak(interaction.user.id)
+        if outcome is None:
+            return {"content": "You've already voted on this question! 🗳️", "ephemeral": True}
 
-        # Get updated results
-        results = await db.get_question_results(self.question_id)
+        results = outcome["results"]
         total_votes = results["a_votes"] + results["b_votes"]
 
-        # Get question details
-        question_data = await db.get_question_by_id(self.question_id)
-        _, question, option_a, option_b, category = question_data
-
         # Create results embed to show the user
         user_embed = discord.Embed(
             title="Thanks for voting!",
@@ -79,106 +160,190 @@ class VoteView(View):
             inline=False,
         )
 
-        user_embed.add_field(name="Reward", value=f"You earned 10 coins! 🪙", inline=False)
+        user_embed.add_field(name="Reward", value=f"You earned {outcome['coins']} coins! 🪙", inline=False)
 
-        # Send ephemeral response to voter
-        await interaction.response.send_message(embed=user_embed, ephemeral=True)
+        # Update the public message with the live tally, coalescing bursts of votes into one edit per interval
+        edits.submit(interaction.message, lambda: render_live_results(outcome["question"]))
 
-        # Update the original message with current vote counts
-        original_embed = discord.Embed(title="Would You Rather?", description=question, color=discord.Color.blue())
+        # Ephemeral response to voter
+        return {"embed": user_embed, "ephemeral": True}
 
-        if category:
-            original_embed.set_footer(text=f"Category: {category} | Total Votes: {total_votes}")
 
-        original_embed.add_field(name="👈 Option A", value=option_a, inline=False)
-        original_embed.add_field(name="👉 Option B", value=option_b, inline=False)
-        original_embed.add_field(
-            name="Live Results",
-            value=f"👈 {a_percent:.1f}% ({results['a_votes']} votes)\n" f"👉 {b_percent:.1f}% ({results['b_votes']} votes)",
-            inline=False,
-        )
+class VoteView(View):
+    """Option A/B buttons for a question"""
 
-        # Update the message to show live results, keep buttons active
-        try:
-            await interaction.message.edit(embed=original_embed, view=self)
-        except:
-            pass  # Message might have been deleted
+    def __init__(self, question_id: int):
+        super().__init__(timeout=None)
+        self.add_item(VoteButton(question_id, "a"))
+        self.add_item(VoteButton(question_id, "b"))
 
 
 # Daily question task
-@tasks.loop(time=dt_time(hour=12, minute=0))  # Runs at 12:00 PM UTC daily
-async def post_daily_question():
-    """Post a daily Would You Rather question to configured channels"""
-    if db is None:
-        return
+async def post_daily_question(jobs):
+    """Post a daily Would You Rather question to every guild whose time has come"""
+    started_at = time.monotonic()
 
-    # Get all guilds with daily questions enabled
-    daily_configs = await db.get_all_daily_channels()
+    channels = {job["guild_id"]: bot.get_channel(job["channel_id"]) for job in jobs}
+    channels = {guild_id: channel for guild_id, channel in channels.items() if channel is not None}
 
-    for guild_id, channel_id in daily_configs:
-        try:
-            channel = bot.get_channel(channel_id)
-            if channel is None:
-                continue
+    # Draw every guild's question from its shuffle bag in one batch
+    categories = {job["guild_id"]: job["category"] for job in jobs}
+    questions = await db.get_random_questions(channels, categories)
+
+    async def send(guild_id):
+        question_id, question, option_a, option_b, category = questions[guild_id]
 
-            # Get a random question
-            question_data = await db.get_random_question()
-            if not question_data:
-                continue
+        # Create embed
+        embed = discord.Embed(title="📅 Daily Would You Rather Question!", description=question, color=discord.Color.gold())
 
-            question_id, question, option_a, option_b, category = question_data
+        if category:
+            embed.set_footer(text=f"Category: {category} | Daily Question")
 
-            # Create embed
-            embed = discord.Embed(
-                title="📅 Daily Would You Rather Question!", description=question, color=discord.Color.gold()
-            )
+        embed.add_field(name="👈 Option A", value=option_a, inline=False)
+        embed.add_field(name="👉 Option B", value=option_b, inline=False)
+        embed.add_field(name="Vote to Earn Coins!", value="Click a button below to vote and earn 10 coins!", inline=False)
+
+        # Create voting buttons
+        view = VoteView(question_id)
+
+        # Post to channel
+        await channels[guild_id].send("@here It's time for the daily Would You Rather! 🎲", embed=embed, view=view)
+
+    # Send to every guild in parallel; a slow or failing guild doesn't hold up the others
+    results = await fan_out(
+        list(questions), send, concurrency=DAILY_POST_CONCURRENCY, rate=DAILY_POST_RATE, started_at=started_at
+    )
+
+    for result in results:
+        if not result["ok"]:
+            print(f"Error posting daily question to guild {result['target']}: {result['error']}")
 
-            if category:
-                embed.set_footer(text=f"Category: {category} | Daily Question")
+    summary = summarize(results)
+    print(
+        f"Posted daily question to {summary['delivered']}/{len(results)} guilds "
+        f"({summary['retried']} retried) - latency p50 {summary['p50']:.2f}s, "
+        f"p99 {summary['p99']:.2f}s, max {summary['max']:.2f}s"
+    )
+    return {result["target"] for result in results if result["ok"]}
 
-            embed.add_field(name="👈 Option A", value=option_a, inline=False)
-            embed.add_field(name="👉 Option B", value=option_b, inline=False)
-            embed.add_field(name="Vote to Earn Coins!", value="Click a button below to vote and earn 10 coins!", inline=False)
 
-            # Create voting buttons
-            view = VoteView(question_id)
+async def run_daily_scheduler():
+    """Sleep until the next guild's daily time, post to every guild that is due and repeat"""
+    for guild_id, channel_id, daily_time, tz_name, last_posted_date, category in await db.get_daily_schedules():
+        # In a cluster every process posts only to the guilds on its own shards
+        if not owns_guild(guild_id, bot.shard_count, getattr(bot, "shard_ids", None)):
+            continue
+        try:
+            scheduler.schedule(
+                guild_id, channel_id, daily_time or "12:00", tz_name or "UTC", last_posted_date, category=category
+            )
+        except (ValueError, ZoneInfoNotFoundError) as e:
+            print(f"Skipping invalid daily schedule for guild {guild_id}: {e}")
+    print(f"Daily question scheduler started with {len(scheduler)} guild(s)")
 
-            # Post to channel
-            await channel.send("@here It's time for the daily Would You Rather! 🎲", embed=embed, view=view)
-            print(f"Posted daily question to {channel.guild.name} - #{channel.name}")
+    while True:
+        schedule_changed.clear()
+        fire_at = scheduler.next_fire_at()
+        timeout = None if fire_at is None else (fire_at - datetime.now(timezone.utc)).total_seconds()
 
+        if timeout is None or timeout > 0:
+            try:
+                await asyncio.wait_for(schedule_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        jobs = scheduler.pop_due()
+        try:
+            delivered = await post_daily_question(jobs)
+            await db.mark_daily_posted({job["guild_id"]: job["local_date"] for job in jobs if job["guild_id"] in delivered})
         except Exception as e:
-            print(f"Error posting daily question to guild {guild_id}: {e}")
+            print(f"Error posting daily questions: {e}")
+
+        # Every due guild moves on to its next local day, delivered or not, so a dead channel can't spin the loop.
+        # Guilds reconfigured or disabled while posting already have their new schedule.
+        for job in jobs:
+            if scheduler.get(job["guild_id"]) is job:
+                scheduler.schedule(
+                    job["guild_id"],
+                    job["channel_id"],
+                    job["time"],
+                    job["timezone"],
+                    job["local_date"],
+                    category=job["category"],
+                )
+
+
+async def setup_hook():
+    """Open the database once per process, before the first gateway connection"""
+    global db, usernames, stream_runner
+    db = Database(
+        DB_PATH,
+        buffered_votes=BUFFERED_VOTES,
+        flush_interval=VOTE_FLUSH_MS / 1000,
+        flush_batch_size=VOTE_FLUSH_BATCH,
+        refresh_interval=REFRESH_SECONDS or None,
+    )
+    await db.initialize()
+    usernames = UsernameResolver(bot, db)
+
+    # Push every vote to the live tally streams
+    db.add_vote_listener(feed.publish)
+    if STREAM_PORT and stream_runner is None:
+        stream_runner = await start_stream_server(db, feed, port=STREAM_PORT)
+        print(f"Serving live tally streams on port {STREAM_PORT}")
+
+    # Route every vote and review button, including ones on messages sent before this restart
+    bot.add_dynamic_items(VoteButton, ApprovalButton)
+
+
+bot.setup_hook = setup_hook
 
 
 @bot.event
 async def on_ready():
     """Event triggered when bot successfully connects to Discord"""
-    global db
-    db = Database("wyr_bot.db")
-    await db.initialize()
+    global scheduler_task
 
-    # Sync slash commands to all guilds (faster than global sync)
+    # Sync slash commands to each guild for instant updates, and globally (takes up to 1 hour to propagate).
+    # on_ready fires on every reconnect, so only guilds that haven't seen this command tree are synced.
     try:
-        # Sync to each guild for instant updates
-        for guild in bot.guilds:
-            bot.tree.copy_global_to(guild=guild)
-            synced = await bot.tree.sync(guild=guild)
-            print(f"Synced {len(synced)} command(s) to {guild.name}")
-
-        # Also sync globally (takes up to 1 hour to propagate)
-        synced_global = await bot.tree.sync()
-        print(f"Synced {len(synced_global)} command(s) globally")
+        # The global command list is shared by every process, so only the one running shard 0 syncs it
+        shard_ids = getattr(bot, "shard_ids", None)
+        sync_global = not shard_ids or 0 in shard_ids
+        sync = await sync_command_tree(bot.tree, db, bot.guilds, force=FORCE_COMMAND_SYNC, sync_global=sync_global)
+        for result in sync["failed"]:
+            print(f"Failed to sync commands to {result['target'].name}: {result['error']}")
+        print(
+            f"Synced commands to {sync['synced']} guild(s), {sync['skipped']} already up to date"
+            + (", and globally" if sync["global"] else "")
+        )
     except Exception as e:
         print(f"Failed to sync commands: {e}")
 
-    # Start daily question task
-    if not post_daily_question.is_running():
-        post_daily_question.start()
-        print("Daily question task started!")
+    # Start daily question scheduler
+    if scheduler_task is None:
+        scheduler_task = asyncio.create_task(run_daily_scheduler())
 
     print(f"{bot.user} has connected to Discord!")
     print(f"Bot is in {len(bot.guilds)} guilds")
+    if getattr(bot, "shard_ids", None):
+        print(f"Running shards {bot.shard_ids} of {bot.shard_count}")
+
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    """Give a newly joined guild the slash commands straight away"""
+    try:
+        await sync_command_tree(bot.tree, db, [guild], sync_global=False)
+    except Exception as e:
+        print(f"Failed to sync commands to {guild.name}: {e}")
+
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    """Drop queued results edits for deleted messages"""
+    edits.discard(payload.message_id)
 
 
 @bot.tree.command(name="ping", description="Check bot latency")
@@ -188,14 +353,30 @@ async def ping(interaction: discord.Interaction):
     await interaction.response.send_message(f"Pong! 🏓 Latency: {round(bot.latency * 1000)}ms")
 
 
+async def category_autocomplete(interaction: discord.Interaction, current: str):
+    """Suggest categories matching what has been typed so far, from the database's in-memory list"""
+    current = current.casefold()
+    matches = [(name, count) for name, count in db.categories() if current in name.casefold()]
+    return [app_commands.Choice(name=f"{name} ({count})", value=name) for name, count in matches[:25]]
+
+
 @bot.tree.command(name="wyr", description="Get a random Would You Rather question")
-async def would_you_rather(interaction: discord.Interaction):
+@app_commands.describe(category="Only ask questions from this category")
+@app_commands.autocomplete(category=category_autocomplete)
+async def would_you_rather(interaction: discord.Interaction, category: Optional[str] = None):
     """Display a random Would You Rather question"""
-    question_data = await db.get_random_question()
+    await responder.run("wyr", interaction, would_you_rather_reply(interaction, category))
+
+
+async def would_you_rather_reply(interaction: discord.Interaction, category=None):
+    if category and db.resolve_category(category) is None:
+        return {"content": f"❌ There's no `{category}` category, pick one from the list.", "ephemeral": True}
+
+    # Prefer a question this user hasn't voted on yet
+    question_data = await db.get_random_question(interaction.guild_id, user_id=interaction.user.id, category=category)
 
     if not question_data:
-        await interaction.response.send_message("No questions available yet! Add some questions first.")
-        return
+        return {"content": "No questions available yet! Add some questions first."}
 
     question_id, question, option_a, option_b, category = question_data
 
@@ -211,7 +392,7 @@ async def would_you_rather(interaction: discord.Interaction):
     embed.add_field(name="👈 Option A", value=option_a, inline=False)
     embed.add_field(name="👉 Option B", value=option_b, inline=False)
 
-    # Always show buttons - the VoteView will handle if someone already voted
+    # Always show buttons - the vote handler will handle if someone already voted
     view = VoteView(question_id)
 
     # If user already voted, show them the results in the embed
@@ -236,7 +417,7 @@ async def would_you_rather(interaction: discord.Interaction):
                 )
             )
 
-    await interaction.response.send_message(embed=embed, view=view)
+    return {"embed": embed, "view": view}
 
 
 @bot.tree.command(name="balance", description="Check your coin balance and streak")
@@ -255,25 +436,49 @@ async def balance(interaction: discord.Interaction):
 @bot.tree.command(name="leaderboard", description="View the top 10 users by coins")
 async def leaderboard(interaction: discord.Interaction):
     """Show the top users by coins"""
+    await responder.run("leaderboard", interaction, leaderboard_reply())
+
+
+async def leaderboard_reply():
     top_users = await db.get_leaderboard(10)
 
     if not top_users:
-        await interaction.response.send_message("No users on the leaderboard yet!")
-        return
+        return {"content": "No users on the leaderboard yet!"}
 
     embed = discord.Embed(title="Leaderboard - Top 10", color=discord.Color.purple())
 
+    # Resolve every name at once instead of one REST call per row
+    names = await usernames.resolve([user_id for user_id, _, _ in top_users])
+
     description = ""
     for i, (user_id, coins, streak) in enumerate(top_users, 1):
-        try:
-            user = await bot.fetch_user(user_id)
-            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
-            description += f"{medal} **{user.name}** - 🪙 {coins} (🔥 {streak})\n"
-        except:
+        if user_id not in names:
             # Skip users that can't be fetched
             continue
+        medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
+        description += f"{medal} **{names[user_id]}** - 🪙 {coins} (🔥 {streak})\n"
 
     embed.description = description
+    return {"embed": embed}
+
+
+@bot.tree.command(name="rank", description="See where you rank on the leaderboard")
+async def rank(interaction: discord.Interaction):
+    """Show the user's exact leaderboard rank"""
+    standing = await db.get_rank(interaction.user.id)
+
+    if standing is None:
+        await interaction.response.send_message(
+            "You're not on the leaderboard yet! Vote on a question with `/wyr` to earn coins.", ephemeral=True
+        )
+        return
+
+    embed = discord.Embed(title=f"{interaction.user.name}'s Rank", color=discord.Color.purple())
+
+    embed.add_field(name="Rank", value=f"🏆 #{standing['rank']} of {standing['total']}", inline=True)
+    embed.add_field(name="Coins", value=f"🪙 {standing['coins']}", inline=True)
+    embed.add_field(name="Streak", value=f"🔥 {standing['streak']} days", inline=True)
+
     await interaction.response.send_message(embed=embed)
 
 
@@ -294,21 +499,86 @@ async def add_question(
         return
 
     try:
-        await db.add_question(question, option_a, option_b, category)
-        await interaction.response.send_message(f"✅ Question added successfully!\n**Category:** {category}", ephemeral=True)
+        if await db.add_question(question, option_a, option_b, category):
+            await interaction.response.send_message(
+                f"✅ Question added successfully!\n**Category:** {category}", ephemeral=True
+            )
+        else:
+            await interaction.response.send_message("⚠️ That question is already in the database.", ephemeral=True)
     except Exception as e:
         await interaction.response.send_message(f"❌ Error adding question: {str(e)}", ephemeral=True)
 
 
+@bot.tree.command(name="importquestions", description="Import questions from a CSV or JSONL file (Admin only)")
+@app_commands.describe(
+    file="CSV with question, option_a, option_b and category columns, or JSONL with the same keys",
+    category="Category for rows that don't name one (optional)",
+)
+async def import_questions(interaction: discord.Interaction, file: discord.Attachment, category: str = "General"):
+    """Bulk import questions from an attached file (Admin only)"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    try:
+        file_format = question_file_format(file.filename)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+
+    await responder.run("importquestions", interaction, import_questions_reply(file, file_format, category), ephemeral=True)
+
+
+async def import_questions_reply(file: discord.Attachment, file_format: str, category: str):
+    lines = io.StringIO((await file.read()).decode("utf-8-sig"), newline="")
+    result = await db.bulk_add_questions(lines, file_format, default_category=category)
+
+    embed = discord.Embed(
+        title="📥 Questions Imported",
+        description=f"Added **{result['added']}** of {result['read']} rows from `{file.filename}`",
+        color=discord.Color.green() if result["added"] else discord.Color.orange(),
+    )
+    embed.add_field(name="Duplicates Skipped", value=str(result["duplicates"]), inline=True)
+    embed.add_field(name="Invalid Rows", value=str(result["invalid"]), inline=True)
+    embed.add_field(
+        name="Speed", value=f"{result['rows_per_second']:,.0f} rows/sec ({result['seconds']:.2f}s)", inline=True
+    )
+    print(
+        f"Imported {result['added']}/{result['read']} questions from {file.filename} "
+        f"at {result['rows_per_second']:,.0f} rows/sec"
+    )
+    return {"embed": embed, "ephemeral": True}
+
+
 # Approval button view
-class ApprovalView(View):
-    def __init__(self, submission_id: int, submitter_id: int):
-        super().__init__(timeout=None)
+class ApprovalButton(
+    discord.ui.DynamicItem[Button],
+    template=r"wyr:review:(?P<action>approve|reject):(?P<submission_id>\d+):(?P<submitter_id>\d+)",
+):
+    def __init__(self, action: str, submission_id: int, submitter_id: int):
+        self.action = action
         self.submission_id = submission_id
         self.submitter_id = submitter_id
+        super().__init__(
+            Button(
+                label="Approve" if action == "approve" else "Reject",
+                style=discord.ButtonStyle.success if action == "approve" else discord.ButtonStyle.danger,
+                emoji="✅" if action == "approve" else "❌",
+                custom_id=f"wyr:review:{action}:{submission_id}:{submitter_id}",
+            )
+        )
 
-    @discord.ui.button(label="Approve", style=discord.ButtonStyle.success, emoji="✅")
-    async def approve(self, interaction: discord.Interaction, button: Button):
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match):
+        return cls(match["action"], int(match["submission_id"]), int(match["submitter_id"]))
+
+    async def callback(self, interaction: discord.Interaction):
+        if self.action == "approve":
+            await self.approve(interaction)
+        else:
+            await self.reject(interaction)
+
+    async def approve(self, interaction: discord.Interaction):
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("Only administrators can approve questions!", ephemeral=True)
             return
@@ -333,8 +603,7 @@ class ApprovalView(View):
         else:
             await interaction.response.send_message("❌ Failed to approve submission.", ephemeral=True)
 
-    @discord.ui.button(label="Reject", style=discord.ButtonStyle.danger, emoji="❌")
-    async def reject(self, interaction: discord.Interaction, button: Button):
+    async def reject(self, interaction: discord.Interaction):
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("Only administrators can reject questions!", ephemeral=True)
             return
@@ -357,6 +626,15 @@ class ApprovalView(View):
         await interaction.response.edit_message(embed=embed, view=None)
 
 
+class ApprovalView(View):
+    """Approve/Reject buttons for a pending submission"""
+
+    def __init__(self, submission_id: int, submitter_id: int):
+        super().__init__(timeout=None)
+        self.add_item(ApprovalButton("approve", submission_id, submitter_id))
+        self.add_item(ApprovalButton("reject", submission_id, submitter_id))
+
+
 @bot.tree.command(name="submit", description="Submit a Would You Rather question for approval")
 @app_commands.describe(
     question="The main question text",
@@ -394,23 +672,23 @@ async def view_pending(interaction: discord.Interaction):
         await interaction.response.send_message("Only administrators can view pending submissions!", ephemeral=True)
         return
 
+    await responder.run("pending", interaction, pending_reply(), ephemeral=True)
+
+
+async def pending_reply():
     submissions = await db.get_pending_submissions(5)  # Show 5 at a time
 
     if not submissions:
-        await interaction.response.send_message("No pending submissions! 🎉", ephemeral=True)
-        return
+        return {"content": "No pending submissions! 🎉", "ephemeral": True}
 
-    # Send defer since we might send multiple messages
-    await interaction.response.defer(ephemeral=True)
+    names = await usernames.resolve([submission[1] for submission in submissions])
 
+    # One message per submission, each with its own review buttons
+    replies = []
     for submission in submissions:
         sub_id, submitter_id, question, option_a, option_b, category, submitted_at = submission
 
-        try:
-            submitter = await bot.fetch_user(submitter_id)
-            submitter_name = submitter.name
-        except:
-            submitter_name = f"Unknown User (ID: {submitter_id})"
+        submitter_name = names.get(submitter_id, f"Unknown User (ID: {submitter_id})")
 
         embed = discord.Embed(title="Question Submission for Review", description=question, color=discord.Color.gold())
         embed.add_field(name="👈 Option A", value=option_a, inline=True)
@@ -421,7 +699,9 @@ async def view_pending(interaction: discord.Interaction):
         embed.set_footer(text=f"Submitted at: {submitted_at}")
 
         view = ApprovalView(sub_id, submitter_id)
-        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        replies.append({"embed": embed, "view": view, "ephemeral": True})
+
+    return replies
 
 
 @bot.tree.command(name="mysubmissions", description="View your submitted questions")
@@ -451,28 +731,70 @@ async def my_submissions(interaction: discord.Interaction):
 
 
 @bot.tree.command(name="setdaily", description="Set up daily questions (Admin only)")
-@app_commands.describe(channel="The channel where daily questions will be posted")
-async def set_daily(interaction: discord.Interaction, channel: discord.TextChannel):
-    """Set the channel for daily Would You Rather questions"""
+@app_commands.describe(
+    channel="The channel where daily questions will be posted",
+    post_time="Local time to post each day as HH:MM (default 12:00)",
+    tz_name="IANA timezone such as Europe/London or America/New_York (default UTC)",
+    category="Only post questions from this category (default any)",
+)
+@app_commands.rename(post_time="time", tz_name="timezone")
+@app_commands.autocomplete(category=category_autocomplete)
+async def set_daily(
+    interaction: discord.Interaction,
+    channel: discord.TextChannel,
+    post_time: str = "12:00",
+    tz_name: str = "UTC",
+    category: Optional[str] = None,
+):
+    """Set the channel and local time for daily Would You Rather questions"""
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("Only administrators can configure daily questions!", ephemeral=True)
         return
 
     try:
-        await db.set_daily_channel(interaction.guild.id, channel.id)
+        daily_time = parse_daily_time(post_time).strftime("%H:%M")
+    except ValueError:
+        await interaction.response.send_message("❌ Time must be HH:MM in 24-hour format, e.g. 18:30", ephemeral=True)
+        return
+
+    try:
+        ZoneInfo(tz_name)
+    except (ValueError, ZoneInfoNotFoundError):
+        await interaction.response.send_message(
+            f"❌ Unknown timezone `{tz_name}`, use a name like Europe/London", ephemeral=True
+        )
+        return
+
+    if category:
+        category = db.resolve_category(category)
+        if category is None:
+            await interaction.response.send_message("❌ Unknown category, pick one from the list", ephemeral=True)
+            return
+
+    try:
+        await db.set_daily_channel(interaction.guild.id, channel.id, daily_time, tz_name, category)
+        config = await db.get_daily_channel(interaction.guild.id)
+        fire_at = scheduler.schedule(
+            interaction.guild.id, channel.id, daily_time, tz_name, config["last_posted_date"], category=category
+        )
+        schedule_changed.set()
 
         embed = discord.Embed(
             title="✅ Daily Questions Enabled!",
-            description=f"Daily Would You Rather questions will be posted to {channel.mention} every day at 12:00 PM UTC.",
+            description=(
+                f"Daily Would You Rather questions will be posted to {channel.mention} every day at {daily_time} {tz_name}."
+            ),
             color=discord.Color.green(),
         )
+        if category:
+            embed.add_field(name="Category", value=category, inline=False)
         embed.add_field(
-            name="Next Question", value="The next question will post at the scheduled time tomorrow!", inline=False
+            name="Next Question", value=f"The next question will post {discord.utils.format_dt(fire_at, 'R')}!", inline=False
         )
         embed.add_field(name="Test It Now", value="Use `/testdaily` to post a test question immediately.", inline=False)
 
         await interaction.response.send_message(embed=embed)
-        print(f"Daily questions enabled for {interaction.guild.name} in #{channel.name}")
+        print(f"Daily questions enabled for {interaction.guild.name} in #{channel.name} at {daily_time} {tz_name}")
 
     except Exception as e:
         await interaction.response.send_message(f"❌ Error setting up daily questions: {str(e)}", ephemeral=True)
@@ -487,6 +809,8 @@ async def disable_daily(interaction: discord.Interaction):
 
     try:
         await db.disable_daily_questions(interaction.guild.id)
+        scheduler.cancel(interaction.guild.id)
+        schedule_changed.set()
 
         embed = discord.Embed(
             title="Daily Questions Disabled",
@@ -508,24 +832,27 @@ async def test_daily(interaction: discord.Interaction):
         await interaction.response.send_message("Only administrators can test daily questions!", ephemeral=True)
         return
 
+    await responder.run("testdaily", interaction, test_daily_reply(interaction), ephemeral=True)
+
+
+async def test_daily_reply(interaction: discord.Interaction):
     # Get the daily channel config
     config = await db.get_daily_channel(interaction.guild.id)
 
     if not config or not config["enabled"]:
-        await interaction.response.send_message("❌ Daily questions are not enabled! Use `/setdaily` first.", ephemeral=True)
-        return
+        return {"content": "❌ Daily questions are not enabled! Use `/setdaily` first.", "ephemeral": True}
 
     try:
         channel = bot.get_channel(config["channel_id"])
         if channel is None:
-            await interaction.response.send_message("❌ Configured channel not found!", ephemeral=True)
-            return
+            return {"content": "❌ Configured channel not found!", "ephemeral": True}
 
-        # Get a random question
-        question_data = await db.get_random_question()
+        # Get a random question, falling back to any category if the configured one is empty
+        question_data = await db.get_random_question(interaction.guild.id, category=config["category"])
+        if not question_data and config["category"]:
+            question_data = await db.get_random_question(interaction.guild.id)
         if not question_data:
-            await interaction.response.send_message("❌ No questions available!", ephemeral=True)
-            return
+            return {"content": "❌ No questions available!", "ephemeral": True}
 
         question_id, question, option_a, option_b, category = question_data
 
@@ -546,10 +873,55 @@ async def test_daily(interaction: discord.Interaction):
 
         # Post to channel
         await channel.send("@here It's time for the daily Would You Rather! 🎲 (This is a test)", embed=embed, view=view)
-        await interaction.response.send_message(f"✅ Test question posted to {channel.mention}!", ephemeral=True)
+        return {"content": f"✅ Test question posted to {channel.mention}!", "ephemeral": True}
 
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error posting test question: {str(e)}", ephemeral=True)
+        return {"content": f"❌ Error posting test question: {str(e)}", "ephemeral": True}
+
+
+@bot.tree.command(name="stats", description="Show response time statistics (Admin only)")
+async def stats(interaction: discord.Interaction):
+    """Show time-to-ack per handler and how many live-results edits were saved"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("Only administrators can view bot statistics!", ephemeral=True)
+        return
+
+    embed = discord.Embed(title="📊 Bot Statistics", color=discord.Color.blurple())
+
+    for name, handler in responder.stats().items():
+        ack, work = handler["ack"], handler["work"]
+        embed.add_field(
+            name=name,
+            value=f"Ack p50 {ack['p50'] * 1000:.0f}ms, p99 {ack['p99'] * 1000:.0f}ms\n"
+            f"Work p50 {work['p50'] * 1000:.0f}ms, p99 {work['p99'] * 1000:.0f}ms\n"
+            f"Deferred {handler['deferred']} of {work['count']}",
+            inline=True,
+        )
+
+    lock = db.lock_stats()
+    embed.add_field(
+        name="Database write lock",
+        value=f"Wait p50 {lock['p50'] * 1000:.0f}ms, p99 {lock['p99'] * 1000:.0f}ms, max {lock['max'] * 1000:.0f}ms\n"
+        f"{lock['retries']} retries, {lock['timeouts']} gave up",
+        inline=False,
+    )
+
+    edit_stats = edits.stats()
+    embed.add_field(
+        name="Live results edits",
+        value=f"{edit_stats['applied']} applied, {edit_stats['saved']} saved of {edit_stats['submitted']} submitted",
+        inline=False,
+    )
+
+    stream_stats = feed.stats()
+    embed.add_field(
+        name="Live tally streams",
+        value=f"{stream_stats['questions']} question and {stream_stats['firehose']} firehose subscriber(s), "
+        f"{stream_stats['published']} votes published",
+        inline=False,
+    )
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
 @bot.tree.command(name="help", description="Show all available commands")
@@ -559,26 +931,48 @@ async def help_command(interaction: discord.Interaction):
         title="Would You Rather Bot - Commands", description="Here are all the available commands:", color=discord.Color.blue()
     )
 
-    embed.add_field(name="/wyr", value="Get a random Would You Rather question", inline=False)
+    embed.add_field(name="/wyr", value="Get a random Would You Rather question, optionally from one category", inline=False)
     embed.add_field(name="/balance", value="Check your coin balance and streak", inline=False)
     embed.add_field(name="/leaderboard", value="View the top 10 users by coins", inline=False)
+    embed.add_field(name="/rank", value="See your exact rank on the leaderboard", inline=False)
     embed.add_field(name="/ping", value="Check bot latency", inline=False)
     embed.add_field(name="/submit", value="Submit a Would You Rather question for admin approval", inline=False)
     embed.add_field(name="/mysubmissions", value="View the status of your submitted questions", inline=False)
     embed.add_field(name="/addquestion (Admin only)", value="Add a new question directly (bypasses approval)", inline=False)
+    embed.add_field(name="/importquestions (Admin only)", value="Bulk import questions from a CSV or JSONL file", inline=False)
     embed.add_field(name="/pending (Admin only)", value="View and approve/reject pending question submissions", inline=False)
-    embed.add_field(name="/setdaily (Admin only)", value="Enable daily questions in a specific channel", inline=False)
+    embed.add_field(name="/setdaily (Admin only)", value="Enable daily questions at a local time and timezone", inline=False)
     embed.add_field(name="/disabledaily (Admin only)", value="Disable daily questions", inline=False)
     embed.add_field(name="/testdaily (Admin only)", value="Post a test daily question immediately", inline=False)
+    embed.add_field(name="/stats (Admin only)", value="Show response times, lock waits and edit savings", inline=False)
 
     embed.set_footer(text="Earn 10 coins for each vote! Build your streak by voting daily! Submit your own questions!")
 
     await interaction.response.send_message(embed=embed)
 
 
+async def main():
+    """Run the bot and close the database pool on shutdown"""
+    discord.utils.setup_logging()
+    async with bot:
+        try:
+            await bot.start(TOKEN)
+        finally:
+            await edits.close()
+            stats = edits.stats()
+            print(f"Results edits: {stats['applied']} applied, {stats['saved']} saved of {stats['submitted']} submitted")
+            if stream_runner is not None:
+                await stream_runner.cleanup()
+            if db is not None:
+                await db.close()
+
+
 # Run the bot
 if __name__ == "__main__":
     if not TOKEN:
         print("Error: DISCORD_BOT_TOKEN not found in .env file")
     else:
-        bot.run(TOKEN)
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
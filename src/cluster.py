@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import aiohttp
+from dotenv import load_dotenv
+
+DISCORD_API = "https://discord.com/api/v10"
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def shard_for_guild(guild_id, shard_count):
+    """The shard Discord routes a guild's events to"""
+    return (guild_id >> 22) % shard_count
+
+
+def owns_guild(guild_id, shard_count, shard_ids):
+    """Whether a process running shard_ids of shard_count handles a guild
+
+    Unsharded bots (no shard_count) and processes running every shard own every guild.
+    """
+    if not shard_count or shard_ids is None:
+        return True
+    return shard_for_guild(guild_id, shard_count) in shard_ids
+
+
+def parse_shard_ids(value):
+    """Parse shard ids given as "0,1,2" or "0-3", or None if empty"""
+    if not value or not value.strip():
+        return None
+
+    shard_ids = []
+    for part in value.split(","):
+        first, _, last = part.strip().partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
+
+
+def shard_ranges(shard_count, processes):
+    """Split shards 0..shard_count-1 into contiguous ranges, one per process"""
+    per_process, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for i in range(processes):
+        end = start + per_process + (i < extra)
+        if end > start:
+            ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def recommended_shard_count(token):
+    """Ask Discord how many shards the bot should run"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{DISCORD_API}/gateway/bot", headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+async def run_cluster(shard_count, processes, command=None, restart_delay=5.0):
+    """Run one bot process per shard range and restart any that crash until told to stop
+
+    Every process gets SHARD_COUNT and its own SHARD_IDS in its environment.
+    """
+    command = command or [sys.executable, BOT_SCRIPT]
+    stopping = asyncio.Event()
+    children = {}
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async def supervise(shard_ids):
+        ids = ",".join(map(str, shard_ids))
+        env = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=ids)
+        while True:
+            process = await asyncio.create_subprocess_exec(*command, env=env)
+            children[ids] = process
+            print(f"Started shards {ids} of {shard_count} (pid {process.pid})")
+
+            returncode = await process.wait()
+            if returncode == 0 or stopping.is_set():
+                return returncode
+
+            print(f"Shards {ids} exited with code {returncode}, restarting in {restart_delay}s")
+            try:
+                await asyncio.wait_for(stopping.wait(), restart_delay)
+                return returncode
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop_children():
+        await stopping.wait()
+        for process in children.values():
+            if process.returncode is None:
+                process.terminate()
+
+    stopper = asyncio.create_task(stop_children())
+    try:
+        return await asyncio.gather(*(supervise(shard_ids) for shard_ids in shard_ranges(shard_count, processes)))
+    finally:
+        stopper.cancel()
+
+
+async def run(args):
+    shard_count = args.shards
+    if shard_count == "auto":
+        shard_count = await recommended_shard_count(os.getenv("DISCORD_BOT_TOKEN"))
+        print(f"Discord recommends {shard_count} shard(s)")
+
+    codes = await run_cluster(int(shard_count), args.processes)
+    return max(codes, default=0)
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the Would You Rather bot as a cluster of sharded processes")
+    parser.add_argument(
+        "--shards", default=os.getenv("SHARD_COUNT", "auto"), help="Total shard count, or 'auto' to ask Discord"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.getenv("CLUSTER_PROCESSES", "1")),
+        help="Number of bot processes to split the shards across",
+    )
+
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,80 @@
+import asyncio
+import discord
+
+
+class EditCoalescer:
+    """Apply at most one edit per message per interval, always with the latest content
+
+    The first edit to a message goes out straight away. Edits submitted while
+    it is in flight or cooling down replace each other, and only the newest is
+    applied once the interval has passed. Content is rendered when the edit is
+    applied rather than when it is submitted, so it reflects the latest state.
+    """
+
+    def __init__(self, interval=1.5):
+        self.interval = interval
+        self._pending = {}
+        self._tasks = {}
+        self.submitted = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def submit(self, message, render):
+        """Queue an edit of message with the kwargs returned by awaiting render()"""
+        self.submitted += 1
+        if message.id in self._pending:
+            self.coalesced += 1
+        self._pending[message.id] = (message, render)
+
+        if message.id not in self._tasks:
+            self._tasks[message.id] = asyncio.create_task(self._run(message.id))
+
+    async def _run(self, message_id):
+        try:
+            while True:
+                entry = self._pending.pop(message_id, None)
+                if entry is None:
+                    return
+
+                message, render = entry
+                try:
+                    await message.edit(**await render())
+                    self.applied += 1
+                except discord.NotFound:
+                    # The message is gone, anything queued for it since is pointless
+                    self.dropped += 1 + (self._pending.pop(message_id, None) is not None)
+                    return
+                except Exception as e:
+                    print(f"Error editing message {message_id}: {e}")
+
+                await asyncio.sleep(self.interval)
+        finally:
+            self._tasks.pop(message_id, None)
+
+    def discard(self, message_id):
+        """Drop any queued edit for a message, e.g. because it was deleted"""
+        if self._pending.pop(message_id, None) is not None:
+            self.dropped += 1
+
+        task = self._tasks.pop(message_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def close(self):
+        """Cancel every queued edit"""
+        tasks = list(self._tasks.values())
+        for message_id in list(self._tasks):
+            self.discard(message_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        """Edit counters, where saved is how many submitted edits never had to be sent"""
+        return {
+            "submitted": self.submitted,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "saved": self.coalesced + self.dropped,
+            "pending": len(self._pending),
+        }
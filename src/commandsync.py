@@ -0,0 +1,47 @@
+import hashlib
+import json
+from fanout import fan_out
+
+# command_sync scope for the global command list, guilds use their own id
+GLOBAL_SCOPE = 0
+
+
+def command_tree_hash(tree):
+    """Hash the payload a sync would upload, so unchanged trees can be detected offline"""
+    payload = [command.to_dict(tree) for command in tree.get_commands()]
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+async def sync_command_tree(tree, db, guilds, concurrency=5, force=False, sync_global=True):
+    """Sync the command tree globally and to each guild, skipping scopes already on this hash
+
+    Guild syncs run concurrently. A scope's hash is only stored once its sync
+    succeeded, so failures are retried on the next call.
+    """
+    command_hash = command_tree_hash(tree)
+    synced = {} if force else await db.get_command_hashes()
+    stale = [guild for guild in guilds if synced.get(guild.id) != command_hash]
+
+    async def sync_guild(guild):
+        tree.copy_global_to(guild=guild)
+        await tree.sync(guild=guild)
+
+    results = await fan_out(stale, sync_guild, concurrency=concurrency)
+    updated = {result["target"].id: command_hash for result in results if result["ok"]}
+
+    synced_global = sync_global and synced.get(GLOBAL_SCOPE) != command_hash
+    if synced_global:
+        await tree.sync()
+        updated[GLOBAL_SCOPE] = command_hash
+
+    if updated:
+        await db.store_command_hashes(updated)
+
+    return {
+        "hash": command_hash,
+        "global": synced_global,
+        "synced": sum(result["ok"] for result in results),
+        "skipped": len(guilds) - len(stale),
+        "failed": [result for result in results if not result["ok"]],
+    }
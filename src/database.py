@@ -1,90 +1,808 @@
+import asyncio
 import aiosqlite
-from datetime import datetime, timedelta
+import bisect
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+import sqlite3
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from metrics import LatencyStats
+
+# Applied once to every pooled connection when it is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",  # 16 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB memory-mapped I/O
+)
+
+# Trigger body for migration 11
+BUMP_REVISION = "UPDATE db_revision SET revision = revision + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;"
+
+# Questions whose normalized text hash already exists are silently skipped
+INSERT_QUESTION = (
+    "INSERT OR IGNORE INTO questions (question, option_a, option_b, category, text_hash) VALUES (?, ?, ?, ?, ?)"
+)
+
+# Question file extensions bulk_add_questions understands
+QUESTION_FILE_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+def question_hash(question, option_a, option_b):
+    """Hash a question's text with case and whitespace normalized, used to skip duplicates"""
+    normalized = "\x1f".join(" ".join(text.casefold().split()) for text in (question, option_a, option_b))
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+async def _backfill_question_hashes(db):
+    """Hash existing questions; later copies of a duplicate keep a NULL hash so the unique index can be built"""
+    cursor = await db.execute("SELECT id, question, option_a, option_b FROM questions ORDER BY id")
+    hashes = {}
+    for question_id, question, option_a, option_b in await cursor.fetchall():
+        hashes.setdefault(question_hash(question, option_a, option_b), question_id)
+    await db.executemany("UPDATE questions SET text_hash = ? WHERE id = ?", list(hashes.items()))
+
+
+# Numbered schema migrations; migration N is MIGRATIONS[N - 1] and the database
+# records the last one applied in PRAGMA user_version. Steps are SQL statements
+# or async callables taking the connection, for backfills. Only ever append here.
+MIGRATIONS = [
+    # 1: Base tables. IF NOT EXISTS lets databases from before versioning adopt it.
+    (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            coins INTEGER DEFAULT 0,
+            streak INTEGER DEFAULT 0,
+            last_vote_date TEXT,
+            total_votes INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT NOT NULL,
+            option_a TEXT NOT NULL,
+            option_b TEXT NOT NULL,
+            category TEXT DEFAULT 'General'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS votes (
+            user_id INTEGER,
+            question_id INTEGER,
+            choice TEXT NOT NULL,
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, question_id),
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (question_id) REFERENCES questions(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS submitted_questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submitter_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            option_a TEXT NOT NULL,
+            option_b TEXT NOT NULL,
+            category TEXT DEFAULT 'General',
+            status TEXT DEFAULT 'pending',
+            submitted_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            reviewed_by INTEGER,
+            reviewed_at TEXT
+        )
+        """,
+        # Settings table for daily questions and other config
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            guild_id INTEGER PRIMARY KEY,
+            daily_channel_id INTEGER,
+            daily_enabled INTEGER DEFAULT 0,
+            daily_time TEXT DEFAULT '12:00'
+        )
+        """,
+    ),
+    # 2: Denormalized vote tallies, backfilled from any existing votes
+    (
+        """
+        CREATE TABLE IF NOT EXISTS question_stats (
+            question_id INTEGER PRIMARY KEY,
+            a_votes INTEGER NOT NULL DEFAULT 0,
+            b_votes INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (question_id) REFERENCES questions(id)
+        )
+        """,
+        "INSERT OR REPLACE INTO question_stats (question_id, a_votes, b_votes) "
+        "SELECT question_id, SUM(choice = 'a'), SUM(choice = 'b') FROM votes GROUP BY question_id",
+    ),
+    # 3: Per-guild shuffle bags so questions don't repeat until all have been drawn
+    (
+        """
+        CREATE TABLE IF NOT EXISTS question_bags (
+            guild_id INTEGER PRIMARY KEY,
+            size INTEGER NOT NULL,
+            remaining INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS question_bag_slots (
+            guild_id INTEGER,
+            slot INTEGER,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, slot)
+        )
+        """,
+    ),
+    # 4: Indexes for the hot queries
+    (
+        "CREATE INDEX IF NOT EXISTS idx_votes_question_choice ON votes (question_id, choice)",
+        "CREATE INDEX IF NOT EXISTS idx_users_coins ON users (coins DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_status ON submitted_questions (status, submitted_at)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_submitter ON submitted_questions (submitter_id, submitted_at)",
+    ),
+    # 5: Username cache so leaderboards don't need a REST call per row
+    (
+        """
+        CREATE TABLE IF NOT EXISTS usernames (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+        """,
+    ),
+    # 6: Per-guild daily schedule timezone, and the last local date posted so restarts don't double-post
+    (
+        "ALTER TABLE settings ADD COLUMN daily_timezone TEXT DEFAULT 'UTC'",
+        "ALTER TABLE settings ADD COLUMN last_posted_date TEXT",
+    ),
+    # 7: Hash of the command tree last synced to each guild (0 for global) so reconnects skip unchanged syncs
+    (
+        """
+        CREATE TABLE IF NOT EXISTS command_sync (
+            scope INTEGER PRIMARY KEY,
+            command_hash TEXT NOT NULL,
+            synced_at REAL NOT NULL
+        )
+        """,
+    ),
+    # 8: Shuffle bags per guild and category ('' for all questions), and an optional category for daily questions
+    (
+        """
+        CREATE TABLE question_bags_new (
+            guild_id INTEGER NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            size INTEGER NOT NULL,
+            remaining INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, category)
+        )
+        """,
+        "INSERT INTO question_bags_new (guild_id, size, remaining) SELECT guild_id, size, remaining FROM question_bags",
+        "DROP TABLE question_bags",
+        "ALTER TABLE question_bags_new RENAME TO question_bags",
+        """
+        CREATE TABLE question_bag_slots_new (
+            guild_id INTEGER NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            slot INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, category, slot)
+        )
+        """,
+        "INSERT INTO question_bag_slots_new (guild_id, slot, position) SELECT guild_id, slot, position FROM question_bag_slots",
+        "DROP TABLE question_bag_slots",
+        "ALTER TABLE question_bag_slots_new RENAME TO question_bag_slots",
+        "ALTER TABLE settings ADD COLUMN daily_category TEXT",
+    ),
+    # 9: Normalized text hash so bulk imports can skip questions that already exist
+    (
+        "ALTER TABLE questions ADD COLUMN text_hash TEXT",
+        _backfill_question_hashes,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_text_hash ON questions(text_hash)",
+    ),
+    # 10: Keyset pages of one category, for the web API
+    ("CREATE INDEX IF NOT EXISTS idx_questions_category ON questions (category, id)",),
+    # 11: A revision counter bumped by every change to what the web API shows, for its response cache
+    (
+        """
+        CREATE TABLE IF NOT EXISTS db_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL,
+            changed_at TEXT NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO db_revision (id, revision, changed_at) VALUES (1, 1, CURRENT_TIMESTAMP)",
+        f"CREATE TRIGGER IF NOT EXISTS questions_insert_revision AFTER INSERT ON questions BEGIN {BUMP_REVISION} END",
+        f"CREATE TRIGGER IF NOT EXISTS questions_update_revision AFTER UPDATE ON questions BEGIN {BUMP_REVISION} END",
+        f"CREATE TRIGGER IF NOT EXISTS questions_delete_revision AFTER DELETE ON questions BEGIN {BUMP_REVISION} END",
+        f"CREATE TRIGGER IF NOT EXISTS question_stats_insert_revision AFTER INSERT ON question_stats BEGIN {BUMP_REVISION} END",
+        f"CREATE TRIGGER IF NOT EXISTS question_stats_update_revision AFTER UPDATE ON question_stats BEGIN {BUMP_REVISION} END",
+        f"CREATE TRIGGER IF NOT EXISTS question_stats_delete_revision AFTER DELETE ON question_stats BEGIN {BUMP_REVISION} END",
+    ),
+    # 12: Incremental exports read votes in timestamp order
+    ("CREATE INDEX IF NOT EXISTS idx_votes_timestamp ON votes (timestamp)",),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def is_busy_error(error):
+    """Whether a SQLite error means another connection holds a lock we need"""
+    message = str(error)
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def next_streak(streak, last_vote, today):
+    """Work out a user's new streak and bonus coins for voting today
+
+    Returns None when the user has already voted today.
+    """
+    if not last_vote:
+        # First vote ever
+        return 1, 0
+
+    days_diff = (today - datetime.fromisoformat(last_vote).date()).days
+
+    if days_diff == 1:
+        # Consecutive day, increment streak and award bonus coins
+        new_streak = streak + 1
+        return new_streak, min(new_streak * 2, 50)  # Cap at 50 bonus coins
+    if days_diff > 1:
+        # Streak broken, reset to 1
+        return 1, 0
+    return None
+
+
+def question_file_format(filename):
+    """The format of a question file from its extension, csv or jsonl"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in QUESTION_FILE_FORMATS:
+        raise ValueError(f"Unsupported question file {filename!r}, use .csv or .jsonl")
+    return QUESTION_FILE_FORMATS[extension]
+
+
+def read_questions(lines, file_format, default_category="General"):
+    """Stream (question, option_a, option_b, category) rows from CSV or JSONL text
+
+    CSV needs a header with question, option_a, option_b and optionally
+    category columns; JSONL has one object with the same keys per line.
+    Rows missing a field are yielded as None so callers can count them.
+    """
+    def json_records():
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+    if file_format == "csv":
+        records = csv.DictReader(lines)
+    elif file_format == "jsonl":
+        records = json_records()
+    else:
+        raise ValueError(f"Unsupported question file format {file_format!r}")
+
+    for record in records:
+        try:
+            row = tuple(str(record[key] or "").strip() for key in ("question", "option_a", "option_b"))
+        except (KeyError, TypeError):
+            yield None
+            continue
+        if not all(row):
+            yield None
+            continue
+        yield row + (str(record.get("category") or "").strip() or default_category,)
+
+
+class LRUCache:
+    """Size-bounded least-recently-used cache with hit/miss counters"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Cache a value, evicting the least recently used entry when full"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        """Drop a key from the cache if present"""
+        self._entries.pop(key, None)
+
+    def stats(self):
+        """Report the hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Leaderboard:
+    """In-memory ranking of users by coins
+
+    Keys are (-coins, user_id) held in sorted buckets of up to 2 * load
+    entries, with a Fenwick tree over the bucket sizes. Looking up a user's
+    rank is O(log n), reading the top N is O(N) and an update only shifts
+    entries within one bucket.
+    """
+
+    def __init__(self, load=256):
+        self.load = load
+        self._users = {}  # user_id -> (coins, streak)
+        self._buckets = []
+        self._maxes = []  # last key in each bucket
+        self._tree = [0]  # Fenwick tree over bucket sizes, 1-indexed
+
+    def load_users(self, rows):
+        """Seed the ranking from (user_id, coins, streak) rows"""
+        self._users = {user_id: (coins, streak) for user_id, coins, streak in rows}
+        keys = sorted((-coins, user_id) for user_id, (coins, _) in self._users.items())
+        self._buckets = [keys[i : i + self.load] for i in range(0, len(keys), self.load)]
+        self._rebuild()
+
+    def _rebuild(self):
+        """Recompute the bucket maxima and the Fenwick tree after buckets split or empty"""
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        tree = [0] + [len(bucket) for bucket in self._buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add_size(self, index, delta):
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_before(self, index):
+        """Number of entries in the buckets before the given one"""
+        total = 0
+        i = index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _insert(self, key):
+        if not self._buckets:
+            self._buckets = [[key]]
+            self._rebuild()
+            return
+
+        index = min(bisect.bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[index]
+        bisect.insort(bucket, key)
+        self._maxes[index] = bucket[-1]
+
+        if len(bucket) > 2 * self.load:
+            self._buckets[index : index + 1] = [bucket[: self.load], bucket[self.load :]]
+            self._rebuild()
+        else:
+            self._add_size(index, 1)
+
+    def _remove(self, key):
+        index = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[index]
+        del bucket[bisect.bisect_left(bucket, key)]
+
+        if not bucket:
+            del self._buckets[index]
+            self._rebuild()
+        else:
+            self._maxes[index] = bucket[-1]
+            self._add_size(index, -1)
+
+    def update(self, user_id, coins, streak):
+        """Record a user's current balance and streak"""
+        previous = self._users.get(user_id)
+        self._users[user_id] = (coins, streak)
+
+        if previous is not None:
+            if previous[0] == coins:
+                return
+            self._remove((-previous[0], user_id))
+        self._insert((-coins, user_id))
+
+    def get(self, user_id):
+        """Return a user's (coins, streak), or None if they aren't ranked"""
+        return self._users.get(user_id)
+
+    def top(self, limit):
+        """Return the top (user_id, coins, streak) rows by coins"""
+        rows = []
+        for bucket in self._buckets:
+            for _, user_id in bucket:
+                if len(rows) == limit:
+                    return rows
+                coins, streak = self._users[user_id]
+                rows.append((user_id, coins, streak))
+        return rows
+
+    def rank(self, user_id):
+        """Return a user's 1-based rank, with tied users sharing the better rank"""
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+
+        # Sorts before every user with the same balance
+        key = (-entry[0], float("-inf"))
+        index = bisect.bisect_left(self._maxes, key)
+        return self._count_before(index) + bisect.bisect_left(self._buckets[index], key) + 1
+
+    def __len__(self):
+        return len(self._users)
+
+
+class ShuffleBag:
+    """Lazy Fisher-Yates shuffle over the positions 0..size-1
+
+    Slots [0, remaining) hold the positions not drawn yet this cycle. Only
+    slots whose position differs from their index are stored, so a draw is
+    O(1) however large the pool is.
+    """
+
+    def __init__(self, size=0, remaining=None, slots=None):
+        self.size = size
+        self.remaining = size if remaining is None else remaining
+        self.slots = dict(slots or {})
+
+    def _get(self, slot):
+        return self.slots.get(slot, slot)
+
+    def _set(self, slot, position, changed):
+        if position == slot:
+            self.slots.pop(slot, None)
+        else:
+            self.slots[slot] = position
+        changed.add(slot)
+
+    def grow(self, new_size):
+        """Add new positions to the undrawn part of the current cycle"""
+        changed = set()
+        while self.size < new_size:
+            new_position = self.size
+            # Move whatever sits at the first drawn slot to the end, then put the new position in its place
+            self._set(new_position, self._get(self.remaining), changed)
+            self._set(self.remaining, new_position, changed)
+            self.remaining += 1
+            self.size += 1
+        return changed
+
+    def draw(self, rng=random):
+        """Draw a position without repeats, starting a new cycle when empty
+
+        Returns the position, the set of slots that changed and whether the
+        bag was reset, or None if the bag is empty.
+        """
+        if self.size == 0:
+            return None
+
+        reset = self.remaining == 0
+        if reset:
+            self.slots = {}
+            self.remaining = self.size
+
+        changed = set()
+        pick = rng.randrange(self.remaining)
+        last = self.remaining - 1
+        position = self._get(pick)
+        self._set(pick, self._get(last), changed)
+        self._set(last, position, changed)
+        self.remaining -= 1
+        return position, changed, reset
+
+
+class SeenSet:
+    """Sorted array of the question positions one user has voted on
+
+    Costs 4 bytes per vote. Because positions are dense, the r-th position
+    not in the set can be found by binary search in O(log k) without
+    materializing the unseen ones.
+    """
+
+    def __init__(self, positions=()):
+        self.positions = array("i", sorted(set(positions)))
+
+    def add(self, position):
+        i = bisect.bisect_left(self.positions, position)
+        if i == len(self.positions) or self.positions[i] != position:
+            self.positions.insert(i, position)
+
+    def __contains__(self, position):
+        i = bisect.bisect_left(self.positions, position)
+        return i < len(self.positions) and self.positions[i] == position
+
+    def __len__(self):
+        return len(self.positions)
+
+    def nth_unseen(self, n):
+        """The n-th (from 0) position not in the set"""
+        # positions[i] - i counts the unseen positions below positions[i], and never decreases
+        lo, hi = 0, len(self.positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.positions[mid] - mid <= n:
+                lo = mid + 1
+            else:
+                hi = mid
+        return n + lo
+
+    def pick_unseen(self, size, rng=random):
+        """A random position below size that isn't in the set, or None if every one is"""
+        unseen = size - bisect.bisect_left(self.positions, size)
+        if unseen <= 0:
+            return None
+        return self.nth_unseen(rng.randrange(unseen))
 
 
 class Database:
-    def __init__(self, db_path):
+    def __init__(
+        self,
+        db_path,
+        pool_size=4,
+        buffered_votes=False,
+        flush_interval=0.05,
+        flush_batch_size=500,
+        max_pending_votes=5000,
+        question_cache_size=1024,
+        seen_cache_size=4096,
+        refresh_interval=None,
+        write_retries=5,
+        retry_backoff=0.05,
+    ):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool = None
+        self._connections = []
+        # Question ids in id order; a question's index here is its position in the shuffle bags
+        self._question_ids = []
+        # The same per category, keyed by the category's name as first seen; lookups ignore case
+        self._category_ids = {}
+        self._category_names = {}
+        self._category_list = None
+        self._bags = {}
+        # Questions never change once inserted, so their rows can be cached by id
+        self._question_cache = LRUCache(question_cache_size)
+        # Which questions each recently active user has voted on, so /wyr can skip them
+        self._seen_cache = LRUCache(seen_cache_size)
+        # Ranking by coins, updated whenever a balance changes
+        self._leaderboard = Leaderboard()
 
-    async def initialize(self):
-        """Initialize database tables"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Users table
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    coins INTEGER DEFAULT 0,
-                    streak INTEGER DEFAULT 0,
-                    last_vote_date TEXT,
-                    total_votes INTEGER DEFAULT 0
-                )
-            """
-            )
+        # Write-behind vote buffer: votes are acknowledged from memory and group-committed in batches
+        self.buffered_votes = buffered_votes
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.max_pending_votes = max_pending_votes
+        self._pending_votes = {}  # (user_id, question_id) -> (choice, reward, date, timestamp)
+        self._flushing_votes = {}  # the batch currently being written
+        self._pending_tallies = {}  # question_id -> [a_votes, b_votes] not on disk yet
+        self._flush_lock = None
+        self._flush_wakeup = None
+        self._flush_task = None
 
-            # Questions table
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS questions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question TEXT NOT NULL,
-                    option_a TEXT NOT NULL,
-                    option_b TEXT NOT NULL,
-                    category TEXT DEFAULT 'General'
-                )
-            """
-            )
+        # Called with each vote's tally change, e.g. to feed live result streams
+        self._vote_listeners = []
 
-            # Votes table
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS votes (
-                    user_id INTEGER,
-                    question_id INTEGER,
-                    choice TEXT NOT NULL,
-                    timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (user_id, question_id),
-                    FOREIGN KEY (user_id) REFERENCES users(user_id),
-                    FOREIGN KEY (question_id) REFERENCES questions(id)
-                )
-            """
-            )
+        # Other processes writing the same file (cluster mode): re-read their questions and balances periodically
+        self.refresh_interval = refresh_interval
+        self._refresh_task = None
 
-            # Submitted questions table
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS submitted_questions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    submitter_id INTEGER NOT NULL,
-                    question TEXT NOT NULL,
-                    option_a TEXT NOT NULL,
-                    option_b TEXT NOT NULL,
-                    category TEXT DEFAULT 'General',
-                    status TEXT DEFAULT 'pending',
-                    submitted_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    reviewed_by INTEGER,
-                    reviewed_at TEXT
-                )
-            """
-            )
+        # Write lock contention: BEGIN IMMEDIATE retries and how long writers waited for the lock
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+        self.lock_waits = LatencyStats()
+        self.lock_retries = 0
+        self.lock_timeouts = 0
 
-            # Settings table for daily questions and other config
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS settings (
-                    guild_id INTEGER PRIMARY KEY,
-                    daily_channel_id INTEGER,
-                    daily_enabled INTEGER DEFAULT 0,
-                    daily_time TEXT DEFAULT '12:00'
-                )
-            """
-            )
+    async def _open_pool(self):
+        """Open the persistent connections shared by all database calls"""
+        pool = asyncio.Queue()
+        for _ in range(self.pool_size):
+            conn = await aiosqlite.connect(self.db_path)
+            for pragma in CONNECTION_PRAGMAS:
+                await conn.execute(pragma)
+            self._connections.append(conn)
+            pool.put_nowait(conn)
+        self._pool = pool
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Borrow a pooled connection for the duration of the block"""
+        if self._pool is None:
+            await self._open_pool()
 
+        pool = self._pool
+        conn = await pool.get()
+        try:
+            yield conn
+        finally:
+            # Never hand a half-finished transaction to the next caller
+            if conn.in_transaction:
+                await conn.rollback()
+            pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _transaction(self):
+        """Run the block as one write transaction started with BEGIN IMMEDIATE"""
+        async with self._connection() as db:
+            # Take the write lock up front so the reads inside the block can't go stale
+            await self._begin_immediate(db)
+            try:
+                yield db
+            except BaseException:
+                await db.rollback()
+                raise
             await db.commit()
 
-            # Add starter questions if table is empty
+    async def _begin_immediate(self, db):
+        """Take the write lock, retrying with jittered backoff while another writer holds it
+
+        busy_timeout already waits inside SQLite; this covers writers that hold
+        the lock for longer, e.g. another process running a big import.
+        """
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                await db.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                attempt += 1
+                if not is_busy_error(e) or attempt > self.write_retries:
+                    if is_busy_error(e):
+                        self.lock_timeouts += 1
+                    raise
+                self.lock_retries += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        self.lock_waits.add(time.monotonic() - started_at)
+
+    def lock_stats(self):
+        """How long write transactions waited for the lock, with retry and give-up counts"""
+        stats = self.lock_waits.summary()
+        stats["retries"] = self.lock_retries
+        stats["timeouts"] = self.lock_timeouts
+        return stats
+
+    async def close(self):
+        """Flush any buffered votes and close all pooled connections"""
+        for task in (self._flush_task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flush_task = self._refresh_task = None
+
+        while self._pending_votes:
+            await self.flush_votes()
+
+        connections, self._connections = self._connections, []
+        self._pool = None
+        for conn in connections:
+            await conn.close()
+
+    async def initialize(self):
+        """Open the connection pool, migrate the schema and load the in-memory indexes"""
+        if self._pool is None:
+            await self._open_pool()
+
+        await self._migrate()
+
+        # Add starter questions if table is empty, under the write lock so concurrent processes can't both add them
+        async with self._transaction() as db:
             await self._add_starter_questions(db)
 
+        async with self._connection() as db:
+            # Load the question id index used for random selection, bucketed by category
+            cursor = await db.execute("SELECT id, category FROM questions ORDER BY id")
+            rows = await cursor.fetchall()
+            self._question_ids = [question_id for question_id, _ in rows]
+            self._category_ids = {}
+            self._category_names = {}
+            self._category_list = None
+            for question_id, category in rows:
+                self._category_bucket(category).append(question_id)
+            self._bags = {}
+
+            # Seed the leaderboard
+            cursor = await db.execute("SELECT user_id, coins, streak FROM users")
+            self._leaderboard.load_users(await cursor.fetchall())
+
+        if self.buffered_votes and self._flush_task is None:
+            self._flush_wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+        if self.refresh_interval and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def refresh(self):
+        """Pick up questions and balances written by other processes sharing the database file
+
+        Question ids only grow, so only rows past the newest indexed id are read.
+        """
+        async with self._connection() as db:
+            newest = self._question_ids[-1] if self._question_ids else 0
+            cursor = await db.execute(
+                "SELECT id, question, option_a, option_b, category FROM questions WHERE id > ? ORDER BY id", (newest,)
+            )
+            new_questions = await cursor.fetchall()
+            for question in new_questions:
+                self._index_question(question)
+
+            cursor = await db.execute("SELECT user_id, coins, streak FROM users")
+            self._leaderboard.load_users(await cursor.fetchall())
+        return len(new_questions)
+
+    async def _refresh_loop(self):
+        """Call refresh every refresh_interval seconds"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing from the database: {e}")
+
+    async def _schema_version(self, db):
+        """Read the schema version recorded in PRAGMA user_version"""
+        cursor = await db.execute("PRAGMA user_version")
+        return (await cursor.fetchone())[0]
+
+    async def _migrate(self):
+        """Apply pending migrations in order, one transaction per migration"""
+        async with self._connection() as db:
+            version = await self._schema_version(db)
+
+        # On a warm start the version already matches and no DDL runs at all
+        while version < SCHEMA_VERSION:
+            async with self._transaction() as db:
+                # Re-check under the write lock in case another process migrated first
+                version = await self._schema_version(db)
+                if version >= SCHEMA_VERSION:
+                    break
+
+                for statement in MIGRATIONS[version]:
+                    if callable(statement):
+                        await statement(db)
+                    else:
+                        await db.execute(statement)
+                version += 1
+                await db.execute(f"PRAGMA user_version = {version}")
+
+            print(f"Applied database migration {version}")
+
     async def _add_starter_questions(self, db):
         """Add some starter questions if the database is empty"""
         cursor = await db.execute("SELECT COUNT(*) FROM questions")
@@ -124,72 +842,581 @@ class Database:
                 ("Would you rather know when you'll die or how you'll die?", "Know when", "Know how", "Life"),
             ]
 
-            for question, option_a, option_b, category in starter_questions:
-                await db.execute(
-                    "INSERT INTO questions (question, option_a, option_b, category) VALUES (?, ?, ?, ?)",
-                    (question, option_a, option_b, category),
-                )
+            await db.executemany(
+                INSERT_QUESTION,
+                [row + (question_hash(*row[:3]),) for row in starter_questions],
+            )
 
-            await db.commit()
             print(f"Added {len(starter_questions)} starter questions to database")
 
-    async def get_random_question(self):
-        """Get a random question from the database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT id, question, option_a, option_b, category FROM questions ORDER BY RANDOM() LIMIT 1"
+    def _index_question(self, question, cache=True):
+        """Add a newly inserted question row to the id index and the question cache"""
+        bisect.insort(self._question_ids, question[0])
+        bisect.insort(self._category_bucket(question[4]), question[0])
+        if cache:
+            self._question_cache.put(question[0], question)
+
+    def _category_bucket(self, category):
+        """The id list for a category, created on first use; uncategorized questions share a throwaway list"""
+        if not category:
+            return []
+        name = self._category_names.setdefault(category.casefold(), category)
+        if name not in self._category_ids:
+            self._category_ids[name] = []
+            self._category_list = None
+        return self._category_ids[name]
+
+    def resolve_category(self, category):
+        """The stored name of a category matched case-insensitively, or None if there is no such category"""
+        return self._category_names.get(category.casefold()) if category else None
+
+    def categories(self):
+        """Every category with its question count, sorted by name, served from memory"""
+        if self._category_list is None:
+            self._category_list = sorted(
+                ((name, len(ids)) for name, ids in self._category_ids.items()), key=lambda item: item[0].casefold()
             )
-            return await cursor.fetchone()
+        return self._category_list
+
+    async def get_random_question(self, guild_id=None, user_id=None, category=None):
+        """Get a random question from the database
+
+        With a category only questions in it are considered, and None is
+        returned if it has none. With a user_id the question is one that user
+        hasn't voted on yet, if there are any left. Otherwise, with a guild_id
+        the question is drawn from that guild's shuffle bag (one per category),
+        so it won't repeat until every question has been drawn.
+        """
+        category = self.resolve_category(category) if category else ""
+        if category is None:
+            return None
+
+        question_ids = self._category_ids[category] if category else self._question_ids
+        if not question_ids:
+            return None
+
+        if user_id is not None:
+            seen = await self._seen_questions(user_id)
+            question_id = self._pick_unseen(seen, question_ids)
+            if question_id is not None:
+                return await self.get_question_by_id(question_id)
+
+        if guild_id is None:
+            return await self.get_question_by_id(random.choice(question_ids))
+
+        drawn_ids = await self._draw_from_bags([(guild_id, category)])
+        return await self.get_question_by_id(drawn_ids[(guild_id, category)])
+
+    def _pick_unseen(self, seen, question_ids):
+        """A random id from question_ids that isn't in the seen set, or None if the user has seen them all"""
+        if question_ids is self._question_ids:
+            position = seen.pick_unseen(len(question_ids))
+            return None if position is None else question_ids[position]
+
+        # A category is a subset of the index, so sample a few before scanning it for what's left
+        for _ in range(8):
+            question_id = random.choice(question_ids)
+            if self._question_position(question_id) not in seen:
+                return question_id
+        unseen = [question_id for question_id in question_ids if self._question_position(question_id) not in seen]
+        return random.choice(unseen) if unseen else None
+
+    async def _seen_questions(self, user_id):
+        """Get the positions of the questions a user has voted on, loading them on a cache miss"""
+        seen = self._seen_cache.get(user_id)
+        if seen is None:
+            async with self._connection() as db:
+                cursor = await db.execute("SELECT question_id FROM votes WHERE user_id = ?", (user_id,))
+                question_ids = [row[0] for row in await cursor.fetchall()]
+            # Buffered votes count too, even though they aren't on disk yet
+            question_ids += [
+                question_id for (voter, question_id) in [*self._pending_votes, *self._flushing_votes] if voter == user_id
+            ]
+            positions = map(self._question_position, question_ids)
+            seen = SeenSet(position for position in positions if position is not None)
+            self._seen_cache.put(user_id, seen)
+        return seen
+
+    def _question_position(self, question_id):
+        """A question's position in the id index, or None if it isn't indexed"""
+        i = bisect.bisect_left(self._question_ids, question_id)
+        if i < len(self._question_ids) and self._question_ids[i] == question_id:
+            return i
+        return None
+
+    def _mark_seen(self, user_id, question_id):
+        """Add a vote to the user's cached seen set, if it is cached"""
+        seen = self._seen_cache.get(user_id)
+        position = self._question_position(question_id)
+        if seen is not None and position is not None:
+            seen.add(position)
+
+    async def _load_bag(self, db, guild_id, category):
+        """Load a guild's shuffle bag for a category ('' for all questions) from the database"""
+        cursor = await db.execute(
+            "SELECT size, remaining FROM question_bags WHERE guild_id = ? AND category = ?", (guild_id, category)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return ShuffleBag()
+
+        cursor = await db.execute(
+            "SELECT slot, position FROM question_bag_slots WHERE guild_id = ? AND category = ?", (guild_id, category)
+        )
+        return ShuffleBag(row[0], row[1], dict(await cursor.fetchall()))
+
+    async def _draw_from_bags(self, bag_keys):
+        """Draw the next question id from each (guild_id, category) shuffle bag, persisting every bag in one transaction
+
+        A bag's positions index the category's id list, or the whole index for category ''.
+        """
+        drawn_ids = {}
+        try:
+            async with self._transaction() as db:
+                for key in bag_keys:
+                    guild_id, category = key
+                    question_ids = self._category_ids[category] if category else self._question_ids
+                    bag = self._bags.get(key)
+                    if bag is None:
+                        bag = self._bags[key] = await self._load_bag(db, guild_id, category)
+
+                    changed = bag.grow(len(question_ids))
+                    position, drawn, reset = bag.draw()
+                    changed |= drawn
+                    drawn_ids[key] = question_ids[position]
+
+                    if reset:
+                        await db.execute(
+                            "DELETE FROM question_bag_slots WHERE guild_id = ? AND category = ?", (guild_id, category)
+                        )
+                    await db.executemany(
+                        "INSERT OR REPLACE INTO question_bag_slots (guild_id, category, slot, position) VALUES (?, ?, ?, ?)",
+                        [(guild_id, category, slot, bag.slots[slot]) for slot in changed if slot in bag.slots],
+                    )
+                    await db.executemany(
+                        "DELETE FROM question_bag_slots WHERE guild_id = ? AND category = ? AND slot = ?",
+                        [(guild_id, category, slot) for slot in changed if slot not in bag.slots],
+                    )
+                    await db.execute(
+                        "INSERT OR REPLACE INTO question_bags (guild_id, category, size, remaining) VALUES (?, ?, ?, ?)",
+                        (guild_id, category, bag.size, bag.remaining),
+                    )
+        except BaseException:
+            # The in-memory bags may be ahead of the rolled back ones, reload them next time
+            for key in bag_keys:
+                self._bags.pop(key, None)
+            raise
+
+        return drawn_ids
+
+    async def get_random_questions(self, guild_ids, categories=None):
+        """Draw one question per guild from their shuffle bags in a single batch
+
+        categories optionally maps guilds to the category to draw from; guilds
+        whose category has no questions draw from all of them instead.
+        Returns {guild_id: question row}, or an empty dict if there are no questions.
+        """
+        guild_ids = list(dict.fromkeys(guild_ids))
+        if not self._question_ids or not guild_ids:
+            return {}
+
+        categories = categories or {}
+        bag_keys = {}
+        for guild_id in guild_ids:
+            category = self.resolve_category(categories.get(guild_id))
+            bag_keys[guild_id] = (guild_id, category if category and self._category_ids[category] else "")
+
+        drawn_ids = await self._draw_from_bags(list(bag_keys.values()))
+        questions = await self._get_questions(set(drawn_ids.values()))
+        return {
+            guild_id: questions[drawn_ids[key]] for guild_id, key in bag_keys.items() if drawn_ids[key] in questions
+        }
+
+    async def _get_questions(self, question_ids):
+        """Get several questions by id, reading through the question cache"""
+        questions = {}
+        missing = []
+        for question_id in question_ids:
+            question = self._question_cache.get(question_id)
+            if question is not None:
+                questions[question_id] = question
+            else:
+                missing.append(question_id)
+
+        if missing:
+            async with self._connection() as db:
+                cursor = await db.execute(
+                    "SELECT id, question, option_a, option_b, category FROM questions "
+                    "WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(missing),),
+                )
+                for question in await cursor.fetchall():
+                    self._question_cache.put(question[0], question)
+                    questions[question[0]] = question
+
+        return questions
 
     async def get_question_by_id(self, question_id):
-        """Get a specific question by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Get a specific question by ID, reading through the question cache"""
+        question = self._question_cache.get(question_id)
+        if question is not None:
+            return question
+
+        async with self._connection() as db:
             cursor = await db.execute(
                 "SELECT id, question, option_a, option_b, category FROM questions WHERE id = ?", (question_id,)
             )
-            return await cursor.fetchone()
+            question = await cursor.fetchone()
+
+        if question is not None:
+            self._question_cache.put(question_id, question)
+        return question
+
+    def question_cache_stats(self):
+        """Report hit/miss counters for the question cache"""
+        return self._question_cache.stats()
 
     async def has_user_voted(self, user_id, question_id):
         """Check if a user has already voted on a question"""
-        async with aiosqlite.connect(self.db_path) as db:
+        if self._is_buffered(user_id, question_id):
+            return True
+
+        async with self._connection() as db:
             cursor = await db.execute("SELECT 1 FROM votes WHERE user_id = ? AND question_id = ?", (user_id, question_id))
             result = await cursor.fetchone()
             return result is not None
 
     async def record_vote(self, user_id, question_id, choice):
         """Record a user's vote"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
+            cursor = await db.execute("SELECT choice FROM votes WHERE user_id = ? AND question_id = ?", (user_id, question_id))
+            previous = await cursor.fetchone()
+
             await db.execute(
                 "INSERT OR REPLACE INTO votes (user_id, question_id, choice) VALUES (?, ?, ?)", (user_id, question_id, choice)
             )
 
+            # Move the tally over if this replaces an earlier vote
+            if previous is not None:
+                await self._bump_stats(db, question_id, previous[0], -1)
+            await self._bump_stats(db, question_id, choice, 1)
+
             # Update user's total votes
             await db.execute("UPDATE users SET total_votes = total_votes + 1 WHERE user_id = ?", (user_id,))
+            results = await self._question_results(db, question_id)
 
-            await db.commit()
+        self._mark_seen(user_id, question_id)
+        a_delta = (choice == "a") - (previous is not None and previous[0] == "a")
+        b_delta = (choice == "b") - (previous is not None and previous[0] == "b")
+        self._notify_vote(question_id, a_delta, b_delta, results)
 
-    async def get_question_results(self, question_id):
-        """Get voting results for a question"""
-        async with aiosqlite.connect(self.db_path) as db:
+    def add_vote_listener(self, listener):
+        """Call listener(question_id, a_delta, b_delta, results) for every vote this process counts
+
+        results is the question's tally including that vote. Listeners run on
+        the event loop straight after the vote and must not block.
+        """
+        self._vote_listeners.append(listener)
+
+    def remove_vote_listener(self, listener):
+        """Stop calling a vote listener"""
+        self._vote_listeners.remove(listener)
+
+    def _notify_vote(self, question_id, a_delta, b_delta, results):
+        for listener in list(self._vote_listeners):
+            try:
+                listener(question_id, a_delta, b_delta, results)
+            except Exception as e:
+                print(f"Error in vote listener: {e}")
+
+    async def _bump_stats(self, db, question_id, choice, delta):
+        """Adjust the denormalized tally for one choice on a question"""
+        a_delta = delta if choice == "a" else 0
+        b_delta = delta if choice == "b" else 0
+        await db.execute(
+            "INSERT INTO question_stats (question_id, a_votes, b_votes) VALUES (?, ?, ?) "
+            "ON CONFLICT (question_id) DO UPDATE SET "
+            "a_votes = a_votes + excluded.a_votes, b_votes = b_votes + excluded.b_votes",
+            (question_id, a_delta, b_delta),
+        )
+
+    async def cast_vote(self, user_id, question_id, choice, reward=10):
+        """Record a vote and pay out its reward in a single transaction
+
+        Returns None if the user already voted on the question, otherwise the
+        fresh results, the question row and the coins and streak awarded.
+        """
+        if self.buffered_votes:
+            return await self._buffer_vote(user_id, question_id, choice, reward)
+
+        async with self._transaction() as db:
+            # The primary key on votes doubles as the duplicate check, so two
+            # concurrent clicks can't both get paid
             cursor = await db.execute(
-                "SELECT choice, COUNT(*) FROM votes WHERE question_id = ? GROUP BY choice", (question_id,)
+                "INSERT OR IGNORE INTO votes (user_id, question_id, choice) VALUES (?, ?, ?)", (user_id, question_id, choice)
             )
-            results = await cursor.fetchall()
+            if cursor.rowcount == 0:
+                return None
+
+            await self._bump_stats(db, question_id, choice, 1)
+            await self._ensure_user(db, user_id)
+            cursor = await db.execute("SELECT coins, streak, last_vote_date FROM users WHERE user_id = ?", (user_id,))
+            coins, streak, last_vote = await cursor.fetchone()
 
-            a_votes = 0
-            b_votes = 0
+            today = datetime.now().date()
+            update = next_streak(streak, last_vote, today)
+            bonus = 0
+            if update is not None:
+                streak, bonus = update
+                last_vote = today.isoformat()
 
-            for choice, count in results:
-                if choice == "a":
-                    a_votes = count
-                elif choice == "b":
-                    b_votes = count
+            await db.execute(
+                "UPDATE users SET coins = coins + ?, streak = ?, last_vote_date = ?, total_votes = total_votes + 1 "
+                "WHERE user_id = ?",
+                (reward + bonus, streak, last_vote, user_id),
+            )
+
+            results = await self._question_results(db, question_id)
+
+        self._notify_vote(question_id, int(choice == "a"), int(choice == "b"), results)
+        self._leaderboard.update(user_id, coins + reward + bonus, streak)
+        self._mark_seen(user_id, question_id)
+        question = await self.get_question_by_id(question_id)
+        return {"results": results, "question": question, "coins": reward + bonus, "streak": streak}
+
+    def _is_buffered(self, user_id, question_id):
+        """Check whether a vote is waiting in the write-behind buffer"""
+        key = (user_id, question_id)
+        return key in self._pending_votes or key in self._flushing_votes
+
+    def _with_pending_tally(self, question_id, results):
+        """Add buffered votes that aren't on disk yet to a tally read from the database"""
+        a_votes, b_votes = self._pending_tallies.get(question_id, (0, 0))
+        return {"a_votes": results["a_votes"] + a_votes, "b_votes": results["b_votes"] + b_votes}
+
+    async def _buffer_vote(self, user_id, question_id, choice, reward):
+        """Acknowledge a vote from memory and leave the write to the background flusher"""
+        if self._is_buffered(user_id, question_id):
+            return None
+
+        # Apply backpressure instead of letting the buffer grow without bound
+        while len(self._pending_votes) >= self.max_pending_votes:
+            await self.flush_votes()
+
+        async with self._connection() as db:
+            cursor = await db.execute("SELECT 1 FROM votes WHERE user_id = ? AND question_id = ?", (user_id, question_id))
+            already_voted = await cursor.fetchone() is not None
+            results = await self._question_results(db, question_id)
+
+        question = await self.get_question_by_id(question_id)
+
+        # Check the buffer again, another click may have landed while we were reading
+        if already_voted or self._is_buffered(user_id, question_id):
+            return None
+
+        today = datetime.now().date()
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self._pending_votes[(user_id, question_id)] = (choice, reward, today, timestamp)
+        self._pending_tallies.setdefault(question_id, [0, 0])[choice == "b"] += 1
+        self._mark_seen(user_id, question_id)
+
+        if len(self._pending_votes) >= self.flush_batch_size:
+            self._flush_wakeup.set()
+
+        # Listeners hear about the vote now, not when it is flushed, in step with the tallies shown to users
+        results = self._with_pending_tally(question_id, results)
+        self._notify_vote(question_id, int(choice == "a"), int(choice == "b"), results)
+
+        # The streak bonus is worked out when the vote is flushed
+        return {
+            "results": results,
+            "question": question,
+            "coins": reward,
+            "streak": None,
+        }
+
+    async def _flush_loop(self):
+        """Flush buffered votes every flush_interval, or sooner when a batch fills up"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+
+            try:
+                await self.flush_votes()
+            except Exception as e:
+                print(f"Error flushing buffered votes: {e}")
+
+            if len(self._pending_votes) >= self.flush_batch_size:
+                self._flush_wakeup.set()
+
+    async def flush_votes(self):
+        """Write one batch of buffered votes in a single transaction
+
+        A batch holds at most flush_batch_size votes. Votes already on disk,
+        e.g. written by another process, are dropped without being paid or
+        tallied again. Returns how many were written.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending_votes:
+                return 0
+
+            batch = dict(itertools.islice(self._pending_votes.items(), self.flush_batch_size))
+            for key in batch:
+                del self._pending_votes[key]
+            self._flushing_votes = batch
+
+            vote_rows = [
+                (user_id, question_id, choice, timestamp)
+                for (user_id, question_id), (choice, _, _, timestamp) in batch.items()
+            ]
+
+            try:
+                async with self._transaction() as db:
+                    # Another process (or a vote buffered while this one was flushing) may have
+                    # written some of these already; only the rows inserted here are paid and tallied
+                    cursor = await db.execute(
+                        "INSERT OR IGNORE INTO votes (user_id, question_id, choice, timestamp) "
+                        "SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), "
+                        "json_extract(value, '$[2]'), json_extract(value, '$[3]') FROM json_each(?) "
+                        "RETURNING user_id, question_id",
+                        (json.dumps(vote_rows),),
+                    )
+                    inserted = await cursor.fetchall()
 
-            return {"a_votes": a_votes, "b_votes": b_votes}
+                    user_rows = []
+                    tallies = {}
+                    for key in inserted:
+                        user_id, question_id = key
+                        choice, reward, today, _ = batch[key]
+                        yesterday = today - timedelta(days=1)
+                        user_rows.append(
+                            {"user_id": user_id, "reward": reward, "today": today.isoformat(), "yesterday": yesterday.isoformat()}
+                        )
+                        tallies.setdefault(question_id, [0, 0])[choice == "b"] += 1
+
+                    await db.executemany(
+                        "INSERT OR IGNORE INTO users (user_id, coins, streak, total_votes) VALUES (?, 0, 0, 0)",
+                        [(user_id,) for user_id in {row["user_id"] for row in user_rows}],
+                    )
+                    # Same rules as next_streak, applied vote by vote in SQL
+                    await db.executemany(
+                        """
+                        UPDATE users SET
+                            coins = coins + :reward
+                                + CASE WHEN last_vote_date = :yesterday THEN MIN((streak + 1) * 2, 50) ELSE 0 END,
+                            streak = CASE
+                                WHEN last_vote_date >= :today THEN streak
+                                WHEN last_vote_date = :yesterday THEN streak + 1
+                                ELSE 1
+                            END,
+                            last_vote_date = MAX(COALESCE(last_vote_date, :today), :today),
+                            total_votes = total_votes + 1
+                        WHERE user_id = :user_id
+                    """,
+                        user_rows,
+                    )
+                    await db.executemany(
+                        "INSERT INTO question_stats (question_id, a_votes, b_votes) VALUES (?, ?, ?) "
+                        "ON CONFLICT (question_id) DO UPDATE SET "
+                        "a_votes = a_votes + excluded.a_votes, b_votes = b_votes + excluded.b_votes",
+                        [(question_id, a_votes, b_votes) for question_id, (a_votes, b_votes) in tallies.items()],
+                    )
+                    cursor = await db.execute(
+                        "SELECT user_id, coins, streak FROM users WHERE user_id IN (SELECT value FROM json_each(?))",
+                        (json.dumps([row["user_id"] for row in user_rows]),),
+                    )
+                    balances = await cursor.fetchall()
+            except BaseException:
+                # Put the batch back in front of anything that arrived meanwhile
+                self._pending_votes = {**batch, **self._pending_votes}
+                raise
+            else:
+                for user_id, coins, streak in balances:
+                    self._leaderboard.update(user_id, coins, streak)
+                # Every vote in the batch has left the buffer, whether it was written or dropped as a duplicate
+                for (_, question_id), (choice, _, _, _) in batch.items():
+                    pending = self._pending_tallies[question_id]
+                    pending[choice == "b"] -= 1
+                    if pending == [0, 0]:
+                        del self._pending_tallies[question_id]
+            finally:
+                self._flushing_votes = {}
+
+            return len(inserted)
+
+    async def _question_results(self, db, question_id):
+        """Read the tally for a question on the given connection"""
+        cursor = await db.execute("SELECT a_votes, b_votes FROM question_stats WHERE question_id = ?", (question_id,))
+        row = await cursor.fetchone()
+
+        if row is None:
+            return {"a_votes": 0, "b_votes": 0}
+        return {"a_votes": row[0], "b_votes": row[1]}
+
+    async def get_question_results(self, question_id):
+        """Get voting results for a question"""
+        async with self._connection() as db:
+            results = await self._question_results(db, question_id)
+        return self._with_pending_tally(question_id, results)
+
+    async def _rebuild_question_stats(self, db):
+        """Recompute every tally in question_stats from the votes table"""
+        await db.execute("DELETE FROM question_stats")
+        cursor = await db.execute(
+            "INSERT INTO question_stats (question_id, a_votes, b_votes) "
+            "SELECT question_id, SUM(choice = 'a'), SUM(choice = 'b') FROM votes GROUP BY question_id"
+        )
+        return cursor.rowcount
+
+    async def rebuild_question_stats(self):
+        """Rebuild question_stats from votes, returning the number of questions tallied"""
+        async with self._transaction() as db:
+            return await self._rebuild_question_stats(db)
+
+    async def check_question_stats(self):
+        """Compare question_stats against the votes table
+
+        Returns a list of mismatches, each with the stored and actual tallies.
+        """
+        async with self._connection() as db:
+            cursor = await db.execute(
+                """
+                WITH actual AS (
+                    SELECT question_id, SUM(choice = 'a') AS a_votes, SUM(choice = 'b') AS b_votes
+                    FROM votes GROUP BY question_id
+                )
+                SELECT a.question_id, COALESCE(s.a_votes, 0), COALESCE(s.b_votes, 0), a.a_votes, a.b_votes
+                FROM actual a LEFT JOIN question_stats s ON s.question_id = a.question_id
+                WHERE COALESCE(s.a_votes, 0) != a.a_votes OR COALESCE(s.b_votes, 0) != a.b_votes
+                UNION ALL
+                SELECT s.question_id, s.a_votes, s.b_votes, 0, 0
+                FROM question_stats s
+                WHERE (s.a_votes != 0 OR s.b_votes != 0)
+                    AND NOT EXISTS (SELECT 1 FROM actual a WHERE a.question_id = s.question_id)
+            """
+            )
+            return [
+                {
+                    "question_id": question_id,
+                    "stored": {"a_votes": stored_a, "b_votes": stored_b},
+                    "actual": {"a_votes": actual_a, "b_votes": actual_b},
+                }
+                for question_id, stored_a, stored_b, actual_a, actual_b in await cursor.fetchall()
+            ]
+
+    async def _ensure_user(self, db, user_id):
+        """Create a user row on the given connection if it doesn't exist yet"""
+        await db.execute("INSERT OR IGNORE INTO users (user_id, coins, streak, total_votes) VALUES (?, 0, 0, 0)", (user_id,))
 
     async def get_user(self, user_id):
         """Get or create user data"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute(
                 "SELECT user_id, coins, streak, last_vote_date, total_votes FROM users WHERE user_id = ?", (user_id,)
             )
@@ -197,83 +1424,162 @@ class Database:
 
             if user is None:
                 # Create new user
-                await db.execute("INSERT INTO users (user_id, coins, streak, total_votes) VALUES (?, 0, 0, 0)", (user_id,))
+                await self._ensure_user(db, user_id)
                 await db.commit()
+                self._leaderboard.update(user_id, 0, 0)
                 return {"user_id": user_id, "coins": 0, "streak": 0, "last_vote_date": None, "total_votes": 0}
 
             return {"user_id": user[0], "coins": user[1], "streak": user[2], "last_vote_date": user[3], "total_votes": user[4]}
 
     async def award_coins(self, user_id, amount):
         """Award coins to a user"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             # Ensure user exists
-            await self.get_user(user_id)
+            await self._ensure_user(db, user_id)
 
             await db.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (amount, user_id))
-            await db.commit()
+            balance = await self._read_balance(db, user_id)
+
+        self._leaderboard.update(user_id, *balance)
 
     async def update_streak(self, user_id):
         """Update user's streak based on voting"""
-        async with aiosqlite.connect(self.db_path) as db:
-            user = await self.get_user(user_id)
+        async with self._transaction() as db:
+            await self._ensure_user(db, user_id)
+            cursor = await db.execute("SELECT streak, last_vote_date FROM users WHERE user_id = ?", (user_id,))
+            streak, last_vote = await cursor.fetchone()
 
             today = datetime.now().date()
-            last_vote = user["last_vote_date"]
-
-            if last_vote:
-                last_vote_date = datetime.fromisoformat(last_vote).date()
-                days_diff = (today - last_vote_date).days
+            update = next_streak(streak, last_vote, today)
 
-                if days_diff == 1:
-                    # Consecutive day, increment streak
-                    new_streak = user["streak"] + 1
-                    # Award bonus coins for streak
-                    bonus = min(new_streak * 2, 50)  # Cap at 50 bonus coins
-                    await db.execute(
-                        "UPDATE users SET streak = ?, last_vote_date = ?, coins = coins + ? WHERE user_id = ?",
-                        (new_streak, today.isoformat(), bonus, user_id),
-                    )
-                elif days_diff > 1:
-                    # Streak broken, reset to 1
-                    await db.execute(
-                        "UPDATE users SET streak = 1, last_vote_date = ? WHERE user_id = ?", (today.isoformat(), user_id)
-                    )
-                # If days_diff == 0, already voted today, don't update
-            else:
-                # First vote ever
+            # None means the user already voted today, so nothing changes
+            if update is not None:
+                new_streak, bonus = update
                 await db.execute(
-                    "UPDATE users SET streak = 1, last_vote_date = ? WHERE user_id = ?", (today.isoformat(), user_id)
+                    "UPDATE users SET streak = ?, last_vote_date = ?, coins = coins + ? WHERE user_id = ?",
+                    (new_streak, today.isoformat(), bonus, user_id),
                 )
 
-            await db.commit()
+            balance = await self._read_balance(db, user_id)
+
+        self._leaderboard.update(user_id, *balance)
+
+    async def _read_balance(self, db, user_id):
+        """Read a user's coins and streak on the given connection"""
+        cursor = await db.execute("SELECT coins, streak FROM users WHERE user_id = ?", (user_id,))
+        return await cursor.fetchone()
 
     async def get_leaderboard(self, limit=10):
         """Get top users by coins"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("SELECT user_id, coins, streak FROM users ORDER BY coins DESC LIMIT ?", (limit,))
-            return await cursor.fetchall()
+        return self._leaderboard.top(limit)
+
+    async def get_rank(self, user_id):
+        """Get a user's leaderboard rank, or None if they have no balance yet"""
+        rank = self._leaderboard.rank(user_id)
+        if rank is None:
+            return None
+
+        coins, streak = self._leaderboard.get(user_id)
+        return {"rank": rank, "total": len(self._leaderboard), "coins": coins, "streak": streak}
+
+    async def get_cached_usernames(self, user_ids, max_age):
+        """Get cached usernames fetched within the last max_age seconds"""
+        async with self._connection() as db:
+            cursor = await db.execute(
+                "SELECT user_id, name FROM usernames WHERE user_id IN (SELECT value FROM json_each(?)) AND fetched_at >= ?",
+                (json.dumps(list(user_ids)), time.time() - max_age),
+            )
+            return dict(await cursor.fetchall())
+
+    async def store_usernames(self, names):
+        """Cache usernames keyed by user id"""
+        fetched_at = time.time()
+        async with self._transaction() as db:
+            await db.executemany(
+                "INSERT OR REPLACE INTO usernames (user_id, name, fetched_at) VALUES (?, ?, ?)",
+                [(user_id, name, fetched_at) for user_id, name in names.items()],
+            )
+
+    async def get_command_hashes(self):
+        """Get the command tree hash last synced to each scope"""
+        async with self._connection() as db:
+            cursor = await db.execute("SELECT scope, command_hash FROM command_sync")
+            return dict(await cursor.fetchall())
+
+    async def store_command_hashes(self, hashes):
+        """Record the command tree hash just synced to each scope"""
+        synced_at = time.time()
+        async with self._transaction() as db:
+            await db.executemany(
+                "INSERT OR REPLACE INTO command_sync (scope, command_hash, synced_at) VALUES (?, ?, ?)",
+                [(scope, command_hash, synced_at) for scope, command_hash in hashes.items()],
+            )
 
     async def add_question(self, question, option_a, option_b, category="General"):
-        """Add a new question to the database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO questions (question, option_a, option_b, category) VALUES (?, ?, ?, ?)",
-                (question, option_a, option_b, category),
+        """Add a new question to the database, returning False if it is a duplicate"""
+        async with self._transaction() as db:
+            cursor = await db.execute(
+                INSERT_QUESTION,
+                (question, option_a, option_b, category, question_hash(question, option_a, option_b)),
             )
-            await db.commit()
+        if not cursor.rowcount:
+            return False
+        self._index_question((cursor.lastrowid, question, option_a, option_b, category))
+        return True
+
+    async def bulk_add_questions(self, lines, file_format, chunk_size=1000, default_category="General"):
+        """Stream questions from CSV or JSONL lines into the database in chunked transactions
+
+        Questions whose normalized text already exists are skipped, as are
+        rows missing a field. Returns counts of what was read, added, skipped
+        as duplicates or invalid, with the elapsed time and rows per second.
+        """
+        started_at = time.perf_counter()
+        result = {"read": 0, "added": 0, "duplicates": 0, "invalid": 0}
+        rows = read_questions(lines, file_format, default_category)
+
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            result["read"] += len(chunk)
+            valid = [row + (question_hash(*row[:3]),) for row in chunk if row is not None]
+            result["invalid"] += len(chunk) - len(valid)
+
+            async with self._transaction() as db:
+                # The write lock is held, so every id above the current maximum is one of ours
+                cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM questions")
+                newest = (await cursor.fetchone())[0]
+                await db.executemany(
+                    INSERT_QUESTION,
+                    valid,
+                )
+                cursor = await db.execute(
+                    "SELECT id, question, option_a, option_b, category FROM questions WHERE id > ? ORDER BY id", (newest,)
+                )
+                added = await cursor.fetchall()
+
+            # Index without caching, an import shouldn't evict the questions people are voting on
+            for question in added:
+                self._index_question(question, cache=False)
+            result["added"] += len(added)
+            result["duplicates"] += len(valid) - len(added)
+
+        result["seconds"] = time.perf_counter() - started_at
+        result["rows_per_second"] = result["read"] / result["seconds"] if result["seconds"] else 0.0
+        return result
 
     async def submit_question(self, submitter_id, question, option_a, option_b, category="General"):
         """Submit a question for approval"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             await db.execute(
                 "INSERT INTO submitted_questions (submitter_id, question, option_a, option_b, category) VALUES (?, ?, ?, ?, ?)",
                 (submitter_id, question, option_a, option_b, category),
             )
-            await db.commit()
 
     async def get_pending_submissions(self, limit=10):
         """Get pending question submissions"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute(
                 "SELECT id, submitter_id, question, option_a, option_b, category, submitted_at FROM submitted_questions WHERE status = ? ORDER BY submitted_at ASC LIMIT ?",
                 ("pending", limit),
@@ -282,7 +1588,7 @@ class Database:
 
     async def get_submission_by_id(self, submission_id):
         """Get a specific submission by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute(
                 "SELECT id, submitter_id, question, option_a, option_b, category, status FROM submitted_questions WHERE id = ?",
                 (submission_id,),
@@ -291,8 +1597,8 @@ class Database:
 
     async def approve_submission(self, submission_id, reviewer_id):
         """Approve a submission and add it to questions"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Get the submission
+        async with self._transaction() as db:
+            # Get the submission, under the write lock so two reviewers can't both add it
             cursor = await db.execute(
                 "SELECT question, option_a, option_b, category FROM submitted_questions WHERE id = ?", (submission_id,)
             )
@@ -301,66 +1607,102 @@ class Database:
             if submission:
                 question, option_a, option_b, category = submission
 
-                # Add to questions table
-                await db.execute(
-                    "INSERT INTO questions (question, option_a, option_b, category) VALUES (?, ?, ?, ?)",
-                    (question, option_a, option_b, category),
+                # Add to questions table, unless the same question is already there
+                cursor = await db.execute(
+                    INSERT_QUESTION,
+                    (question, option_a, option_b, category, question_hash(question, option_a, option_b)),
                 )
+                added = cursor.rowcount > 0
 
                 # Update submission status
                 await db.execute(
                     "UPDATE submitted_questions SET status = ?, reviewed_by = ?, reviewed_at = ? WHERE id = ?",
                     ("approved", reviewer_id, datetime.now().isoformat(), submission_id),
                 )
+                question_row = (cursor.lastrowid, question, option_a, option_b, category)
+            else:
+                question_row = None
 
-                await db.commit()
-                return True
+        if question_row is None:
             return False
+        if added:
+            self._index_question(question_row)
+        return True
 
     async def reject_submission(self, submission_id, reviewer_id):
         """Reject a submission"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             await db.execute(
                 "UPDATE submitted_questions SET status = ?, reviewed_by = ?, reviewed_at = ? WHERE id = ?",
                 ("rejected", reviewer_id, datetime.now().isoformat(), submission_id),
             )
-            await db.commit()
 
     async def get_user_submissions(self, user_id):
         """Get all submissions from a user"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute(
                 "SELECT id, question, option_a, option_b, category, status, submitted_at FROM submitted_questions WHERE submitter_id = ? ORDER BY submitted_at DESC",
                 (user_id,),
             )
             return await cursor.fetchall()
 
-    async def set_daily_channel(self, guild_id, channel_id):
-        """Set the channel for daily questions"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def set_daily_channel(self, guild_id, channel_id, daily_time="12:00", timezone="UTC", category=None):
+        """Set the channel, local time, timezone and optional category for daily questions"""
+        async with self._transaction() as db:
+            # Upsert rather than replace so last_posted_date survives reconfiguring
             await db.execute(
-                "INSERT OR REPLACE INTO settings (guild_id, daily_channel_id, daily_enabled) VALUES (?, ?, 1)",
-                (guild_id, channel_id),
+                "INSERT INTO settings (guild_id, daily_channel_id, daily_enabled, daily_time, daily_timezone, daily_category) "
+                "VALUES (?, ?, 1, ?, ?, ?) ON CONFLICT (guild_id) DO UPDATE SET "
+                "daily_channel_id = excluded.daily_channel_id, daily_enabled = 1, "
+                "daily_time = excluded.daily_time, daily_timezone = excluded.daily_timezone, "
+                "daily_category = excluded.daily_category",
+                (guild_id, channel_id, daily_time, timezone, category),
             )
-            await db.commit()
 
     async def get_daily_channel(self, guild_id):
-        """Get the daily question channel for a guild"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("SELECT daily_channel_id, daily_enabled FROM settings WHERE guild_id = ?", (guild_id,))
+        """Get the daily question channel and schedule for a guild"""
+        async with self._connection() as db:
+            cursor = await db.execute(
+                "SELECT daily_channel_id, daily_enabled, daily_time, daily_timezone, last_posted_date, daily_category "
+                "FROM settings WHERE guild_id = ?",
+                (guild_id,),
+            )
             result = await cursor.fetchone()
             if result:
-                return {"channel_id": result[0], "enabled": bool(result[1])}
+                return {
+                    "channel_id": result[0],
+                    "enabled": bool(result[1]),
+                    "time": result[2],
+                    "timezone": result[3],
+                    "last_posted_date": result[4],
+                    "category": result[5],
+                }
             return None
 
+    async def get_daily_schedules(self):
+        """Get the schedule of every guild with daily questions enabled"""
+        async with self._connection() as db:
+            cursor = await db.execute(
+                "SELECT guild_id, daily_channel_id, daily_time, daily_timezone, last_posted_date, daily_category "
+                "FROM settings WHERE daily_enabled = 1"
+            )
+            return await cursor.fetchall()
+
+    async def mark_daily_posted(self, posted_dates):
+        """Record the local date each guild's daily question was posted for"""
+        async with self._transaction() as db:
+            await db.executemany(
+                "UPDATE settings SET last_posted_date = ? WHERE guild_id = ?",
+                [(posted_date, guild_id) for guild_id, posted_date in posted_dates.items()],
+            )
+
     async def disable_daily_questions(self, guild_id):
         """Disable daily questions for a guild"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             await db.execute("UPDATE settings SET daily_enabled = 0 WHERE guild_id = ?", (guild_id,))
-            await db.commit()
 
     async def get_all_daily_channels(self):
         """Get all guilds with daily questions enabled"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("SELECT guild_id, daily_channel_id FROM settings WHERE daily_enabled = 1")
             return await cursor.fetchall()
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+from datetime import datetime
+from urllib.parse import quote
+
+# Rows read per query. Each chunk is its own short read, so an export of any
+# size never pins one snapshot (and the WAL) for its whole duration.
+CHUNK_SIZE = 5000
+
+# Export formats and their content types
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+VOTE_COLUMNS = ("user_id", "question_id", "choice", "timestamp")
+QUESTION_COLUMNS = ("id", "question", "option_a", "option_b", "category", "a_votes", "b_votes")
+
+
+def connect_readonly(path, timeout=5):
+    """Open a read-only connection to the database, it can never take the write lock"""
+    return sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True, timeout=timeout)
+
+
+def parse_since(value):
+    """Normalize a since= timestamp to the format votes are stored in (UTC, second precision)
+
+    Accepts anything datetime.fromisoformat does, such as 2026-03-01 or
+    2026-03-01T18:30:00. Returns None for an empty value.
+    """
+    if not value:
+        return None
+    return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def vote_chunks(conn, since=None, chunk_size=CHUNK_SIZE):
+    """Yield lists of (user_id, question_id, choice, timestamp), oldest first
+
+    Keyset paginated on (timestamp, rowid), so votes cast during the export
+    are picked up rather than skipped, and each chunk is an index range scan.
+    since is inclusive.
+    """
+    after = (since or "", 0)
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, user_id, question_id, choice, timestamp FROM votes "
+            "WHERE (timestamp, rowid) > (?, ?) ORDER BY timestamp, rowid LIMIT ?",
+            (*after, chunk_size),
+        ).fetchall()
+        if rows:
+            yield [tuple(row)[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+        after = (rows[-1][4], rows[-1][0])
+
+
+def question_chunks(conn, after=0, chunk_size=CHUNK_SIZE):
+    """Yield lists of (id, question, option_a, option_b, category, a_votes, b_votes) in id order"""
+    while True:
+        rows = conn.execute(
+            "SELECT q.id, q.question, q.option_a, q.option_b, q.category, "
+            "COALESCE(s.a_votes, 0), COALESCE(s.b_votes, 0) "
+            "FROM questions q LEFT JOIN question_stats s ON s.question_id = q.id "
+            "WHERE q.id > ? ORDER BY q.id LIMIT ?",
+            (after, chunk_size),
+        ).fetchall()
+        if rows:
+            yield [tuple(row) for row in rows]
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
+
+
+def encode_rows(chunks, columns, file_format):
+    """Encode row chunks as CSV (with a header) or NDJSON, one string per chunk"""
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {file_format!r}, use csv or ndjson")
+
+    if file_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for chunk in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+    else:
+        for chunk in chunks:
+            yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in chunk)
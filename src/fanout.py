@@ -0,0 +1,81 @@
+import asyncio
+import random
+import time
+import aiohttp
+import discord
+from metrics import summarize_latencies
+
+
+def is_transient(error):
+    """Whether a failed send is worth retrying"""
+    if isinstance(error, discord.HTTPException):
+        # Server errors and rate limits clear up, missing access or channels don't
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+
+class RateLimiter:
+    """Space out request starts so the whole fan-out stays under a global rate"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next_start = 0.0
+        self._lock = None
+
+    async def wait(self):
+        if not self.interval:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def fan_out(targets, send, concurrency=10, rate=None, retries=3, backoff=1.0, started_at=None):
+    """Call send(target) for every target in parallel through a concurrency limit
+
+    Transient failures are retried with jittered exponential backoff without
+    holding up the other targets. Returns one result per target with its
+    delivery latency measured from started_at (defaults to now).
+    """
+    started_at = time.monotonic() if started_at is None else started_at
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+
+    async def deliver(target):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                # Hold a slot only while a request is in flight, not while backing off
+                async with semaphore:
+                    await limiter.wait()
+                    await send(target)
+                return {"target": target, "ok": True, "latency": time.monotonic() - started_at, "attempts": attempt}
+            except Exception as e:
+                if attempt > retries or not is_transient(e):
+                    return {
+                        "target": target,
+                        "ok": False,
+                        "latency": time.monotonic() - started_at,
+                        "attempts": attempt,
+                        "error": e,
+                    }
+                await asyncio.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    return await asyncio.gather(*(deliver(target) for target in targets))
+
+
+def summarize(results):
+    """Summarize fan-out results as delivered/failed counts and delivery latency percentiles"""
+    delivered = [result["latency"] for result in results if result["ok"]]
+    summary = summarize_latencies(delivered)
+    summary["delivered"] = len(delivered)
+    summary["failed"] = len(results) - len(delivered)
+    summary["retried"] = sum(result["attempts"] > 1 for result in results)
+    return summary
@@ -0,0 +1,18 @@
+# Gunicorn settings for the web API, run with: gunicorn --config gunicorn.conf.py api:app
+import multiprocessing
+import os
+
+bind = os.getenv("WYR_API_BIND", "0.0.0.0:5000")
+
+# Reads are served from read-only SQLite connections, one per thread, so
+# workers and threads scale reads without ever taking the bot's write lock
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = "gthread"
+threads = int(os.getenv("WYR_API_THREADS", "4"))
+
+timeout = 30
+graceful_timeout = 10
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
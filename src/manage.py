@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from database import Database, question_file_format
+from export import QUESTION_COLUMNS, VOTE_COLUMNS, connect_readonly, encode_rows, parse_since, question_chunks, vote_chunks
+
+
+async def rebuild_stats(db, args):
+    """Recompute question_stats from the votes table"""
+    count = await db.rebuild_question_stats()
+    print(f"Rebuilt vote tallies for {count} question(s)")
+    return 0
+
+
+async def check_stats(db, args):
+    """Report any question_stats rows that disagree with the votes table"""
+    mismatches = await db.check_question_stats()
+
+    for mismatch in mismatches:
+        stored, actual = mismatch["stored"], mismatch["actual"]
+        print(
+            f"Question {mismatch['question_id']}: stored {stored['a_votes']}/{stored['b_votes']}, "
+            f"actual {actual['a_votes']}/{actual['b_votes']}"
+        )
+
+    if mismatches:
+        print(f"{len(mismatches)} question(s) out of sync, run 'rebuild-stats' to fix them")
+        return 1
+
+    print("Vote tallies are consistent")
+    return 0
+
+
+async def import_questions(db, args):
+    """Bulk import questions from a CSV or JSONL file"""
+    file_format = args.format or question_file_format(args.path)
+    with open(args.path, encoding="utf-8-sig", newline="") as lines:
+        result = await db.bulk_add_questions(lines, file_format, chunk_size=args.chunk_size, default_category=args.category)
+
+    print(
+        f"Added {result['added']} of {result['read']} question(s): {result['duplicates']} duplicate(s), "
+        f"{result['invalid']} invalid, {result['seconds']:.2f}s ({result['rows_per_second']:,.0f} rows/sec)"
+    )
+    return 0
+
+
+async def export(db, args):
+    """Stream votes or questions to a CSV or NDJSON file over a read-only connection"""
+    conn = connect_readonly(args.db)
+    if args.table == "votes":
+        chunks, columns = vote_chunks(conn, parse_since(args.since)), VOTE_COLUMNS
+    else:
+        chunks, columns = question_chunks(conn, args.after), QUESTION_COLUMNS
+
+    rows = 0
+
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    started_at = time.perf_counter()
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        for piece in encode_rows(counted(chunks), columns, args.format):
+            output.write(piece)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        conn.close()
+
+    seconds = time.perf_counter() - started_at
+    rate = rows / seconds if seconds else 0
+    print(f"Exported {rows} {args.table} in {seconds:.2f}s ({rate:,.0f} rows/sec)", file=sys.stderr)
+    return 0
+
+
+COMMANDS = {
+    "rebuild-stats": rebuild_stats,
+    "check-stats": check_stats,
+    "import-questions": import_questions,
+    "export": export,
+}
+
+
+async def run(args):
+    """Open the database, run one maintenance command and close it again"""
+    if args.command == "export":
+        # Exports only read, over their own connection, and may be writing to stdout
+        return await export(None, args)
+
+    db = Database(args.db)
+    await db.initialize()
+    try:
+        return await COMMANDS[args.command](db, args)
+    finally:
+        await db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Would You Rather bot maintenance commands")
+    parser.add_argument("--db", default=os.getenv("WYR_DB_PATH", "wyr_bot.db"), help="Path to the SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild-stats", help="Recompute the denormalized vote tallies from the votes table")
+    subparsers.add_parser("check-stats", help="Check the denormalized vote tallies against the votes table")
+    importer = subparsers.add_parser("import-questions", help="Bulk import questions from a CSV or JSONL file")
+    importer.add_argument("path", help="File with question, option_a, option_b and optional category fields")
+    importer.add_argument("--format", choices=["csv", "jsonl"], help="File format (default: from the extension)")
+    importer.add_argument("--category", default="General", help="Category for rows that don't name one")
+    importer.add_argument("--chunk-size", type=int, default=1000, help="Rows inserted per transaction")
+    exporter = subparsers.add_parser("export", help="Stream votes or questions to CSV or NDJSON")
+    exporter.add_argument("table", choices=["votes", "questions"], help="What to export")
+    exporter.add_argument("--format", choices=["csv", "ndjson"], default="ndjson", help="Output format (default: ndjson)")
+    exporter.add_argument("--since", help="Only votes cast at or after this UTC timestamp, e.g. 2026-03-01T18:30:00")
+    exporter.add_argument("--after", type=int, default=0, help="Only questions with an id above this")
+    exporter.add_argument("--output", "-o", default="-", help="File to write (default: stdout)")
+
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,43 @@
+import math
+from collections import deque
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples, or 0.0 when there are none"""
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize_latencies(samples):
+    """Summarize latency samples in seconds as count, p50, p99 and max"""
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p99": percentile(samples, 99),
+        "max": max(samples, default=0.0),
+    }
+
+
+class LatencyStats:
+    """Rolling window of the most recent latency samples"""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, pct):
+        return percentile(self.samples, pct)
+
+    def summary(self):
+        """Summarize the window as count, p50, p99 and max, where count covers every sample ever added"""
+        summary = summarize_latencies(list(self.samples))
+        summary["count"] = self.count
+        return summary
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections import defaultdict
+from metrics import LatencyStats
+
+
+class Responder:
+    """Acknowledge interactions inside Discord's three second window however slow the work is
+
+    Handlers pass their work as a coroutine that returns the reply as
+    send_message kwargs, or a list of them to send several messages. If recent
+    runs of the same handler took longer than the budget, the interaction is
+    deferred before the work starts. Otherwise the work gets up to ack_timeout
+    to finish and is deferred only if it hasn't. Deferred replies go out as
+    followups.
+    """
+
+    def __init__(self, budget=1.0, ack_timeout=2.0):
+        self.budget = budget
+        self.ack_timeout = ack_timeout
+        self.ack_latency = defaultdict(LatencyStats)
+        self.work_time = defaultdict(LatencyStats)
+        self.deferred = defaultdict(int)
+
+    def expected_work(self, name):
+        """Median recent work time of a handler, 0.0 until it has run"""
+        return self.work_time[name].percentile(50)
+
+    async def run(self, name, interaction, work, ephemeral=False):
+        """Run a handler's work and send its reply, deferring first if it may miss the window"""
+        started_at = time.monotonic()
+        acked = False
+
+        async def timed():
+            work_started = time.monotonic()
+            result = await work
+            self.work_time[name].add(time.monotonic() - work_started)
+            return result
+
+        try:
+            if self.expected_work(name) > self.budget:
+                await self._defer(name, interaction, ephemeral, started_at)
+                acked = True
+                result = await timed()
+            else:
+                task = asyncio.ensure_future(timed())
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(task), self.ack_timeout)
+                except asyncio.TimeoutError:
+                    await self._defer(name, interaction, ephemeral, started_at)
+                    acked = True
+                    result = await task
+        except Exception:
+            if acked:
+                await interaction.followup.send("❌ Something went wrong, please try again.", ephemeral=True)
+            raise
+
+        replies = result if isinstance(result, list) else [result] if result else []
+        for reply in replies:
+            if acked:
+                await interaction.followup.send(**reply)
+            else:
+                await interaction.response.send_message(**reply)
+                self.ack_latency[name].add(time.monotonic() - started_at)
+                acked = True
+
+    async def _defer(self, name, interaction, ephemeral, started_at):
+        await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+        self.ack_latency[name].add(time.monotonic() - started_at)
+        self.deferred[name] += 1
+
+    def stats(self):
+        """Time-to-ack and work time summaries per handler, with how often each was deferred"""
+        return {
+            name: {
+                "ack": self.ack_latency[name].summary(),
+                "work": self.work_time[name].summary(),
+                "deferred": self.deferred[name],
+            }
+            for name in sorted(self.work_time)
+        }
@@ -0,0 +1,112 @@
+import heapq
+import itertools
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# How late a missed post may still go out, e.g. when the bot restarts just after a guild's time
+CATCH_UP_WINDOW = timedelta(minutes=30)
+
+
+def parse_daily_time(value):
+    """Parse an HH:MM time of day, raising ValueError if it isn't one"""
+    hour, _, minute = value.strip().partition(":")
+    return time(int(hour), int(minute or 0))
+
+
+def next_fire_time(daily_time, tz_name, last_posted_date, now, catch_up=CATCH_UP_WINDOW):
+    """Work out when a guild's daily question is next due, in UTC
+
+    Returns the UTC fire time and the guild-local date it posts for. Local
+    dates that were already posted are skipped, so restarts never double-post.
+    """
+    tz = ZoneInfo(tz_name)
+    local_time = parse_daily_time(daily_time)
+    local_now = now.astimezone(tz)
+    posted = date.fromisoformat(last_posted_date) if last_posted_date else None
+
+    day = local_now.date()
+    while True:
+        fire_at = datetime.combine(day, local_time, tzinfo=tz)
+        if (posted is None or day > posted) and fire_at + catch_up > local_now:
+            return fire_at.astimezone(timezone.utc), day.isoformat()
+        day += timedelta(days=1)
+
+
+class DailyScheduler:
+    """Min-heap of daily question fire times with one live entry per guild
+
+    Rescheduling or cancelling a guild bumps its generation instead of
+    searching the heap; stale entries are dropped when they reach the top.
+    Every change and every wakeup is O(log n).
+    """
+
+    def __init__(self, catch_up=CATCH_UP_WINDOW):
+        self.catch_up = catch_up
+        self._heap = []
+        self._jobs = {}
+        self._generations = itertools.count()
+
+    def schedule(
+        self, guild_id, channel_id, daily_time="12:00", tz_name="UTC", last_posted_date=None, now=None, category=None
+    ):
+        """Add or replace a guild's schedule, returning its next UTC fire time"""
+        now = now or datetime.now(timezone.utc)
+        fire_at, local_date = next_fire_time(daily_time, tz_name, last_posted_date, now, self.catch_up)
+        generation = next(self._generations)
+
+        self._jobs[guild_id] = {
+            "guild_id": guild_id,
+            "channel_id": channel_id,
+            "time": daily_time,
+            "timezone": tz_name,
+            "category": category,
+            "fire_at": fire_at,
+            "local_date": local_date,
+            "generation": generation,
+        }
+        heapq.heappush(self._heap, (fire_at, generation, guild_id))
+        self._compact()
+        return fire_at
+
+    def cancel(self, guild_id):
+        """Stop posting to a guild"""
+        self._jobs.pop(guild_id, None)
+        self._compact()
+
+    def _is_live(self, entry):
+        job = self._jobs.get(entry[2])
+        return job is not None and job["generation"] == entry[1]
+
+    def _compact(self):
+        """Rebuild the heap once stale entries outnumber live ones"""
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    def next_fire_at(self):
+        """The earliest pending UTC fire time, or None if nothing is scheduled"""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """Take every job due at or before now off the heap and return it
+
+        A popped job stays registered until the guild is rescheduled or
+        cancelled, so callers can tell whether it changed while posting.
+        """
+        now = now or datetime.now(timezone.utc)
+        due = []
+        while True:
+            fire_at = self.next_fire_at()
+            if fire_at is None or fire_at > now:
+                return due
+            _, _, guild_id = heapq.heappop(self._heap)
+            due.append(self._jobs[guild_id])
+
+    def get(self, guild_id):
+        """A guild's scheduled job, or None"""
+        return self._jobs.get(guild_id)
+
+    def __len__(self):
+        return len(self._jobs)
@@ -0,0 +1,181 @@
+import asyncio
+import json
+from aiohttp import web
+
+# Seconds between keepalive comments on an idle stream, so proxies don't drop it
+HEARTBEAT_INTERVAL = 15.0
+
+DB_KEY = web.AppKey("db", object)
+FEED_KEY = web.AppKey("feed", object)
+HEARTBEAT_KEY = web.AppKey("heartbeat", float)
+
+
+class Subscription:
+    """One stream's pending tally changes, merged per question until the stream sends them"""
+
+    def __init__(self, question_id=None):
+        self.question_id = question_id
+        self.pending = {}
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+
+    def push(self, question_id, a_delta, b_delta, results):
+        """Queue a change, folding it into any unsent change for the same question"""
+        update = self.pending.get(question_id)
+        if update is None:
+            self.pending[question_id] = {
+                "question_id": question_id,
+                "a_delta": a_delta,
+                "b_delta": b_delta,
+                "a_votes": results["a_votes"],
+                "b_votes": results["b_votes"],
+            }
+        else:
+            update["a_delta"] += a_delta
+            update["b_delta"] += b_delta
+            update["a_votes"] = results["a_votes"]
+            update["b_votes"] = results["b_votes"]
+            self.coalesced += 1
+        self._ready.set()
+
+    async def next_batch(self, timeout=None):
+        """Wait for changes and take everything pending, or an empty list after timeout seconds"""
+        if not self.pending:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        batch = list(self.pending.values())
+        self.pending = {}
+        return batch
+
+
+class ChangeFeed:
+    """Fan vote tally changes out to stream subscriptions
+
+    Register publish as a Database vote listener. A subscription is either for
+    one question or for every question (the firehose). Publishing only touches
+    the subscriptions that want the question, and never waits on a client, so
+    idle and slow subscribers cost nothing but their pending changes.
+    """
+
+    def __init__(self):
+        self._questions = {}
+        self._firehose = set()
+        self.published = 0
+
+    def subscribe(self, question_id=None):
+        """Start a subscription to one question, or to every question when question_id is None"""
+        subscription = Subscription(question_id)
+        if question_id is None:
+            self._firehose.add(subscription)
+        else:
+            self._questions.setdefault(question_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """End a subscription"""
+        if subscription.question_id is None:
+            self._firehose.discard(subscription)
+            return
+
+        subscriptions = self._questions.get(subscription.question_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._questions[subscription.question_id]
+
+    def publish(self, question_id, a_delta, b_delta, results):
+        """Deliver a vote's tally change to every interested subscription"""
+        self.published += 1
+        for subscription in self._questions.get(question_id, ()):
+            subscription.push(question_id, a_delta, b_delta, results)
+        for subscription in self._firehose:
+            subscription.push(question_id, a_delta, b_delta, results)
+
+    def stats(self):
+        """Report subscriber counts and how many changes have been published"""
+        return {
+            "questions": sum(len(subscriptions) for subscriptions in self._questions.values()),
+            "firehose": len(self._firehose),
+            "published": self.published,
+        }
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def _stream(request, subscription, initial=b""):
+    """Send a subscription's changes as Server-Sent Events until the client goes away"""
+    feed = request.app[FEED_KEY]
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Access-Control-Allow-Origin": "*",
+            "X-Accel-Buffering": "no",
+        }
+    )
+    try:
+        await response.prepare(request)
+        await response.write(initial or b": connected\n\n")
+
+        while True:
+            # Changes that arrive while a write is stuck on a slow client are merged and sent together
+            batch = await subscription.next_batch(request.app[HEARTBEAT_KEY])
+            if batch:
+                await response.write(b"".join(format_event("tally", update) for update in batch))
+            else:
+                await response.write(b": keepalive\n\n")
+    except ConnectionError:
+        pass
+    finally:
+        feed.unsubscribe(subscription)
+    return response
+
+
+async def stream_question(request):
+    """GET /api/questions/{question_id}/stream: the question's tally, then every change to it"""
+    question_id = int(request.match_info["question_id"])
+    db = request.app[DB_KEY]
+    if await db.get_question_by_id(question_id) is None:
+        raise web.HTTPNotFound(text="No such question")
+
+    # Subscribe before reading the snapshot so no vote falls between the two. Every event carries
+    # the full tally, so a vote counted in both the snapshot and an update is still shown right.
+    subscription = request.app[FEED_KEY].subscribe(question_id)
+    try:
+        results = await db.get_question_results(question_id)
+    except BaseException:
+        request.app[FEED_KEY].unsubscribe(subscription)
+        raise
+    snapshot = format_event("tally", {"question_id": question_id, "a_delta": 0, "b_delta": 0, **results})
+    return await _stream(request, subscription, snapshot)
+
+
+async def stream_all(request):
+    """GET /api/stream: every tally change on every question"""
+    return await _stream(request, request.app[FEED_KEY].subscribe())
+
+
+def create_stream_app(db, feed, heartbeat=HEARTBEAT_INTERVAL):
+    """Build the aiohttp application serving the live tally streams"""
+    app = web.Application()
+    app[DB_KEY] = db
+    app[FEED_KEY] = feed
+    app[HEARTBEAT_KEY] = heartbeat
+    app.router.add_get(r"/api/questions/{question_id:\d+}/stream", stream_question)
+    app.router.add_get("/api/stream", stream_all)
+    return app
+
+
+async def start_stream_server(db, feed, host="0.0.0.0", port=5001):
+    """Serve the live tally streams from this process, returning the runner to clean up on shutdown"""
+    runner = web.AppRunner(create_stream_app(db, feed))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,56 @@
+import asyncio
+import discord
+
+
+class UsernameResolver:
+    """Resolve user ids to names for the leaderboard and the review queue
+
+    Names come from the gateway cache first, then from a TTL cache persisted
+    in SQLite. Only the ids left over are fetched over REST, all at once but
+    with a bounded number of requests in flight.
+    """
+
+    def __init__(self, bot, db, ttl=24 * 60 * 60, concurrency=5):
+        self.bot = bot
+        self.db = db
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._semaphore = None
+
+    async def resolve(self, user_ids):
+        """Return {user_id: name} for every id that could be resolved"""
+        names = {}
+        missing = []
+
+        for user_id in dict.fromkeys(user_ids):
+            user = self.bot.get_user(user_id)
+            if user is not None:
+                names[user_id] = user.name
+            else:
+                missing.append(user_id)
+
+        if missing:
+            cached = await self.db.get_cached_usernames(missing, self.ttl)
+            names.update(cached)
+            missing = [user_id for user_id in missing if user_id not in cached]
+
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            found = {user_id: name for user_id, name in zip(missing, fetched) if name is not None}
+            if found:
+                await self.db.store_usernames(found)
+            names.update(found)
+
+        return names
+
+    async def _fetch(self, user_id):
+        """Fetch one username over REST, or None if the user can't be fetched"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except (discord.HTTPException, asyncio.TimeoutError):
+                return None
+        return user.name
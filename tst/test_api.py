@@ -0,0 +1,193 @@
+import gzip
+import json
+import sqlite3
+import threading
+import pytest
+from src import api
+from src.database import Database
+
+
+@pytest.fixture
+async def db(tmp_path):
+    """A database with 250 extra questions in two categories"""
+    test_db = Database(str(tmp_path / "test_api.db"))
+    await test_db.initialize()
+    lines = [
+        json.dumps({"question": f"Would you rather {i}?", "option_a": "A", "option_b": "B", "category": f"Cat{i % 2}"})
+        for i in range(250)
+    ]
+    await test_db.bulk_add_questions(lines, "jsonl")
+    yield test_db
+    await test_db.close()
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """A Flask test client reading the test database"""
+    monkeypatch.setitem(api.app.config, "DATABASE", db.db_path)
+    yield api.app.test_client()
+    api.close_db_connections()
+
+
+def walk_pages(client, **params):
+    """Follow next_after through every page of /api/questions"""
+    pages = []
+    after = 0
+    while after is not None:
+        response = client.get("/api/questions", query_string=dict(params, after=after))
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        after = pages[-1]["next_after"]
+    return pages
+
+
+def test_api_questions_pages_through_everything(db, client):
+    """Test keyset pages cover every question once, in id order"""
+    pages = walk_pages(client, limit=40)
+
+    ids = [question["id"] for page in pages for question in page["questions"]]
+    assert ids == db._question_ids
+    assert all(len(page["questions"]) <= 40 for page in pages)
+    assert pages[-1]["next_after"] is None
+
+
+@pytest.mark.asyncio
+async def test_api_questions_include_tallies(db, client):
+    """Test questions carry their vote tallies, with zeros for questions nobody voted on"""
+    first, second = db._question_ids[:2]
+    await db.cast_vote(1, first, "a")
+    await db.cast_vote(2, first, "b")
+    await db.cast_vote(3, first, "b")
+
+    questions = client.get("/api/questions", query_string={"limit": 2}).get_json()["questions"]
+    assert [(q["id"], q["a_votes"], q["b_votes"]) for q in questions] == [(first, 1, 2), (second, 0, 0)]
+
+
+def test_api_questions_category_filter(db, client):
+    """Test the category filter pages through one category only"""
+    pages = walk_pages(client, category="Cat1", limit=50)
+
+    questions = [question for page in pages for question in page["questions"]]
+    assert len(questions) == 125
+    assert {question["category"] for question in questions} == {"Cat1"}
+
+
+def test_api_questions_page_size_is_clamped(client):
+    """Test out of range or malformed paging parameters fall back to sane values"""
+    assert client.get("/api/questions?limit=0").get_json()["limit"] == 1
+    assert client.get("/api/questions?limit=100000").get_json()["limit"] == api.MAX_PAGE_SIZE
+
+    page = client.get("/api/questions?after=abc&limit=xyz").get_json()
+    assert page["limit"] == api.DEFAULT_PAGE_SIZE
+    assert len(page["questions"]) == api.DEFAULT_PAGE_SIZE
+
+
+def trace_statements(monkeypatch):
+    """Record every statement the API runs from now on"""
+    executed = []
+    connect = api.get_db_connection
+
+    def traced_connection():
+        conn = connect()
+        conn.set_trace_callback(executed.append)
+        return conn
+
+    monkeypatch.setattr(api, "get_db_connection", traced_connection)
+    return executed
+
+
+def selects(statements):
+    return [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+
+
+def test_index_runs_a_fixed_number_of_queries(client, monkeypatch):
+    """Test the page no longer runs a query per question"""
+    executed = trace_statements(monkeypatch)
+
+    response = client.get("/?limit=200")
+    assert response.status_code == 200
+    # The revision check, the page and the two totals
+    assert len(selects(executed)) == 4
+
+
+def test_index_links_to_the_next_page(db, client):
+    """Test the HTML page renders one page and links to the next"""
+    html = client.get("/", query_string={"limit": 10, "category": "Cat0"}).get_data(as_text=True)
+
+    assert html.count('class="question-card"') == 10
+    assert "Next page" in html
+    assert "category=Cat0" in html
+
+
+@pytest.mark.asyncio
+async def test_conditional_get(db, client):
+    """Test revalidating with the ETag or Last-Modified gets a 304 until the data changes"""
+    response = client.get("/api/questions")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    assert client.get("/api/questions", headers={"If-None-Match": etag}).status_code == 304
+    assert (
+        client.get("/api/questions", headers={"If-Modified-Since": response.headers["Last-Modified"]}).status_code
+        == 304
+    )
+
+    await db.cast_vote(1, db._question_ids[0], "a")
+
+    response = client.get("/api/questions", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json()["questions"][0]["a_votes"] == 1
+
+
+def test_cached_responses_skip_the_queries(client, monkeypatch):
+    """Test a repeat request only checks the revision"""
+    first = client.get("/?limit=20").get_data()
+    executed = trace_statements(monkeypatch)
+
+    assert client.get("/?limit=20").get_data() == first
+    assert len(selects(executed)) == 1
+
+    # A different page is a different entry
+    client.get("/?limit=21")
+    assert len(selects(executed)) > 2
+
+
+def test_responses_are_gzipped_for_clients_that_accept_it(client):
+    """Test the cached gzip body is sent as is, and decompressed for everyone else"""
+    plain = client.get("/api/questions")
+    compressed = client.get("/api/questions", headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert len(compressed.get_data()) < len(plain.get_data())
+
+
+def test_read_connections_are_pooled_per_thread(client):
+    """Test each thread reuses one read-only connection across requests"""
+    client.get("/api/questions?limit=1")
+    conn = api.get_db_connection()
+    client.get("/api/questions?limit=2")
+    assert api.get_db_connection() is conn
+
+    other = []
+
+    def worker():
+        other.append(api.get_db_connection())
+        api.close_db_connections()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_read_connections_cannot_write(client):
+    """Test the API's connections are read-only and memory-mapped"""
+    conn = api.get_db_connection()
+    assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+    assert conn.execute("PRAGMA mmap_size").fetchone()[0] > 0
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM questions")
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import pytest
+from src.cluster import owns_guild, parse_shard_ids, run_cluster, shard_for_guild, shard_ranges
+
+
+class FakeGateway:
+    """Routes guild events to shards the way Discord does"""
+
+    def __init__(self, shard_count, guild_ids):
+        self.shard_count = shard_count
+        self.guild_ids = guild_ids
+
+    def guilds_for(self, shard_ids):
+        """The guilds a process connected with these shards would receive"""
+        return {guild_id for guild_id in self.guild_ids if shard_for_guild(guild_id, self.shard_count) in shard_ids}
+
+
+def snowflake(timestamp_ms, worker):
+    """Build a snowflake, whose timestamp bits decide its shard"""
+    return (timestamp_ms << 22) | (worker << 17)
+
+
+def test_shard_for_guild():
+    """Test the documented shard formula"""
+    assert shard_for_guild(snowflake(5, 0), 4) == 1
+    assert shard_for_guild(snowflake(5, 31), 4) == 1
+    assert shard_for_guild(81384788765712384, 1) == 0
+
+
+def test_parse_shard_ids():
+    """Test lists, ranges and empty values"""
+    assert parse_shard_ids("0,1,2") == [0, 1, 2]
+    assert parse_shard_ids("4-7") == [4, 5, 6, 7]
+    assert parse_shard_ids("0-1, 5") == [0, 1, 5]
+    assert parse_shard_ids("") is None
+    assert parse_shard_ids(None) is None
+
+
+def test_shard_ranges_cover_every_shard_once():
+    """Test shards are split into contiguous ranges with no gaps or overlaps"""
+    assert shard_ranges(8, 3) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    assert shard_ranges(2, 4) == [[0], [1]]
+
+    for shard_count in range(1, 20):
+        for processes in range(1, 6):
+            shards = [shard for shard_ids in shard_ranges(shard_count, processes) for shard in shard_ids]
+            assert shards == list(range(shard_count))
+
+
+def test_each_guild_is_owned_by_exactly_the_process_that_receives_it():
+    """Test the daily scheduler's ownership check matches what the gateway delivers to each process"""
+    guild_ids = [snowflake(timestamp, worker) for timestamp in range(0, 5000, 37) for worker in (0, 3)]
+    gateway = FakeGateway(6, guild_ids)
+    ranges = shard_ranges(6, 4)
+
+    owners = {guild_id: [] for guild_id in guild_ids}
+    for process, shard_ids in enumerate(ranges):
+        owned = {guild_id for guild_id in guild_ids if owns_guild(guild_id, 6, shard_ids)}
+        assert owned == gateway.guilds_for(shard_ids)
+        for guild_id in owned:
+            owners[guild_id].append(process)
+
+    assert all(len(processes) == 1 for processes in owners.values())
+
+
+def test_unsharded_bot_owns_everything():
+    """Test a single-process bot keeps posting to every guild"""
+    assert owns_guild(snowflake(5, 0), None, None)
+    assert owns_guild(snowflake(5, 0), 4, None)
+
+
+@pytest.mark.asyncio
+async def test_run_cluster_starts_one_process_per_range(tmp_path, monkeypatch):
+    """Test every process is started with the shard count and its own shard ids"""
+    monkeypatch.setenv("CLUSTER_TEST_DIR", str(tmp_path))
+    command = [
+        sys.executable,
+        "-c",
+        "import os, pathlib; "
+        "pathlib.Path(os.environ['CLUSTER_TEST_DIR'], os.environ['SHARD_COUNT'] + '_' + os.environ['SHARD_IDS']).touch()",
+    ]
+
+    codes = await asyncio.wait_for(run_cluster(5, 2, command=command), 30)
+
+    assert codes == [0, 0]
+    assert sorted(os.listdir(tmp_path)) == ["5_0,1,2", "5_3,4"]
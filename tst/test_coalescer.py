@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+import discord
+from types import SimpleNamespace
+from src.coalescer import EditCoalescer
+
+
+class FakeMessage:
+    """Records the edits applied to it"""
+
+    def __init__(self, message_id, deleted=False):
+        self.id = message_id
+        self.deleted = deleted
+        self.edits = []
+
+    async def edit(self, **kwargs):
+        if self.deleted:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        self.edits.append(kwargs)
+
+
+def tally(state):
+    """A render callable that reads the state at the time the edit is applied"""
+
+    async def render():
+        return {"content": state["votes"]}
+
+    return render
+
+
+@pytest.mark.asyncio
+async def test_burst_coalesces_to_latest():
+    """Test a burst of edits sends the first immediately and only the latest after the interval"""
+    coalescer = EditCoalescer(interval=0.05)
+    message = FakeMessage(1)
+    state = {"votes": 0}
+
+    for votes in range(1, 101):
+        state["votes"] = votes
+        coalescer.submit(message, tally(state))
+        await asyncio.sleep(0)
+
+    await asyncio.sleep(0.15)
+
+    assert message.edits[0] == {"content": 1}
+    assert message.edits[-1] == {"content": 100}
+    assert len(message.edits) == 2
+
+    stats = coalescer.stats()
+    assert stats["submitted"] == 100
+    assert stats["applied"] == 2
+    assert stats["saved"] == 98
+    assert stats["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_messages_are_edited_independently():
+    """Test one busy message doesn't delay another"""
+    coalescer = EditCoalescer(interval=10)
+    first, second = FakeMessage(1), FakeMessage(2)
+    state = {"votes": 1}
+
+    coalescer.submit(first, tally(state))
+    coalescer.submit(second, tally(state))
+    await asyncio.sleep(0.01)
+
+    assert len(first.edits) == 1
+    assert len(second.edits) == 1
+    await coalescer.close()
+
+
+@pytest.mark.asyncio
+async def test_discard_drops_pending_edit():
+    """Test a deleted message's queued edit is never sent"""
+    coalescer = EditCoalescer(interval=0.05)
+    message = FakeMessage(1)
+    state = {"votes": 1}
+
+    coalescer.submit(message, tally(state))
+    await asyncio.sleep(0)
+    coalescer.submit(message, tally(state))
+    coalescer.discard(message.id)
+    await asyncio.sleep(0.1)
+
+    assert len(message.edits) == 1
+    assert coalescer.stats()["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_message_stops_editing():
+    """Test a NotFound from Discord drops the message's queued edits"""
+    coalescer = EditCoalescer(interval=0.01)
+    message = FakeMessage(1, deleted=True)
+
+    coalescer.submit(message, tally({"votes": 1}))
+    coalescer.submit(message, tally({"votes": 2}))
+    await asyncio.sleep(0.05)
+
+    stats = coalescer.stats()
+    assert stats["applied"] == 0
+    assert stats["saved"] == 2
+    assert stats["pending"] == 0
@@ -0,0 +1,102 @@
+import os
+import pytest
+from types import SimpleNamespace
+from src.commandsync import GLOBAL_SCOPE, command_tree_hash, sync_command_tree
+from src.database import Database
+
+TEST_DB = "test_commandsync.db"
+
+
+def remove_test_db():
+    for path in (TEST_DB, TEST_DB + "-wal", TEST_DB + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@pytest.fixture
+async def db():
+    remove_test_db()
+    test_db = Database(TEST_DB)
+    await test_db.initialize()
+    yield test_db
+    await test_db.close()
+    remove_test_db()
+
+
+class FakeCommand:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+
+    def to_dict(self, tree):
+        return {"name": self.name, "description": self.description}
+
+
+class FakeTree:
+    """Command tree that records which scopes were synced"""
+
+    def __init__(self, commands, failing=()):
+        self.commands = commands
+        self.failing = set(failing)
+        self.synced = []
+
+    def get_commands(self):
+        return self.commands
+
+    def copy_global_to(self, guild):
+        pass
+
+    async def sync(self, guild=None):
+        if guild is not None and guild.id in self.failing:
+            raise ValueError("Missing Access")
+        self.synced.append(guild.id if guild else GLOBAL_SCOPE)
+
+
+def guilds(*ids):
+    return [SimpleNamespace(id=guild_id, name=f"Guild {guild_id}") for guild_id in ids]
+
+
+def test_command_tree_hash_tracks_changes():
+    """Test the hash changes with the commands and nothing else"""
+    commands = [FakeCommand("wyr", "Get a question")]
+    assert command_tree_hash(FakeTree(commands)) == command_tree_hash(FakeTree(list(commands)))
+    assert command_tree_hash(FakeTree(commands)) != command_tree_hash(FakeTree([FakeCommand("wyr", "Get a WYR")]))
+
+
+@pytest.mark.asyncio
+async def test_unchanged_tree_is_not_resynced(db):
+    """Test a reconnect with the same command tree makes no sync calls"""
+    tree = FakeTree([FakeCommand("wyr", "Get a question")])
+
+    result = await sync_command_tree(tree, db, guilds(1, 2))
+    assert sorted(tree.synced) == [GLOBAL_SCOPE, 1, 2]
+    assert result["synced"] == 2
+    assert result["global"] is True
+
+    tree.synced.clear()
+    result = await sync_command_tree(tree, db, guilds(1, 2, 3))
+    assert tree.synced == [3]
+    assert result["skipped"] == 2
+    assert result["global"] is False
+
+
+@pytest.mark.asyncio
+async def test_changed_tree_resyncs_everywhere(db):
+    """Test changing a command resyncs every guild and the global list"""
+    await sync_command_tree(FakeTree([FakeCommand("wyr", "Get a question")]), db, guilds(1, 2))
+
+    tree = FakeTree([FakeCommand("wyr", "Get a question"), FakeCommand("rank", "See your rank")])
+    await sync_command_tree(tree, db, guilds(1, 2))
+    assert sorted(tree.synced) == [GLOBAL_SCOPE, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_failed_guild_is_retried(db):
+    """Test a guild whose sync failed is synced again next time"""
+    commands = [FakeCommand("wyr", "Get a question")]
+    result = await sync_command_tree(FakeTree(commands, failing={2}), db, guilds(1, 2))
+    assert [failure["target"].id for failure in result["failed"]] == [2]
+
+    tree = FakeTree(commands)
+    await sync_command_tree(tree, db, guilds(1, 2))
+    assert tree.synced == [2]
@@ -1,27 +1,59 @@
+import asyncio
+import io
+import json
+import random
 import pytest
 import aiosqlite
 import os
-from src.database import Database
-from datetime import datetime
+import sqlite3
+import time
+from src.database import SCHEMA_VERSION, Database, Leaderboard, LRUCache, SeenSet, ShuffleBag, question_file_format
+from datetime import datetime, timedelta
 
 # Test database path
 TEST_DB = "test_wyr_bot.db"
 
 
+def remove_test_db():
+    """Remove the test database along with its WAL side files"""
+    for path in (TEST_DB, TEST_DB + "-wal", TEST_DB + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
 @pytest.fixture
 async def db():
     """Create a test database instance"""
     # Remove test database if it exists
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
+    remove_test_db()
 
     test_db = Database(TEST_DB)
     await test_db.initialize()
     yield test_db
 
     # Cleanup
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
+    await test_db.close()
+    remove_test_db()
+
+
+@pytest.fixture
+async def buffered_db():
+    """Create a test database that buffers votes and only flushes when told to"""
+    remove_test_db()
+
+    test_db = Database(TEST_DB, buffered_votes=True, flush_interval=3600)
+    await test_db.initialize()
+    yield test_db
+
+    await test_db.close()
+    remove_test_db()
+
+
+async def count_votes():
+    """Count the votes that have reached the database file"""
+    async with aiosqlite.connect(TEST_DB) as conn:
+        cursor = await conn.execute("SELECT COUNT(*) FROM votes")
+        return (await cursor.fetchone())[0]
 
 
 @pytest.mark.asyncio
@@ -230,6 +262,27 @@ async def test_daily_channel_settings(db):
     assert config["enabled"] is False
 
 
+@pytest.mark.asyncio
+async def test_daily_schedule_survives_reconfiguring(db):
+    """Test the daily time, timezone and last posted date are stored per guild"""
+    await db.set_daily_channel(1, 10, "18:30", "Europe/Berlin")
+    await db.set_daily_channel(2, 20)
+    await db.mark_daily_posted({1: "2026-03-01"})
+
+    schedules = {row[0]: row[1:] for row in await db.get_daily_schedules()}
+    assert schedules == {1: (10, "18:30", "Europe/Berlin", "2026-03-01", None), 2: (20, "12:00", "UTC", None, None)}
+
+    # Moving the channel must not forget today's post, or the guild would get a second one
+    await db.set_daily_channel(1, 11, "09:00", "UTC")
+    config = await db.get_daily_channel(1)
+    assert config["channel_id"] == 11
+    assert config["time"] == "09:00"
+    assert config["last_posted_date"] == "2026-03-01"
+
+    await db.disable_daily_questions(2)
+    assert [row[0] for row in await db.get_daily_schedules()] == [1]
+
+
 @pytest.mark.asyncio
 async def test_get_user_submissions(db):
     """Test getting all submissions from a user"""
@@ -261,5 +314,816 @@ async def test_get_question_by_id(db):
     assert retrieved[0] == question_id
 
 
+@pytest.mark.asyncio
+async def test_cast_vote(db):
+    """Test casting a vote records it, pays out and returns fresh results"""
+    user_id = 123456789
+    question_id = 1
+
+    outcome = await db.cast_vote(user_id, question_id, "b")
+
+    assert outcome["results"] == {"a_votes": 0, "b_votes": 1}
+    assert outcome["question"][0] == question_id
+    assert outcome["coins"] == 10
+    assert outcome["streak"] == 1
+
+    user = await db.get_user(user_id)
+    assert user["coins"] == 10
+    assert user["streak"] == 1
+    assert user["total_votes"] == 1
+    assert await db.has_user_voted(user_id, question_id) is True
+
+
+@pytest.mark.asyncio
+async def test_cast_vote_rejects_duplicates(db):
+    """Test that a second vote on the same question is rejected and not paid"""
+    user_id = 123456789
+
+    assert await db.cast_vote(user_id, 1, "a") is not None
+    assert await db.cast_vote(user_id, 1, "b") is None
+
+    user = await db.get_user(user_id)
+    assert user["coins"] == 10
+    assert user["total_votes"] == 1
+
+    results = await db.get_question_results(1)
+    assert results == {"a_votes": 1, "b_votes": 0}
+
+
+@pytest.mark.asyncio
+async def test_cast_vote_concurrent_double_click(db):
+    """Test that concurrent clicks from one user only pay out once"""
+    user_id = 123456789
+
+    outcomes = await asyncio.gather(*(db.cast_vote(user_id, 1, "a") for _ in range(8)))
+
+    assert sum(outcome is not None for outcome in outcomes) == 1
+    user = await db.get_user(user_id)
+    assert user["coins"] == 10
+
+
+@pytest.mark.asyncio
+async def test_cast_vote_streak_bonus(db):
+    """Test that voting on consecutive days pays the streak bonus"""
+    user_id = 123456789
+    yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
+
+    await db.get_user(user_id)
+    async with aiosqlite.connect(TEST_DB) as conn:
+        await conn.execute("UPDATE users SET streak = 3, last_vote_date = ? WHERE user_id = ?", (yesterday, user_id))
+        await conn.commit()
+
+    outcome = await db.cast_vote(user_id, 1, "a")
+
+    assert outcome["streak"] == 4
+    assert outcome["coins"] == 10 + 8
+
+
+@pytest.mark.asyncio
+async def test_question_stats_follow_votes(db):
+    """Test that the denormalized tallies track cast and replaced votes"""
+    await db.cast_vote(111, 1, "a")
+    await db.cast_vote(222, 1, "b")
+    await db.record_vote(333, 1, "a")
+
+    # Changing a recorded vote moves it to the other option
+    await db.record_vote(333, 1, "b")
+
+    assert await db.get_question_results(1) == {"a_votes": 1, "b_votes": 2}
+    assert await db.check_question_stats() == []
+
+
+@pytest.mark.asyncio
+async def test_rebuild_question_stats(db):
+    """Test that the consistency checker spots drift and a rebuild fixes it"""
+    await db.cast_vote(111, 1, "a")
+    await db.cast_vote(222, 2, "b")
+
+    async with aiosqlite.connect(TEST_DB) as conn:
+        await conn.execute("UPDATE question_stats SET a_votes = 5 WHERE question_id = 1")
+        await conn.execute("INSERT INTO question_stats (question_id, a_votes, b_votes) VALUES (3, 0, 4)")
+        await conn.commit()
+
+    mismatches = await db.check_question_stats()
+    assert sorted(mismatch["question_id"] for mismatch in mismatches) == [1, 3]
+    assert mismatches[0]["actual"] == {"a_votes": 1, "b_votes": 0}
+
+    assert await db.rebuild_question_stats() == 2
+    assert await db.check_question_stats() == []
+    assert await db.get_question_results(1) == {"a_votes": 1, "b_votes": 0}
+    assert await db.get_question_results(3) == {"a_votes": 0, "b_votes": 0}
+
+
+@pytest.mark.asyncio
+async def test_buffered_votes_acknowledged_from_memory(buffered_db):
+    """Test that buffered votes are acknowledged, deduplicated and counted before they hit disk"""
+    first = await buffered_db.cast_vote(111, 1, "a")
+    second = await buffered_db.cast_vote(222, 1, "b")
+    duplicate = await buffered_db.cast_vote(111, 1, "b")
+
+    assert first["results"] == {"a_votes": 1, "b_votes": 0}
+    assert second["results"] == {"a_votes": 1, "b_votes": 1}
+    assert duplicate is None
+    assert await buffered_db.has_user_voted(111, 1) is True
+    assert await buffered_db.get_question_results(1) == {"a_votes": 1, "b_votes": 1}
+    assert await count_votes() == 0
+
+    assert await buffered_db.flush_votes() == 2
+    assert await count_votes() == 2
+    assert await buffered_db.get_question_results(1) == {"a_votes": 1, "b_votes": 1}
+    assert await buffered_db.cast_vote(111, 1, "a") is None
+
+    user = await buffered_db.get_user(111)
+    assert user["coins"] == 10
+    assert user["streak"] == 1
+    assert user["total_votes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_buffered_flush_is_bounded(buffered_db):
+    """Test that each flush writes at most one batch"""
+    for user_id in range(7):
+        await buffered_db.cast_vote(user_id, 1, "a")
+
+    buffered_db.flush_batch_size = 3
+    assert await buffered_db.flush_votes() == 3
+    assert await count_votes() == 3
+    assert await buffered_db.get_question_results(1) == {"a_votes": 7, "b_votes": 0}
+
+
+@pytest.mark.asyncio
+async def test_buffered_votes_flush_when_batch_fills(buffered_db):
+    """Test that a full batch wakes the background flusher without waiting for the interval"""
+    buffered_db.flush_batch_size = 2
+
+    await buffered_db.cast_vote(111, 1, "a")
+    await buffered_db.cast_vote(222, 1, "a")
+
+    for _ in range(100):
+        if await count_votes() == 2:
+            break
+        await asyncio.sleep(0.01)
+    assert await count_votes() == 2
+
+
+@pytest.mark.asyncio
+async def test_buffered_flush_applies_streak_bonus(buffered_db):
+    """Test that flushed votes follow the same streak rules as cast_vote"""
+    yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
+    await buffered_db.get_user(111)
+    async with aiosqlite.connect(TEST_DB) as conn:
+        await conn.execute("UPDATE users SET streak = 3, last_vote_date = ? WHERE user_id = 111", (yesterday,))
+        await conn.commit()
+
+    await buffered_db.cast_vote(111, 1, "a")
+    await buffered_db.cast_vote(111, 2, "b")
+    await buffered_db.flush_votes()
+
+    user = await buffered_db.get_user(111)
+    assert user["streak"] == 4
+    assert user["coins"] == 10 + 8 + 10
+    assert user["total_votes"] == 2
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_buffered_votes(buffered_db):
+    """Test that shutting down writes out every buffered vote"""
+    for user_id in range(8):
+        await buffered_db.cast_vote(user_id, 2, "b")
+
+    await buffered_db.close()
+
+    assert await count_votes() == 8
+    assert buffered_db._pending_tallies == {}
+
+
+@pytest.mark.asyncio
+async def test_buffered_flush_skips_votes_already_on_disk(buffered_db):
+    """Test a vote buffered by two processes sharing the file is only paid and tallied once"""
+    other = Database(TEST_DB, buffered_votes=True, flush_interval=3600)
+    await other.initialize()
+    try:
+        assert await buffered_db.cast_vote(7, 1, "a") is not None
+        assert await other.cast_vote(7, 1, "a") is not None
+        await buffered_db.cast_vote(8, 1, "b")
+
+        assert await buffered_db.flush_votes() == 2
+        assert await other.flush_votes() == 0
+        assert other._pending_tallies == {}
+
+        user = await other.get_user(7)
+        assert user["coins"] == 10
+        assert user["total_votes"] == 1
+        assert await other.get_question_results(1) == {"a_votes": 1, "b_votes": 1}
+        assert await other.check_question_stats() == []
+    finally:
+        await other.close()
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test that the LRU cache stays bounded and counts hits and misses"""
+    cache = LRUCache(2)
+    cache.put(1, "one")
+    cache.put(2, "two")
+    assert cache.get(1) == "one"
+
+    cache.put(3, "three")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "one"
+    assert cache.get(3) == "three"
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2, "hit_rate": 0.75}
+
+
+@pytest.mark.asyncio
+async def test_question_cache_reads_through(db):
+    """Test that question rows are served from the cache after the first read"""
+    first = await db.get_question_by_id(1)
+    second = await db.get_question_by_id(1)
+
+    assert first == second
+    stats = db.question_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+    # Unknown ids aren't cached
+    assert await db.get_question_by_id(999999) is None
+    assert db.question_cache_stats()["size"] == 1
+
+
+@pytest.mark.asyncio
+async def test_question_cache_populated_on_insert(db):
+    """Test that added and approved questions go straight into the cache"""
+    await db.add_question("Cached question?", "A", "B", "Test")
+    await db.submit_question(123456789, "Cached submission?", "A", "B", "Test")
+    pending = await db.get_pending_submissions(1)
+    await db.approve_submission(pending[0][0], 987654321)
+
+    added = await db.get_question_by_id(db._question_ids[-2])
+    approved = await db.get_question_by_id(db._question_ids[-1])
+
+    assert added[1] == "Cached question?"
+    assert approved[1] == "Cached submission?"
+    assert db.question_cache_stats()["misses"] == 0
+
+    # Casting a vote reads the question through the cache too
+    outcome = await db.cast_vote(111, added[0], "a")
+    assert outcome["question"] == added
+    assert db.question_cache_stats()["misses"] == 0
+
+
+def test_leaderboard_matches_sorted_order():
+    """Test the order-statistic leaderboard against a brute-force ranking"""
+    rng = random.Random(42)
+    rows = [(user_id, rng.randrange(100), 0) for user_id in range(50)]
+    leaderboard = Leaderboard(load=4)
+    leaderboard.load_users(rows)
+    balances = {user_id: coins for user_id, coins, _ in rows}
+
+    for _ in range(500):
+        user_id = rng.randrange(80)
+        coins = balances.get(user_id, 0) + rng.randrange(-20, 40)
+        balances[user_id] = coins
+        leaderboard.update(user_id, coins, 1)
+
+    expected = sorted(balances.items(), key=lambda item: (-item[1], item[0]))
+    assert [(user_id, coins) for user_id, coins, _ in leaderboard.top(10)] == expected[:10]
+    assert len(leaderboard) == len(balances)
+
+    for user_id, coins in balances.items():
+        assert leaderboard.rank(user_id) == 1 + sum(other > coins for other in balances.values())
+    assert leaderboard.rank(999) is None
+
+
+@pytest.mark.asyncio
+async def test_get_rank(db):
+    """Test that ranks follow balance changes from every write path"""
+    await db.award_coins(111, 100)
+    await db.award_coins(222, 200)
+    await db.award_coins(333, 100)
+    await db.cast_vote(333, 1, "a")
+
+    assert (await db.get_rank(222))["rank"] == 1
+    assert (await db.get_rank(333)) == {"rank": 2, "total": 3, "coins": 110, "streak": 1}
+    assert (await db.get_rank(111))["rank"] == 3
+    assert await db.get_rank(444) is None
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_seeded_at_startup(db):
+    """Test that the in-memory leaderboard is rebuilt from the users table"""
+    await db.award_coins(111, 100)
+    await db.award_coins(222, 200)
+    await db.close()
+
+    reopened = Database(TEST_DB)
+    await reopened.initialize()
+    try:
+        assert await reopened.get_leaderboard(2) == [(222, 200, 0), (111, 100, 0)]
+        assert (await reopened.get_rank(111))["rank"] == 2
+    finally:
+        await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_buffered_flush_updates_leaderboard(buffered_db):
+    """Test that flushed votes move users on the leaderboard"""
+    await buffered_db.cast_vote(111, 1, "a")
+    await buffered_db.flush_votes()
+
+    assert await buffered_db.get_leaderboard(1) == [(111, 10, 1)]
+
+
+@pytest.mark.asyncio
+async def test_username_cache(db):
+    """Test that cached usernames are returned until they expire"""
+    await db.store_usernames({111: "alice", 222: "bob"})
+
+    assert await db.get_cached_usernames([111, 222, 333], 60) == {111: "alice", 222: "bob"}
+    assert await db.get_cached_usernames([111], -1) == {}
+
+
+def test_shuffle_bag_draws_every_position_once():
+    """Test that a shuffle bag is a permutation per cycle and keeps storage sparse"""
+    bag = ShuffleBag(1000)
+
+    drawn = [bag.draw()[0] for _ in range(1000)]
+    assert sorted(drawn) == list(range(1000))
+    assert bag.remaining == 0
+
+    # The next draw starts a fresh cycle
+    position, _, reset = bag.draw()
+    assert reset is True
+    assert 0 <= position < 1000
+    assert len(bag.slots) <= 2
+
+
+def test_shuffle_bag_grow_mid_cycle():
+    """Test that positions added mid-cycle are drawn before the cycle ends"""
+    bag = ShuffleBag(5)
+    first = [bag.draw()[0] for _ in range(3)]
+
+    bag.grow(8)
+    rest = [bag.draw()[0] for _ in range(5)]
+
+    assert sorted(first + rest) == list(range(8))
+    assert bag.remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_guild_draws_do_not_repeat(db):
+    """Test that a guild sees every question once before any repeats"""
+    guild_id = 111222333
+    total = len(db._question_ids)
+
+    drawn = [(await db.get_random_question(guild_id))[0] for _ in range(total)]
+    assert sorted(drawn) == sorted(db._question_ids)
+
+    # Another guild has its own bag
+    other = await db.get_random_question(444555666)
+    assert other is not None
+
+
+@pytest.mark.asyncio
+async def test_batch_draw_for_guilds(db):
+    """Test that the daily batch draw gives each guild a question from its own bag"""
+    guild_ids = [111, 222, 333]
+    total = len(db._question_ids)
+
+    draws = [await db.get_random_questions(guild_ids) for _ in range(total)]
+
+    for guild_id in guild_ids:
+        drawn = [batch[guild_id][0] for batch in draws]
+        assert sorted(drawn) == sorted(db._question_ids)
+
+
+@pytest.mark.asyncio
+async def test_guild_bag_survives_restart(db):
+    """Test that a guild's shuffle bag is persisted across restarts"""
+    guild_id = 111222333
+    total = len(db._question_ids)
+
+    drawn = [(await db.get_random_question(guild_id))[0] for _ in range(4)]
+    await db.close()
+
+    reopened = Database(TEST_DB)
+    await reopened.initialize()
+    try:
+        drawn += [(await reopened.get_random_question(guild_id))[0] for _ in range(total - 4)]
+    finally:
+        await reopened.close()
+
+    assert sorted(drawn) == sorted(db._question_ids)
+
+
+@pytest.mark.asyncio
+async def test_new_questions_join_guild_bag(db):
+    """Test that added and approved questions are picked up by the index and bags"""
+    guild_id = 111222333
+    await db.get_random_question(guild_id)
+
+    await db.add_question("Added question?", "A", "B", "Test")
+    await db.submit_question(123456789, "Approved question?", "A", "B", "Test")
+    pending = await db.get_pending_submissions(1)
+    await db.approve_submission(pending[0][0], 987654321)
+
+    total = len(db._question_ids)
+    drawn = [(await db.get_random_question(guild_id))[1] for _ in range(total - 1)]
+    assert "Added question?" in drawn
+    assert "Approved question?" in drawn
+
+
+@pytest.mark.asyncio
+async def test_category_index(db):
+    """Test categories are listed with counts from memory and matched regardless of case"""
+    assert ("Life", 3) in db.categories()
+    assert db.resolve_category("LIFE") == "Life"
+    assert db.resolve_category("Sports") is None
+
+    await db.add_question("Would you rather retire early or never retire?", "Early", "Never", "life")
+    await db.add_question("Would you rather play or watch?", "Play", "Watch", "Sports")
+
+    categories = dict(db.categories())
+    assert categories["Life"] == 4
+    assert categories["Sports"] == 1
+    assert [name.casefold() for name in categories] == sorted(name.casefold() for name in categories)
+
+
+@pytest.mark.asyncio
+async def test_category_draws(db):
+    """Test a category gets its own shuffle bag and only serves its own questions"""
+    guild_id = 111222333
+    life_ids = list(db._category_ids["Life"])
+
+    drawn = [(await db.get_random_question(guild_id, category="life"))[0] for _ in range(len(life_ids))]
+    assert sorted(drawn) == life_ids
+
+    # The guild's bag for every question is untouched
+    total = len(db._question_ids)
+    drawn = [(await db.get_random_question(guild_id))[0] for _ in range(total)]
+    assert sorted(drawn) == sorted(db._question_ids)
+
+    assert await db.get_random_question(guild_id, category="Nope") is None
+
+
+@pytest.mark.asyncio
+async def test_category_prefers_unseen(db):
+    """Test a category filter still serves questions the user hasn't voted on first"""
+    user_id = 123456789
+    life_ids = list(db._category_ids["Life"])
+    for question_id in life_ids[:-1]:
+        await db.cast_vote(user_id, question_id, "a")
+
+    for _ in range(10):
+        assert (await db.get_random_question(user_id=user_id, category="Life"))[0] == life_ids[-1]
+
+
+@pytest.mark.asyncio
+async def test_daily_category(db):
+    """Test the daily category is stored and falls back to every question when it has none"""
+    await db.set_daily_channel(1, 10, category="Life")
+    assert (await db.get_daily_channel(1))["category"] == "Life"
+    assert (await db.get_daily_schedules())[0][5] == "Life"
+
+    questions = await db.get_random_questions([1, 2], {1: "Life", 2: "Nope"})
+    assert questions[1][4] == "Life"
+    assert questions[2] is not None
+
+
+@pytest.mark.asyncio
+async def test_add_question_skips_duplicates(db):
+    """Test a question differing only in case and spacing isn't added twice"""
+    total = len(db._question_ids)
+    assert not await db.add_question(
+        "Would you rather  live in the PAST or the future?", "live in the past", "Live in the future "
+    )
+    assert await db.add_question("Would you rather play or watch?", "Play", "Watch")
+    assert not await db.add_question("would you rather play or watch? ", "play", "watch")
+    assert len(db._question_ids) == total + 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_add_questions_csv(db):
+    """Test a CSV import skips duplicates and bad rows and indexes what it adds"""
+    lines = io.StringIO(
+        "question,option_a,option_b,category\n"
+        "Would you rather explore space or the deep ocean?,Explore space,Explore the ocean,Adventure\n"
+        "Would you rather swim or run?,Swim,Run,Sports\n"
+        "would you rather swim or run?,swim,run,Sports\n"
+        "Would you rather sing or dance?,Sing,Dance,\n"
+        "Missing options?,,,Sports\n"
+    )
+    total = len(db._question_ids)
+
+    result = await db.bulk_add_questions(lines, "csv", chunk_size=2, default_category="Imported")
+
+    assert {key: result[key] for key in ("read", "added", "duplicates", "invalid")} == {
+        "read": 5,
+        "added": 2,
+        "duplicates": 2,
+        "invalid": 1,
+    }
+    assert result["rows_per_second"] > 0
+    assert len(db._question_ids) == total + 2
+    assert dict(db.categories())["Sports"] == 1
+    assert (await db.get_random_question(category="Imported"))[1] == "Would you rather sing or dance?"
+
+
+@pytest.mark.asyncio
+async def test_bulk_add_questions_jsonl(db):
+    """Test a large JSONL import is inserted in chunks and can be re-run without adding anything"""
+    rows = [json.dumps({"question": f"Would you rather {i}?", "option_a": "A", "option_b": "B"}) for i in range(2500)]
+    lines = rows[:1000] + ["not json", ""] + rows[1000:]
+
+    result = await db.bulk_add_questions(lines, "jsonl", chunk_size=1000)
+    assert (result["read"], result["added"], result["invalid"]) == (2501, 2500, 1)
+    assert dict(db.categories())["General"] == 2500
+    assert db._question_ids == sorted(db._question_ids)
+
+    result = await db.bulk_add_questions(rows, "jsonl")
+    assert (result["added"], result["duplicates"]) == (0, 2500)
+
+
+def test_question_file_format():
+    """Test the import format is picked from the file extension"""
+    assert question_file_format("questions.CSV") == "csv"
+    assert question_file_format("dump.ndjson") == "jsonl"
+    with pytest.raises(ValueError):
+        question_file_format("questions.xlsx")
+
+
+@pytest.mark.asyncio
+async def test_schema_migrations(db):
+    """Test that migrations record the schema version and create the hot-query indexes"""
+    async with aiosqlite.connect(TEST_DB) as conn:
+        cursor = await conn.execute("PRAGMA user_version")
+        assert (await cursor.fetchone())[0] == SCHEMA_VERSION
+
+        cursor = await conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")
+        indexes = {row[0] for row in await cursor.fetchall()}
+
+    assert {
+        "idx_votes_question_choice",
+        "idx_users_coins",
+        "idx_submissions_status",
+        "idx_submissions_submitter",
+    } <= indexes
+
+
+@pytest.mark.asyncio
+async def test_warm_start_skips_migrations(db):
+    """Test that reopening an up-to-date database runs no DDL"""
+    await db.close()
+
+    statements = []
+    reopened = Database(TEST_DB)
+    await reopened._open_pool()
+    for conn in reopened._connections:
+        await conn.set_trace_callback(statements.append)
+
+    await reopened.initialize()
+    await reopened.close()
+
+    assert statements
+    assert not [statement for statement in statements if statement.lstrip().upper().startswith(("CREATE", "ALTER"))]
+
+
+@pytest.mark.asyncio
+async def test_migrate_unversioned_database():
+    """Test that a database from before versioning is migrated and its tallies backfilled"""
+    remove_test_db()
+    async with aiosqlite.connect(TEST_DB) as conn:
+        await conn.execute(
+            "CREATE TABLE questions (id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT NOT NULL, "
+            "option_a TEXT NOT NULL, option_b TEXT NOT NULL, category TEXT DEFAULT 'General')"
+        )
+        await conn.execute(
+            "CREATE TABLE votes (user_id INTEGER, question_id INTEGER, choice TEXT NOT NULL, "
+            "timestamp TEXT DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (user_id, question_id))"
+        )
+        await conn.execute("INSERT INTO questions (question, option_a, option_b) VALUES ('Old?', 'A', 'B')")
+        await conn.execute("INSERT INTO questions (question, option_a, option_b) VALUES ('old?  ', 'A', 'B')")
+        await conn.executemany(
+            "INSERT INTO votes (user_id, question_id, choice) VALUES (?, 1, ?)", [(1, "a"), (2, "b"), (3, "b")]
+        )
+        await conn.commit()
+
+    legacy = Database(TEST_DB)
+    try:
+        await legacy.initialize()
+        assert await legacy.get_question_results(1) == {"a_votes": 1, "b_votes": 2}
+        assert len(legacy._question_ids) == 2
+
+        # Existing duplicates are kept, only the first one is hashed so the unique index can be built
+        async with legacy._connection() as conn:
+            cursor = await conn.execute("SELECT id, text_hash IS NOT NULL FROM questions ORDER BY id")
+            assert await cursor.fetchall() == [(1, 1), (2, 0)]
+        assert await legacy.add_question("OLD?", "a", "b") is False
+    finally:
+        await legacy.close()
+        remove_test_db()
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_pragmas(db):
+    """Test that pooled connections are opened once with the tuned pragmas"""
+    assert len(db._connections) == db.pool_size
+
+    async with db._connection() as conn:
+        cursor = await conn.execute("PRAGMA journal_mode")
+        assert (await cursor.fetchone())[0] == "wal"
+        cursor = await conn.execute("PRAGMA busy_timeout")
+        assert (await cursor.fetchone())[0] == 5000
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_reuses_connections(db):
+    """Test that concurrent calls share the pool instead of opening new connections"""
+    connections = list(db._connections)
+
+    await asyncio.gather(*(db.award_coins(user_id, 10) for user_id in range(20)))
+
+    assert db._connections == connections
+    leaderboard = await db.get_leaderboard(20)
+    assert len(leaderboard) == 20
+
+
+@pytest.mark.asyncio
+async def test_close_releases_connections(db):
+    """Test that closing the database closes every pooled connection"""
+    await db.close()
+    assert db._connections == []
+
+    # The pool is reopened lazily if the database is used again
+    user = await db.get_user(123456789)
+    assert user["coins"] == 0
+
+
+@pytest.mark.asyncio
+async def test_processes_sharing_a_file():
+    """Test two Database instances on one file, as in cluster mode, start cleanly and see each other's writes"""
+    remove_test_db()
+    first, second = Database(TEST_DB), Database(TEST_DB)
+    try:
+        # Starting together must not add the starter questions twice
+        await asyncio.gather(first.initialize(), second.initialize())
+        assert len(first._question_ids) == len(second._question_ids) == 10
+
+        await first.add_question("Tea or coffee?", "Tea", "Coffee")
+        await first.award_coins(42, 500)
+        assert (await second.get_rank(42)) is None
+
+        assert await second.refresh() == 1
+        assert second._question_ids == first._question_ids
+        assert (await second.get_rank(42))["rank"] == 1
+        assert (await second.get_random_questions([1]))[1] is not None
+    finally:
+        await first.close()
+        await second.close()
+        remove_test_db()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writers_on_one_file():
+    """Stress test: many connections from several Database instances writing the same file at once"""
+    remove_test_db()
+    writers = [Database(TEST_DB, pool_size=4) for _ in range(6)]
+    try:
+        for writer in writers:
+            await writer.initialize()
+
+        async def write(writer, n):
+            user_id = n % 25
+            await writer.award_coins(user_id, 1)
+            await writer.submit_question(user_id, f"Question {n}?", "A", "B")
+
+        await asyncio.gather(*(write(writers[n % len(writers)], n) for n in range(300)))
+
+        async with aiosqlite.connect(TEST_DB) as conn:
+            cursor = await conn.execute("SELECT SUM(coins), COUNT(*) FROM users")
+            assert tuple(await cursor.fetchone()) == (300, 25)
+            cursor = await conn.execute("SELECT COUNT(*) FROM submitted_questions")
+            assert (await cursor.fetchone())[0] == 300
+
+        stats = [writer.lock_stats() for writer in writers]
+        assert sum(stat["count"] for stat in stats) >= 600
+        assert sum(stat["timeouts"] for stat in stats) == 0
+    finally:
+        for writer in writers:
+            await writer.close()
+        remove_test_db()
+
+
+@pytest.mark.asyncio
+async def test_write_lock_is_retried_with_backoff(db):
+    """Test a writer that finds the lock held retries instead of failing straight away"""
+    db.retry_backoff = 0.01
+    for conn in db._connections:
+        await conn.execute("PRAGMA busy_timeout=0")
+
+    async with aiosqlite.connect(TEST_DB) as holder:
+        await holder.execute("BEGIN IMMEDIATE")
+        writes = [asyncio.create_task(db.award_coins(user_id, 5)) for user_id in range(db.pool_size)]
+        await asyncio.sleep(0.1)
+        await holder.commit()
+        await asyncio.gather(*writes)
+
+    stats = db.lock_stats()
+    assert stats["retries"] > 0
+    assert stats["max"] >= 0.05
+    assert (await db.get_user(0))["coins"] == 5
+
+
+@pytest.mark.asyncio
+async def test_write_lock_gives_up_eventually(db):
+    """Test a writer gives up with the original error once its retries run out"""
+    db.retry_backoff = 0.001
+    db.write_retries = 2
+    for conn in db._connections:
+        await conn.execute("PRAGMA busy_timeout=0")
+
+    async with aiosqlite.connect(TEST_DB) as holder:
+        await holder.execute("BEGIN IMMEDIATE")
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            await db.award_coins(1, 5)
+        await holder.rollback()
+
+    assert db.lock_stats()["timeouts"] == 1
+
+
+def test_seen_set_finds_unseen_positions():
+    """Test the n-th unseen position matches a brute force scan"""
+    rng = random.Random(7)
+    for _ in range(50):
+        size = rng.randrange(1, 200)
+        seen = SeenSet(rng.sample(range(size), rng.randrange(size + 1)))
+        unseen = [position for position in range(size) if position not in seen]
+
+        assert [seen.nth_unseen(n) for n in range(len(unseen))] == unseen
+        picked = seen.pick_unseen(size, rng)
+        assert picked is None if not unseen else picked in unseen
+
+
+def test_seen_set_add_keeps_order():
+    """Test adding positions keeps the array sorted and free of duplicates"""
+    seen = SeenSet([5, 1])
+    for position in (3, 1, 9, 0):
+        seen.add(position)
+    assert list(seen.positions) == [0, 1, 3, 5, 9]
+    assert 3 in seen and 4 not in seen
+
+
+@pytest.mark.asyncio
+async def test_random_question_prefers_unseen(db):
+    """Test /wyr only serves questions the user hasn't voted on until they run out"""
+    user_id = 123456789
+    question_ids = list(db._question_ids)
+    for question_id in question_ids[:-1]:
+        await db.cast_vote(user_id, question_id, "a")
+
+    for _ in range(20):
+        question = await db.get_random_question(guild_id=1, user_id=user_id)
+        assert question[0] == question_ids[-1]
+
+    # Once everything has been answered it falls back to the guild's bag
+    await db.cast_vote(user_id, question_ids[-1], "b")
+    assert (await db.get_random_question(guild_id=1, user_id=user_id))[0] in question_ids
+
+
+@pytest.mark.asyncio
+async def test_seen_set_tracks_buffered_votes(buffered_db):
+    """Test votes still in the write-behind buffer count as seen"""
+    user_id = 123456789
+    question_ids = list(buffered_db._question_ids)
+    for question_id in question_ids[:-1]:
+        await buffered_db.cast_vote(user_id, question_id, "a")
+
+    # Drop the cached set so it is rebuilt from disk plus the buffer
+    buffered_db._seen_cache.discard(user_id)
+    assert (await buffered_db.get_random_question(user_id=user_id))[0] == question_ids[-1]
+
+
+@pytest.mark.asyncio
+async def test_unseen_selection_is_fast_for_heavy_voters(db):
+    """Test picking an unseen question stays well under a millisecond with thousands of votes"""
+    async with db._transaction() as conn:
+        await conn.executemany(
+            "INSERT INTO questions (question, option_a, option_b) VALUES (?, 'A', 'B')",
+            [(f"Question {i}?",) for i in range(6000)],
+        )
+        await conn.execute(
+            "INSERT INTO votes (user_id, question_id, choice) SELECT 1, id, 'a' FROM questions WHERE id <= 5000"
+        )
+    await db.refresh()
+
+    seen = await db._seen_questions(1)
+    assert len(seen) == 5000
+
+    size = len(db._question_ids)
+    started_at = time.perf_counter()
+    picks = [seen.pick_unseen(size) for _ in range(1000)]
+    assert (time.perf_counter() - started_at) / 1000 < 0.001
+    assert all(db._question_ids[position] > 5000 for position in picks)
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+import pytest
+from src import api
+from src.database import Database
+from src.export import (
+    QUESTION_COLUMNS,
+    VOTE_COLUMNS,
+    connect_readonly,
+    encode_rows,
+    parse_since,
+    question_chunks,
+    vote_chunks,
+)
+from src.manage import main as manage_main
+
+
+@pytest.fixture
+async def db(tmp_path):
+    """A database with 12 votes, several sharing a timestamp"""
+    test_db = Database(str(tmp_path / "test_export.db"))
+    await test_db.initialize()
+    async with test_db._transaction() as conn:
+        await conn.executemany(
+            "INSERT INTO votes (user_id, question_id, choice, timestamp) VALUES (?, ?, ?, ?)",
+            [
+                (user_id, question_id, "ab"[user_id % 2], f"2026-03-0{1 + user_id // 2} 12:00:00")
+                for user_id in range(6)
+                for question_id in (1, 2)
+            ],
+        )
+    yield test_db
+    await test_db.close()
+
+
+@pytest.fixture
+def conn(db):
+    conn = connect_readonly(db.db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setitem(api.app.config, "DATABASE", db.db_path)
+    yield api.app.test_client()
+    api.close_db_connections()
+
+
+def test_parse_since():
+    """Test since= accepts dates and ISO timestamps and matches the stored vote format"""
+    assert parse_since("2026-03-01") == "2026-03-01 00:00:00"
+    assert parse_since("2026-03-01T18:30:05") == "2026-03-01 18:30:05"
+    assert parse_since("") is None
+    with pytest.raises(ValueError):
+        parse_since("yesterday")
+
+
+def test_vote_chunks_cover_every_vote_once(conn):
+    """Test chunk boundaries inside a run of equal timestamps neither skip nor repeat votes"""
+    chunks = list(vote_chunks(conn, chunk_size=5))
+
+    assert [len(chunk) for chunk in chunks] == [5, 5, 2]
+    votes = [vote for chunk in chunks for vote in chunk]
+    assert sorted((user_id, question_id) for user_id, question_id, _, _ in votes) == [
+        (user_id, question_id) for user_id in range(6) for question_id in (1, 2)
+    ]
+    assert [vote[3] for vote in votes] == sorted(vote[3] for vote in votes)
+
+
+def test_vote_chunks_since_is_inclusive(conn):
+    """Test an incremental export starts at the given timestamp"""
+    votes = [vote for chunk in vote_chunks(conn, since="2026-03-02 12:00:00", chunk_size=3) for vote in chunk]
+    assert {vote[0] for vote in votes} == {2, 3, 4, 5}
+
+
+@pytest.mark.asyncio
+async def test_vote_chunks_pick_up_new_votes(db, conn):
+    """Test votes cast while an export runs are included when they sort after the cursor"""
+    chunks = vote_chunks(conn, chunk_size=10)
+    first = next(chunks)
+
+    await db.record_vote(99, 1, "a")
+    rest = [vote for chunk in chunks for vote in chunk]
+
+    assert len(first) + len(rest) == 13
+    assert rest[-1][0] == 99
+
+
+@pytest.mark.asyncio
+async def test_question_chunks_include_tallies(db, conn):
+    """Test questions are exported in id order with their tallies"""
+    await db.rebuild_question_stats()
+    questions = [question for chunk in question_chunks(conn, chunk_size=4) for question in chunk]
+
+    assert [question[0] for question in questions] == db._question_ids
+    assert questions[0][5:] == (3, 3)
+    assert questions[2][5:] == (0, 0)
+
+
+def test_encode_rows():
+    """Test CSV gets a header and NDJSON one object per line"""
+    chunks = [[(1, 2, "a", "2026-03-01 12:00:00")], [(3, 4, "b", "2026-03-02 12:00:00")]]
+
+    encoded = "".join(encode_rows(chunks, VOTE_COLUMNS, "csv"))
+    assert encoded == "user_id,question_id,choice,timestamp\n1,2,a,2026-03-01 12:00:00\n3,4,b,2026-03-02 12:00:00\n"
+
+    lines = "".join(encode_rows(chunks, VOTE_COLUMNS, "ndjson")).splitlines()
+    assert json.loads(lines[1]) == {"user_id": 3, "question_id": 4, "choice": "b", "timestamp": "2026-03-02 12:00:00"}
+
+
+def test_export_votes_endpoint(client):
+    """Test the votes export streams CSV and honours since"""
+    response = client.get("/api/export/votes?format=csv&since=2026-03-03")
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == "text/csv"
+    assert 'filename="votes.csv"' in response.headers["Content-Disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert {int(row["user_id"]) for row in rows} == {4, 5}
+
+
+@pytest.mark.asyncio
+async def test_export_questions_endpoint(db, client):
+    """Test the questions export streams NDJSON by default"""
+    response = client.get("/api/export/questions?after=5")
+    assert response.mimetype == "application/x-ndjson"
+
+    questions = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [question["id"] for question in questions] == [question_id for question_id in db._question_ids if question_id > 5]
+    assert set(questions[0]) == set(QUESTION_COLUMNS)
+
+
+def test_export_rejects_bad_parameters(client):
+    """Test an unknown format or unparseable since is a 400, not a broken stream"""
+    assert client.get("/api/export/votes?format=xml").status_code == 400
+    assert client.get("/api/export/votes?since=last-week").status_code == 400
+
+
+def test_export_command(db, tmp_path, capsys):
+    """Test manage.py export writes the file and reports the row count"""
+    output = tmp_path / "votes.ndjson"
+
+    assert manage_main(["--db", db.db_path, "export", "votes", "--since", "2026-03-02", "-o", str(output)]) == 0
+
+    assert len(output.read_text().splitlines()) == 8
+    assert "Exported 8 votes" in capsys.readouterr().err
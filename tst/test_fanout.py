@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+import discord
+from types import SimpleNamespace
+from src.fanout import fan_out, is_transient, summarize
+from src.metrics import percentile
+
+
+def http_error(status):
+    """Build a discord HTTP error with the given status code"""
+    return discord.HTTPException(SimpleNamespace(status=status, reason="Error"), "error")
+
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([], 50) == 0.0
+
+
+def test_is_transient():
+    """Test which send failures are retried"""
+    assert is_transient(http_error(503)) is True
+    assert is_transient(http_error(429)) is True
+    assert is_transient(http_error(403)) is False
+    assert is_transient(asyncio.TimeoutError()) is True
+    assert is_transient(ValueError()) is False
+
+
+@pytest.mark.asyncio
+async def test_fan_out_respects_concurrency():
+    """Test that sends run in parallel but never exceed the concurrency limit"""
+    in_flight = 0
+    max_in_flight = 0
+
+    async def send(target):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    results = await fan_out(range(20), send, concurrency=4)
+
+    assert all(result["ok"] for result in results)
+    assert max_in_flight == 4
+
+
+@pytest.mark.asyncio
+async def test_fan_out_retries_transient_failures():
+    """Test that transient failures are retried and permanent ones are not"""
+    attempts = {}
+
+    async def send(target):
+        attempts[target] = attempts.get(target, 0) + 1
+        if target == "flaky" and attempts[target] < 3:
+            raise http_error(502)
+        if target == "forbidden":
+            raise http_error(403)
+
+    results = await fan_out(["ok", "flaky", "forbidden"], send, retries=3, backoff=0.001)
+    by_target = {result["target"]: result for result in results}
+
+    assert by_target["ok"]["ok"] is True
+    assert by_target["flaky"]["ok"] is True
+    assert by_target["flaky"]["attempts"] == 3
+    assert by_target["forbidden"]["ok"] is False
+    assert attempts["forbidden"] == 1
+
+    summary = summarize(results)
+    assert summary["delivered"] == 2
+    assert summary["failed"] == 1
+    assert summary["retried"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fan_out_slow_target_does_not_block_others():
+    """Test that a guild stuck in backoff doesn't delay delivery to the rest"""
+
+    async def send(target):
+        if target == 0:
+            raise http_error(500)
+
+    results = await fan_out(range(5), send, concurrency=1, retries=1, backoff=0.2)
+
+    assert results[0]["ok"] is False
+    assert max(result["latency"] for result in results[1:]) < 0.1
+
+
+@pytest.mark.asyncio
+async def test_fan_out_rate_limit():
+    """Test that request starts are spaced out to the configured rate"""
+    starts = []
+
+    async def send(target):
+        starts.append(asyncio.get_running_loop().time())
+
+    await fan_out(range(5), send, concurrency=5, rate=100)
+
+    assert starts[-1] - starts[0] >= 0.035
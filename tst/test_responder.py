@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+from src.metrics import LatencyStats
+from src.responder import Responder
+
+
+class FakeInteraction:
+    """Records the order of responses, defers and followups"""
+
+    def __init__(self):
+        self.calls = []
+        self.response = self
+        self.followup = FakeFollowup(self.calls)
+
+    async def send_message(self, content=None, **kwargs):
+        self.calls.append(("send_message", content or kwargs))
+
+    async def defer(self, ephemeral=False, thinking=False):
+        self.calls.append(("defer", ephemeral))
+
+
+class FakeFollowup:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def send(self, content=None, **kwargs):
+        self.calls.append(("followup", content or kwargs))
+
+
+async def reply_after(delay, reply):
+    await asyncio.sleep(delay)
+    return reply
+
+
+def test_latency_stats_window():
+    """Test the window keeps only recent samples but counts all of them"""
+    stats = LatencyStats(window=10)
+    for sample in range(100):
+        stats.add(sample)
+
+    summary = stats.summary()
+    assert summary["count"] == 100
+    assert summary["p50"] == 94
+    assert summary["max"] == 99
+
+
+@pytest.mark.asyncio
+async def test_fast_work_replies_directly():
+    """Test work that finishes in time is sent as the interaction response"""
+    responder = Responder(ack_timeout=1)
+    interaction = FakeInteraction()
+
+    await responder.run("wyr", interaction, reply_after(0, {"content": "hi"}))
+
+    assert interaction.calls == [("send_message", "hi")]
+    stats = responder.stats()["wyr"]
+    assert stats["ack"]["count"] == 1
+    assert stats["deferred"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_work_is_deferred():
+    """Test work that overruns the ack timeout is deferred and sent as a followup"""
+    responder = Responder(ack_timeout=0.01)
+    interaction = FakeInteraction()
+
+    await responder.run("leaderboard", interaction, reply_after(0.05, {"content": "top"}), ephemeral=True)
+
+    assert interaction.calls == [("defer", True), ("followup", "top")]
+    assert responder.stats()["leaderboard"]["ack"]["max"] < 0.05
+
+
+@pytest.mark.asyncio
+async def test_known_slow_handler_defers_up_front():
+    """Test a handler whose recent runs exceeded the budget is deferred before the work starts"""
+    responder = Responder(budget=0.01, ack_timeout=1)
+    responder.work_time["pending"].add(0.5)
+    interaction = FakeInteraction()
+    started = []
+
+    async def work():
+        started.append(list(interaction.calls))
+        return [{"content": "one"}, {"content": "two"}]
+
+    await responder.run("pending", interaction, work())
+
+    assert started == [[("defer", False)]]
+    assert interaction.calls == [("defer", False), ("followup", "one"), ("followup", "two")]
+
+
+@pytest.mark.asyncio
+async def test_several_replies_without_deferring():
+    """Test the first reply is the response and the rest are followups"""
+    responder = Responder()
+    interaction = FakeInteraction()
+
+    await responder.run("pending", interaction, reply_after(0, [{"content": "one"}, {"content": "two"}]))
+
+    assert interaction.calls == [("send_message", "one"), ("followup", "two")]
+
+
+@pytest.mark.asyncio
+async def test_failure_after_defer_is_reported():
+    """Test a deferred interaction isn't left thinking forever when the work fails"""
+    responder = Responder(ack_timeout=0.01)
+    interaction = FakeInteraction()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("disk on fire")
+
+    with pytest.raises(RuntimeError):
+        await responder.run("wyr", interaction, work())
+
+    assert interaction.calls[0] == ("defer", False)
+    assert interaction.calls[1][0] == "followup"
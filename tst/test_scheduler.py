@@ -0,0 +1,100 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from src.scheduler import DailyScheduler, next_fire_time, parse_daily_time
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_parse_daily_time():
+    """Test HH:MM parsing and rejection of bad times"""
+    assert parse_daily_time("18:30").hour == 18
+    assert parse_daily_time("7:05").minute == 5
+    for bad in ("25:00", "noon", "12:61"):
+        with pytest.raises(ValueError):
+            parse_daily_time(bad)
+
+
+def test_next_fire_time_later_today():
+    """Test a time still ahead today fires today"""
+    fire_at, local_date = next_fire_time("12:00", "UTC", None, utc(2026, 3, 1, 9))
+    assert fire_at == utc(2026, 3, 1, 12)
+    assert local_date == "2026-03-01"
+
+
+def test_next_fire_time_uses_guild_timezone():
+    """Test the local time is converted to UTC, across the guild's date line"""
+    # At 23:00 UTC on the 1st it is already 08:00 on the 2nd in Tokyo
+    fire_at, local_date = next_fire_time("09:00", "Asia/Tokyo", None, utc(2026, 3, 1, 23))
+    assert fire_at == utc(2026, 3, 2, 0)
+    assert local_date == "2026-03-02"
+
+    # New York is on daylight saving time after March 8th 2026
+    fire_at, _ = next_fire_time("12:00", "America/New_York", None, utc(2026, 3, 10))
+    assert fire_at == utc(2026, 3, 10, 16)
+
+
+def test_next_fire_time_skips_posted_days():
+    """Test a date that was already posted isn't posted again"""
+    fire_at, local_date = next_fire_time("12:00", "UTC", "2026-03-01", utc(2026, 3, 1, 9))
+    assert fire_at == utc(2026, 3, 2, 12)
+    assert local_date == "2026-03-02"
+
+
+def test_next_fire_time_catches_up_after_restart():
+    """Test a post missed by a few minutes still goes out, but a long-missed one waits a day"""
+    fire_at, _ = next_fire_time("12:00", "UTC", None, utc(2026, 3, 1, 12, 10))
+    assert fire_at == utc(2026, 3, 1, 12)
+
+    fire_at, _ = next_fire_time("12:00", "UTC", None, utc(2026, 3, 1, 15))
+    assert fire_at == utc(2026, 3, 2, 12)
+
+
+def test_scheduler_orders_guilds_by_fire_time():
+    """Test the heap hands out guilds in fire time order"""
+    now = utc(2026, 3, 1, 0)
+    scheduler = DailyScheduler()
+    scheduler.schedule(1, 10, "18:00", "UTC", now=now)
+    scheduler.schedule(2, 20, "06:00", "UTC", now=now)
+    scheduler.schedule(3, 30, "12:00", "UTC", now=now)
+
+    assert scheduler.next_fire_at() == utc(2026, 3, 1, 6)
+    assert scheduler.pop_due(utc(2026, 3, 1, 5)) == []
+
+    due = scheduler.pop_due(utc(2026, 3, 1, 12))
+    assert [job["guild_id"] for job in due] == [2, 3]
+    assert due[0]["local_date"] == "2026-03-01"
+    assert scheduler.next_fire_at() == utc(2026, 3, 1, 18)
+
+
+def test_scheduler_reschedule_and_cancel():
+    """Test rescheduling replaces a guild's entry and cancelling removes it"""
+    now = utc(2026, 3, 1, 0)
+    scheduler = DailyScheduler()
+    scheduler.schedule(1, 10, "06:00", "UTC", now=now)
+    scheduler.schedule(2, 20, "08:00", "UTC", now=now)
+
+    scheduler.schedule(1, 11, "20:00", "UTC", now=now)
+    assert scheduler.next_fire_at() == utc(2026, 3, 1, 8)
+
+    scheduler.cancel(2)
+    assert scheduler.next_fire_at() == utc(2026, 3, 1, 20)
+    assert len(scheduler) == 1
+
+    due = scheduler.pop_due(utc(2026, 3, 1, 21))
+    assert [job["channel_id"] for job in due] == [11]
+
+    scheduler.cancel(1)
+    assert scheduler.next_fire_at() is None
+
+
+def test_scheduler_compacts_stale_entries():
+    """Test repeated rescheduling doesn't grow the heap without bound"""
+    now = utc(2026, 3, 1, 0)
+    scheduler = DailyScheduler()
+    for minute in range(1000):
+        scheduler.schedule(1, 10, f"{minute // 60:02d}:{minute % 60:02d}", "UTC", now=now)
+
+    assert len(scheduler._heap) < 100
+    assert scheduler.next_fire_at() == now + timedelta(hours=16, minutes=39)
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from src.database import Database
+from src.stream import ChangeFeed, create_stream_app
+
+
+@pytest.fixture
+async def db(tmp_path):
+    test_db = Database(str(tmp_path / "test_stream.db"))
+    await test_db.initialize()
+    yield test_db
+    await test_db.close()
+
+
+@pytest.fixture
+async def buffered_db(tmp_path):
+    test_db = Database(str(tmp_path / "test_stream_buffered.db"), buffered_votes=True)
+    await test_db.initialize()
+    yield test_db
+    await test_db.close()
+
+
+@pytest.fixture
+async def client(db):
+    """A test client for the stream server, fed by the test database"""
+    feed = ChangeFeed()
+    db.add_vote_listener(feed.publish)
+    test_client = TestClient(TestServer(create_stream_app(db, feed, heartbeat=0.2)))
+    await test_client.start_server()
+    yield test_client
+    await test_client.close()
+    db.remove_vote_listener(feed.publish)
+
+
+async def read_event(response):
+    """Read the next event off an SSE response, skipping comments"""
+    while True:
+        lines = []
+        while True:
+            line = (await asyncio.wait_for(response.content.readline(), 5)).decode().rstrip("\n")
+            if not line:
+                break
+            lines.append(line)
+        fields = dict(line.split(": ", 1) for line in lines if not line.startswith(":"))
+        if fields:
+            return fields["event"], json.loads(fields["data"])
+
+
+def tally(a_votes, b_votes):
+    return {"a_votes": a_votes, "b_votes": b_votes}
+
+
+def test_feed_routes_changes_to_subscribers():
+    """Test question subscriptions only get their question and the firehose gets everything"""
+    feed = ChangeFeed()
+    one = feed.subscribe(1)
+    everything = feed.subscribe()
+
+    feed.publish(1, 1, 0, tally(1, 0))
+    feed.publish(2, 0, 1, tally(0, 1))
+
+    assert list(one.pending) == [1]
+    assert sorted(everything.pending) == [1, 2]
+
+    feed.unsubscribe(one)
+    feed.unsubscribe(everything)
+    assert feed.stats() == {"questions": 0, "firehose": 0, "published": 2}
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_gets_coalesced_updates():
+    """Test changes queued while a client isn't reading are merged into one update per question"""
+    feed = ChangeFeed()
+    subscription = feed.subscribe(1)
+
+    feed.publish(1, 1, 0, tally(1, 0))
+    feed.publish(1, 0, 1, tally(1, 1))
+    feed.publish(1, 1, 0, tally(2, 1))
+
+    batch = await subscription.next_batch(1)
+    assert batch == [{"question_id": 1, "a_delta": 2, "b_delta": 1, "a_votes": 2, "b_votes": 1}]
+    assert subscription.coalesced == 2
+    assert await subscription.next_batch(0.01) == []
+
+
+@pytest.mark.asyncio
+async def test_idle_subscribers_are_not_touched():
+    """Test publishing to one question does no work for thousands of subscribers to others"""
+    feed = ChangeFeed()
+    idle = [feed.subscribe(2) for _ in range(5000)]
+    watcher = feed.subscribe(1)
+
+    feed.publish(1, 1, 0, tally(1, 0))
+
+    assert not any(subscription.pending for subscription in idle)
+    assert (await watcher.next_batch(1))[0]["a_votes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_votes_notify_listeners(db):
+    """Test every kind of vote reports its tally change"""
+    changes = []
+    db.add_vote_listener(lambda *change: changes.append(change))
+    question_id = db._question_ids[0]
+
+    await db.cast_vote(1, question_id, "a")
+    await db.record_vote(2, question_id, "a")
+    await db.record_vote(2, question_id, "b")
+
+    assert changes == [
+        (question_id, 1, 0, tally(1, 0)),
+        (question_id, 1, 0, tally(2, 0)),
+        (question_id, -1, 1, tally(1, 1)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_buffered_votes_notify_before_flushing(buffered_db):
+    """Test buffered votes are streamed when counted, not when written"""
+    changes = []
+    buffered_db.add_vote_listener(lambda *change: changes.append(change))
+    question_id = buffered_db._question_ids[0]
+
+    await buffered_db.cast_vote(1, question_id, "b")
+    assert changes == [(question_id, 0, 1, tally(0, 1))]
+
+    await buffered_db.flush_votes()
+    assert len(changes) == 1
+
+
+@pytest.mark.asyncio
+async def test_question_stream(db, client):
+    """Test a question stream starts with the tally and pushes each vote"""
+    question_id = db._question_ids[0]
+    await db.cast_vote(1, question_id, "a")
+
+    response = await client.get(f"/api/questions/{question_id}/stream")
+    assert response.headers["Content-Type"] == "text/event-stream"
+    assert await read_event(response) == (
+        "tally",
+        {"question_id": question_id, "a_delta": 0, "b_delta": 0, "a_votes": 1, "b_votes": 0},
+    )
+
+    await db.cast_vote(2, db._question_ids[1], "a")
+    await db.cast_vote(3, question_id, "b")
+    assert await read_event(response) == (
+        "tally",
+        {"question_id": question_id, "a_delta": 0, "b_delta": 1, "a_votes": 1, "b_votes": 1},
+    )
+    response.close()
+
+
+@pytest.mark.asyncio
+async def test_firehose_stream(db, client):
+    """Test the firehose pushes votes on any question and keeps idle connections alive"""
+    response = await client.get("/api/stream")
+    await asyncio.sleep(0.3)
+
+    await db.cast_vote(1, db._question_ids[2], "b")
+    event, data = await read_event(response)
+    assert (event, data["question_id"], data["b_votes"]) == ("tally", db._question_ids[2], 1)
+    response.close()
+
+
+@pytest.mark.asyncio
+async def test_unknown_question_stream(client):
+    """Test streaming a question that doesn't exist is a 404"""
+    response = await client.get("/api/questions/999999/stream")
+    assert response.status == 404
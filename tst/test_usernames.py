@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+import discord
+from types import SimpleNamespace
+from src.usernames import UsernameResolver
+
+
+class FakeNotFound(discord.HTTPException):
+    """Stand-in for discord.NotFound without needing an HTTP response"""
+
+    def __init__(self):
+        Exception.__init__(self, "Unknown User")
+
+
+class FakeBot:
+    """Gateway cache and REST fetches backed by dictionaries"""
+
+    def __init__(self, cached, remote):
+        self.cached = cached
+        self.remote = remote
+        self.fetched = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get_user(self, user_id):
+        name = self.cached.get(user_id)
+        return SimpleNamespace(name=name) if name else None
+
+    async def fetch_user(self, user_id):
+        self.fetched.append(user_id)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if user_id not in self.remote:
+                raise FakeNotFound()
+            return SimpleNamespace(name=self.remote[user_id])
+        finally:
+            self.in_flight -= 1
+
+
+class FakeDatabase:
+    """Username cache kept in a dictionary"""
+
+    def __init__(self, names=None):
+        self.names = dict(names or {})
+
+    async def get_cached_usernames(self, user_ids, max_age):
+        return {user_id: self.names[user_id] for user_id in user_ids if user_id in self.names}
+
+    async def store_usernames(self, names):
+        self.names.update(names)
+
+
+@pytest.mark.asyncio
+async def test_resolve_prefers_gateway_then_cache():
+    """Test that REST is only used for ids missing from the gateway and persisted caches"""
+    bot = FakeBot(cached={1: "alice"}, remote={3: "carol"})
+    db = FakeDatabase({2: "bob"})
+    resolver = UsernameResolver(bot, db)
+
+    names = await resolver.resolve([1, 2, 3, 4])
+
+    assert names == {1: "alice", 2: "bob", 3: "carol"}
+    assert sorted(bot.fetched) == [3, 4]
+    assert db.names[3] == "carol"
+
+
+@pytest.mark.asyncio
+async def test_resolve_fetches_concurrently_with_a_bound():
+    """Test that REST fetches overlap but never exceed the concurrency limit"""
+    bot = FakeBot(cached={}, remote={user_id: f"user{user_id}" for user_id in range(10)})
+    resolver = UsernameResolver(bot, FakeDatabase(), concurrency=3)
+
+    names = await resolver.resolve(list(range(10)))
+
+    assert len(names) == 10
+    assert bot.max_in_flight == 3
+
+    # Fetched names are served from the persisted cache next time
+    bot.fetched.clear()
+    await resolver.resolve(list(range(10)))
+    assert bot.fetched == []